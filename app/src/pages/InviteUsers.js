@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 // import axios from 'axios'; // Removed direct axios import
 import axiosClient from '../utils/axiosConfig'; // USE AXIOSCLIENT
+import { fetchAllPages } from '../utils/pagination';
 import { API_URL } from '../config/api'; // getAuthHeaders will not be needed with axiosClient
 import { toast } from 'react-hot-toast';
 import { 
@@ -69,11 +70,11 @@ const InviteUsers = () => {
     try {
       setIsLoading(true);
       // Try to fetch from real API first using axiosClient
-      const response = await axiosClient.get(`/invitations`); // API_URL is base for axiosClient, getAuthHeaders not needed
+      // The list is cursor-paginated: follow X-Next-Cursor until the last page
+      const serverInvitations = await fetchAllPages('/invitations');
       
-      // Assuming server returns the list directly in response.data
-      setInvitations(response.data);
-      LocalStorage.setInvitations(response.data); // Sync localStorage with server truth
+      setInvitations(serverInvitations);
+      LocalStorage.setInvitations(serverInvitations); // Sync localStorage with server truth
       setNotification({ type: 'info', message: 'Invitaciones cargadas desde el servidor.' });
       
       setStudents(allStudents); // Keep mock students for now
@@ -25,8 +25,15 @@ class SimpleWebSocketService {
   }
 
   attemptConnection(wsUrl) {
+    // The server authenticates the socket with the access token when it opens
+    const token = localStorage.getItem('lymbus_token');
+    if (!token) {
+      this.isConnecting = false;
+      return;
+    }
+    
     try {
-      this.ws = new WebSocket(wsUrl);
+      this.ws = new WebSocket(`${wsUrl}?token=${encodeURIComponent(token)}`);
       
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -75,14 +82,27 @@ class SimpleWebSocketService {
       case 'notification':
         handleRealtimeUpdate('notification', data.data);
         break;
+      case 'ping':
+        // Server heartbeat - answer or the server closes the connection
+        this.ws.send(JSON.stringify({ type: 'pong' }));
+        break;
       case 'pong':
         // Heartbeat response - connection is alive
         break;
+      case 'subscribed':
+      case 'unsubscribed':
+        break;
       default:
         console.log('Unhandled WebSocket message:', data);
     }
   }
 
+  subscribe(topics) {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ type: 'subscribe', topics }));
+    }
+  }
+
   sendHeartbeat() {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       this.ws.send(JSON.stringify({ type: 'ping' }));
@@ -1,6 +1,7 @@
 import { create } from 'zustand';
 import { subscribeWithSelector } from 'zustand/middleware';
 import axiosClient from '../utils/axiosConfig';
+import { fetchAllPages } from '../utils/pagination';
 
 // Centralized store to replace scattered useState declarations
 const useAppStore = create(
@@ -36,16 +37,14 @@ const useAppStore = create(
     fetchStudents: async () => {
       set({ isLoading: true, error: null });
       try {
-        const [studentsResponse, attendanceResponse] = await Promise.all([
+        const [studentsResponse, attendance] = await Promise.all([
           axiosClient.get('/students/search', {
             params: { query: '', include_grade: true }
           }),
-          axiosClient.get('/attendance/present-students', {
-            params: { date: get().selectedDate }
-          })
+          fetchAllPages('/attendance/present-students', { date: get().selectedDate })
         ]);
         
-        const presentStudentIds = attendanceResponse.data?.map(entry => entry.student_id) || [];
+        const presentStudentIds = attendance.map(entry => entry.student_id);
         
         const studentsWithStatus = studentsResponse.data.map(student => ({
           ...student,
@@ -56,7 +55,7 @@ const useAppStore = create(
         
         set({ 
           students: studentsWithStatus,
-          attendance: attendanceResponse.data,
+          attendance,
           isLoading: false 
         });
         
@@ -83,9 +82,9 @@ const useAppStore = create(
     // Staff operations
     fetchStaff: async () => {
       try {
-        const response = await axiosClient.get('/access/users');
-        set({ staff: response.data });
-        return response.data;
+        const staff = await fetchAllPages('/access/users');
+        set({ staff });
+        return staff;
       } catch (error) {
         set({ error });
         throw error;
@@ -95,9 +94,9 @@ const useAppStore = create(
     // Invitations
     fetchInvitations: async () => {
       try {
-        const response = await axiosClient.get('/invitations');
-        set({ invitations: response.data });
-        return response.data;
+        const invitations = await fetchAllPages('/invitations');
+        set({ invitations });
+        return invitations;
       } catch (error) {
         set({ error });
         throw error;
@@ -0,0 +1,19 @@
+import axiosClient from './axiosConfig';
+
+/**
+ * Fetches every page of a cursor-paginated list by following the X-Next-Cursor header.
+ *
+ * @param {string} url - List endpoint, relative to the API base URL
+ * @param {Object} params - Query parameters sent with every page
+ * @returns {Promise<Array>} - Items of all pages, in order
+ */
+export const fetchAllPages = async (url, params = {}) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const response = await axiosClient.get(url, { params: cursor ? { ...params, cursor } : params });
+    items.push(...(response.data || []));
+    cursor = response.headers?.['x-next-cursor'];
+  } while (cursor);
+  return items;
+};
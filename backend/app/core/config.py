@@ -12,9 +12,72 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480"))  # 8 hours default
+    # Caché de usuarios autenticados por proceso
+    AUTH_PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+    AUTH_PRINCIPAL_CACHE_SIZE: int = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "1024"))
+    # Pool de hash de contraseñas (bcrypt): hilos y operaciones pendientes admitidas
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./lymbus.db")
+    # Driver de las rutas asíncronas (por defecto aiosqlite o aiomysql según DATABASE_URL)
+    ASYNC_DATABASE_DRIVER: str = os.getenv("ASYNC_DATABASE_DRIVER", "")
+    
+    # Notificaciones de acceso (outbox)
+    ACCESS_OUTBOX_POLL_SECONDS: float = float(os.getenv("ACCESS_OUTBOX_POLL_SECONDS", "2"))
+    ACCESS_OUTBOX_BATCH_SIZE: int = int(os.getenv("ACCESS_OUTBOX_BATCH_SIZE", "200"))
+    ACCESS_OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("ACCESS_OUTBOX_MAX_ATTEMPTS", "5"))
+    ACCESS_OUTBOX_RETENTION_DAYS: int = int(os.getenv("ACCESS_OUTBOX_RETENTION_DAYS", "7"))
+    
+    # Mensajes pendientes de envío por WebSocket como máximo en cada conexión
+    WEBSOCKET_SEND_QUEUE_SIZE: int = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", "100"))
+    # Con la cola llena: "disconnect" (el cliente se reconecta y recarga) o "drop_oldest"
+    WEBSOCKET_SLOW_CLIENT_POLICY: str = os.getenv("WEBSOCKET_SLOW_CLIENT_POLICY", "disconnect")
+    # Ping del servidor a las conexiones WebSocket en silencio y plazo para responder
+    # antes de cerrarlas (0: sin heartbeat)
+    WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS: float = float(os.getenv("WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS", "25"))
+    WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS: float = float(os.getenv("WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS", "10"))
+    # Pub/sub entre workers para los eventos WebSocket (redis://...; vacío: solo este proceso)
+    WEBSOCKET_BACKPLANE_URL: str = os.getenv("WEBSOCKET_BACKPLANE_URL", os.getenv("REDIS_URL", ""))
+    
+    # Búsqueda de alumnos
+    SEARCH_MIN_SIMILARITY: float = float(os.getenv("SEARCH_MIN_SIMILARITY", "0.7"))
+    SEARCH_MAX_RESULTS: int = int(os.getenv("SEARCH_MAX_RESULTS", "50"))
+    TYPEAHEAD_MAX_RESULTS: int = int(os.getenv("TYPEAHEAD_MAX_RESULTS", "10"))
+    # Horas que se conservan los cambios de alumnos que sincronizan el autocompletado entre workers
+    TYPEAHEAD_CHANGE_RETENTION_HOURS: int = int(os.getenv("TYPEAHEAD_CHANGE_RETENTION_HOURS", "24"))
+    
+    # Paginación por cursor de los listados
+    PAGINATION_DEFAULT_LIMIT: int = int(os.getenv("PAGINATION_DEFAULT_LIMIT", "100"))
+    PAGINATION_MAX_LIMIT: int = int(os.getenv("PAGINATION_MAX_LIMIT", "500"))
+    
+    # Caché de imágenes QR renderizadas
+    QR_IMAGE_CACHE_BYTES: int = int(os.getenv("QR_IMAGE_CACHE_BYTES", str(8 * 1024 * 1024)))
+    
+    # Emisión masiva de códigos QR (0 = un proceso por CPU)
+    QR_BULK_RENDER_WORKERS: int = int(os.getenv("QR_BULK_RENDER_WORKERS", "0"))
+    QR_BULK_JOB_TTL_SECONDS: float = float(os.getenv("QR_BULK_JOB_TTL_SECONDS", "3600"))
+    
+    # Revocaciones de códigos QR firmados, releídas por cada proceso
+    QR_REVOCATION_REFRESH_SECONDS: float = float(os.getenv("QR_REVOCATION_REFRESH_SECONDS", "5"))
+    
+    # Archivo de registros de acceso de cursos cerrados
+    SCHOOL_YEAR_START_MONTH: int = int(os.getenv("SCHOOL_YEAR_START_MONTH", "8"))
+    ACCESS_ARCHIVE_BATCH_SIZE: int = int(os.getenv("ACCESS_ARCHIVE_BATCH_SIZE", "5000"))
+    
+    # Caché de los contadores del dashboard
+    DASHBOARD_STATS_TTL_SECONDS: float = float(os.getenv("DASHBOARD_STATS_TTL_SECONDS", "5"))
+    
+    # Redis compartido para el rate limiting (vacío: límites en memoria por proceso)
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    # Claves de rate limiting en memoria como máximo (las inactivas se descartan antes)
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+    # Sin Redis, fichero mapeado en memoria con los contadores de todos los workers del
+    # servidor (p. ej. /dev/shm/lymbus-ratelimit; vacío: contadores por proceso)
+    RATE_LIMIT_SHARED_PATH: str = os.getenv("RATE_LIMIT_SHARED_PATH", "")
+    # Huecos de la tabla compartida: claves activas a la vez antes de reutilizar las más antiguas
+    RATE_LIMIT_SHARED_SLOTS: int = int(os.getenv("RATE_LIMIT_SHARED_SLOTS", "65536"))
     
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = os.getenv(
@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.core.config import settings
 from app.models.base import Base
 
@@ -8,10 +10,41 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Driver asíncrono equivalente a cada driver síncrono
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql"
+}
+
+def async_database_url(url: str) -> str:
+    """URL de ``url`` con el driver asíncrono de su base de datos (aiosqlite, aiomysql)."""
+    parsed = make_url(url)
+    driver = settings.ASYNC_DATABASE_DRIVER or ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No hay driver asíncrono configurado para {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=not settings.DATABASE_URL.startswith("sqlite")
+)
+# Sin expirar al confirmar: fuera de la sesión no se puede recargar un atributo sin await
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Dependency
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    Sesión asíncrona para las rutas que no deben bloquear el event loop.
+
+    Los servicios síncronos se ejecutan sobre ella con ``await db.run_sync(...)``;
+    sus consultas esperan la E/S sin bloquear, y los hooks de sesión siguen activos.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
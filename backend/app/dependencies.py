@@ -8,6 +8,7 @@ from app.database import get_db
 from app.models.user import User
 from app.schemas.user import TokenData
 from app.core.config import settings
+from app.services.principal_cache import principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
@@ -33,7 +34,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == token_data.email).first()
+    user = principal_cache.get(db, token_data.email)
     if user is None:
         raise credentials_exception
     return user
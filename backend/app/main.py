@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import traceback
@@ -7,8 +8,18 @@ import logging
 from typing import List, Dict, Set
 from datetime import datetime
 
-from app.models import create_tables
-from app.database import engine
+from app.core.config import settings
+from app.models import create_tables, DailyPresence
+from app.database import engine, SessionLocal, async_engine
+from app.services.presence_service import ensure_presence_schema, get_presence_date, rebuild_daily_presence
+from app.services.search_index import ensure_search_index
+from app.services.access_archive import reserve_archived_ids
+from app.services.student_typeahead import student_typeahead, prune_student_changes
+from app.services.qr_service import qr_revocations
+from app.services.qr_bulk import shutdown_render_pool
+from app.services.password_hasher import password_hasher, PasswordHasherBusy
+from app.services.access_outbox import access_outbox_worker
+from app.services.connection_manager import manager, authenticate_websocket, authorize_subscription
 from app.routes import auth, access, invitations, notifications, teacher, pickup, attendance
 from app.middleware.rate_limiting import RateLimitMiddleware
 from app.routes import students
@@ -42,68 +53,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["*"],
+    expose_headers=["*", "X-Next-Cursor"],
 )
 
 # Rate limiting middleware
-rate_limiter = RateLimitMiddleware()
+rate_limiter = RateLimitMiddleware(settings.REDIS_URL or None)
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     """Apply rate limiting to all requests"""
     return await rate_limiter(request, call_next)
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.user_connections: Dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, client_id: str = None):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        if client_id:
-            self.user_connections[client_id] = websocket
-        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket, client_id: str = None):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        if client_id and client_id in self.user_connections:
-            del self.user_connections[client_id]
-        logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
-
-    async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting message: {e}")
-                disconnected.append(connection)
-        
-        # Remove disconnected connections
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
-
-    async def send_to_user(self, user_id: str, message: str):
-        if user_id in self.user_connections:
-            try:
-                await self.user_connections[user_id].send_text(message)
-            except Exception as e:
-                logger.error(f"Error sending message to user {user_id}: {e}")
-                # Remove disconnected user
-                del self.user_connections[user_id]
-
-manager = ConnectionManager()
-
 # Global exception handler to provide more details on errors
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -114,6 +74,15 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": str(exc)},
     )
 
+# Pool de hash de contraseñas saturado: el cliente puede reintentar enseguida
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
 @app.get("/test-cors")
 def test_cors():
     return {"message": "CORS test endpoint", "origins": [
@@ -135,12 +104,19 @@ def read_root():
 
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = None):
+    # Browsers cannot send headers on a WebSocket: the access token comes in the query string
+    principal = await run_in_threadpool(with_session, authenticate_websocket, token)
+    if principal is None:
+        await websocket.close(code=1008)  # Policy violation
+        return
+    await manager.connect(websocket, principal.user_id, principal.expires_at)
+    manager.subscribe(websocket, principal.topics)
     try:
         while True:
-            # Wait for messages from client
+            # Wait for messages from client; any message shows the connection is alive
             data = await websocket.receive_text()
+            manager.touch(websocket)
             try:
                 # Parse JSON message
                 message = json.loads(data)
@@ -148,34 +124,58 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # Handle ping/heartbeat
                 if message_type == "ping":
-                    await websocket.send_text(json.dumps({
+                    manager.send_personal_message(json.dumps({
                         "type": "pong",
                         "timestamp": datetime.now().isoformat()
-                    }))
+                    }), websocket)
+                
+                # Answer to the server's heartbeat ping
+                elif message_type == "pong":
+                    pass
                     
-                # Handle other message types as needed
+                # Subscribe to school or classroom topics the user may follow
+                # (without topics, to the defaults: the school of staff members)
                 elif message_type == "subscribe":
-                    # Client wants to subscribe to specific events
-                    await websocket.send_text(json.dumps({
+                    topics = message.get("topics")
+                    if topics is not None and not isinstance(topics, list):
+                        topics = []
+                    granted, denied = await run_in_threadpool(with_session, authorize_subscription, principal.email, topics)
+                    subscribed = manager.subscribe(websocket, granted)
+                    manager.send_personal_message(json.dumps({
                         "type": "subscribed",
+                        "topics": sorted(subscribed),
+                        "denied": denied,
+                        "timestamp": datetime.now().isoformat()
+                    }), websocket)
+                
+                elif message_type == "unsubscribe":
+                    topics = message.get("topics")
+                    if isinstance(topics, list):
+                        topics = [topic for topic in topics if isinstance(topic, str)]
+                    else:
+                        topics = None
+                    subscribed = manager.unsubscribe(websocket, topics)
+                    manager.send_personal_message(json.dumps({
+                        "type": "unsubscribed",
+                        "topics": sorted(subscribed),
                         "timestamp": datetime.now().isoformat()
-                    }))
+                    }), websocket)
                     
                 else:
                     # Echo unknown messages for debugging
-                    await websocket.send_text(json.dumps({
+                    manager.send_personal_message(json.dumps({
                         "type": "echo",
                         "original": message,
                         "timestamp": datetime.now().isoformat()
-                    }))
+                    }), websocket)
                     
             except json.JSONDecodeError:
                 # Handle non-JSON messages
-                await websocket.send_text(json.dumps({
+                manager.send_personal_message(json.dumps({
                     "type": "error",
                     "message": "Invalid JSON format",
                     "timestamp": datetime.now().isoformat()
-                }))
+                }), websocket)
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -184,15 +184,23 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"WebSocket error: {e}")
         manager.disconnect(websocket)
 
-# Function to broadcast real-time updates (can be called from other routes)
-async def broadcast_update(event_type: str, data: dict):
-    """Broadcast real-time updates to all connected clients"""
+def with_session(fn, *args):
+    """Run ``fn(*args, db)`` with its own session (WebSocket handlers hold no session)"""
+    db = SessionLocal()
+    try:
+        return fn(*args, db)
+    finally:
+        db.close()
+
+# Function to publish real-time updates (can be called from other routes)
+def broadcast_update(topic: str, event_type: str, data: dict):
+    """Publish a real-time update to the clients subscribed to a topic"""
     message = json.dumps({
         "type": event_type,
         "data": data,
         "timestamp": datetime.now().isoformat()
     })
-    await manager.broadcast(message)
+    manager.publish(topic, message)
 
 # Registrar rutas
 app.include_router(auth.router, prefix="/api/auth", tags=["autenticación"])
@@ -209,6 +217,63 @@ app.include_router(pickup.router, prefix="/api/pickup", tags=["recogidas"])
 @app.on_event("startup")
 def startup_db_client():
     create_tables(engine)
+    ensure_presence_schema(engine)
+    
+    # Rellenar el estado de presencia de hoy si aún no existe (p. ej. tras un despliegue)
+    db = SessionLocal()
+    try:
+        today = get_presence_date()
+        if not db.query(DailyPresence.id).filter(DailyPresence.date == today).first():
+            rebuild_daily_presence(today, db)
+
+        # MySQL < 8.0 recalcula el contador de IDs al reiniciar: no reutilizar los archivados
+        reserve_archived_ids(db)
+
+        # Construir el índice de búsqueda de alumnos si está vacío
+        indexed = ensure_search_index(db)
+        if indexed:
+            logger.info(f"Student search index built for {indexed} students")
+
+        # Cargar en memoria el índice de autocompletado de alumnos
+        prune_student_changes(db)
+        loaded = student_typeahead.warm(db)
+        logger.info(f"Student typeahead warmed with {loaded} students")
+
+        # Revocaciones de códigos QR firmados, para validarlos sin consultar qr_codes
+        revoked = qr_revocations.load(db)
+        logger.info(f"Loaded {revoked} QR code revocations")
+    finally:
+        db.close()
+
+# Unirse al backplane de WebSocket para recibir los eventos publicados en otros workers
+@app.on_event("startup")
+async def start_connection_manager():
+    await manager.start()
+
+@app.on_event("shutdown")
+async def stop_connection_manager():
+    await manager.stop()
+
+# Worker que convierte los eventos de acceso en notificaciones para los tutores
+@app.on_event("startup")
+async def start_access_outbox_worker():
+    access_outbox_worker.start(SessionLocal, manager.publish)
+
+@app.on_event("shutdown")
+async def stop_access_outbox_worker():
+    await access_outbox_worker.stop()
+
+@app.on_event("shutdown")
+def stop_qr_render_pool():
+    shutdown_render_pool()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
 
 # Health check endpoint with WebSocket info
 @app.get("/health")
@@ -216,6 +281,9 @@ def health_check():
     return {
         "status": "healthy",
         "websocket_connections": len(manager.active_connections),
+        "websockets": manager.stats(),
+        "password_hashing": password_hasher.stats(),
+        "access_outbox": access_outbox_worker.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -1,83 +1,379 @@
+import math
+import mmap
+import os
+import struct
+import threading
 import time
 import redis
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
 from fastapi import HTTPException, Request, status
 from fastapi.responses import JSONResponse
 import json
 import hashlib
 from datetime import datetime, timedelta
 
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared counters between workers
+    fcntl = None
+
+# Seconds a key is blocked for after exceeding twice its limit
+BLOCK_SECONDS = 900
+
+class _WindowState:
+    """Fixed per-key state: counters of the current and previous window"""
+    __slots__ = ("window_start", "previous", "current", "denied")
+
+    def __init__(self, window_start: float, previous: int = 0, current: int = 0, denied: int = 0):
+        self.window_start = window_start
+        self.previous = previous
+        self.current = current
+        self.denied = denied
+
+def _count_request(state: _WindowState, now: float, limit: int, window: int) -> Tuple[bool, int, float, bool]:
+    """
+    Apply one request to a key's sliding window counter.
+
+    The previous fixed window is weighted by how much of it still overlaps the
+    sliding window. Returns (allowed, remaining, reset time, block the key).
+    """
+    # Roll the fixed windows forward
+    elapsed_windows = int((now - state.window_start) // window)
+    if elapsed_windows:
+        state.previous = state.current if elapsed_windows == 1 else 0
+        state.current = 0
+        state.denied = 0
+        state.window_start += elapsed_windows * window
+    
+    overlap = 1 - (now - state.window_start) / window
+    estimate = state.previous * overlap + state.current
+    
+    # Check if limit exceeded
+    if estimate >= limit:
+        state.denied += 1
+        # Block IP if limit exceeded multiple times
+        return False, 0, _reset_time(state, limit, window), state.current + state.denied >= limit * 2
+    
+    # Allow request
+    state.current += 1
+    return True, max(0, int(limit - estimate - 1)), state.window_start + window, False
+
+def _reset_time(state: _WindowState, limit: int, window: int) -> float:
+    """Moment at which the estimate drops below the limit if no more requests arrive"""
+    if state.current <= 0:
+        return state.window_start + window
+    if state.current < limit:
+        # The weight of the previous window has to decay
+        return state.window_start + window * (1 - (limit - state.current) / state.previous)
+    # Once the current window becomes the previous one, its weight has to decay too
+    return state.window_start + window * (2 - limit / state.current)
+
+def _limit_info(allowed: bool, limit: int, remaining: int, reset_time: float, now: float, blocked: bool = False) -> dict:
+    """Status info returned by every limiter"""
+    if allowed:
+        return {
+            "allowed": True,
+            "limit": limit,
+            "remaining": remaining,
+            "reset_time": int(reset_time),
+            "retry_after": 0,
+            "blocked": False
+        }
+    return {
+        "allowed": False,
+        "limit": limit,
+        "remaining": 0,
+        "reset_time": int(math.ceil(reset_time)),
+        "retry_after": max(1, int(math.ceil(reset_time - now))),
+        "blocked": blocked
+    }
+
 class InMemoryRateLimiter:
-    """In-memory rate limiter for development/testing"""
+    """
+    In-memory sliding-window-counter rate limiter for development/testing.
+
+    Each key keeps two counters (current and previous fixed window) instead of one
+    timestamp per request. Keys are grouped by window length in least-recently used
+    order, which within a group is also the order in which they go idle, so idle
+    keys are evicted from the front without scanning. Blocks are kept apart with their
+    expiry. Memory stays proportional to the active clients, capped at ``max_keys``.
+    """
     
-    def __init__(self):
-        self.requests: Dict[str, list] = {}
+    def __init__(
+        self,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.time,
+        eviction_interval: float = 1.0
+    ):
+        self.max_keys = max_keys
+        self.clock = clock
+        self.eviction_interval = eviction_interval
+        self.windows: Dict[int, "OrderedDict[str, _WindowState]"] = {}
         self.blocked_ips: Dict[str, float] = {}
+        self._next_eviction = 0.0
+    
+    def __len__(self) -> int:
+        return sum(len(states) for states in self.windows.values())
+    
+    def _evict_idle(self, now: float):
+        """Drop keys whose counters no longer matter and expired blocks"""
+        for window, states in self.windows.items():
+            # Counters older than two windows no longer weigh in the estimate
+            idle_before = now - 2 * window
+            while states:
+                key = next(iter(states))
+                if states[key].window_start > idle_before:
+                    break
+                del states[key]
+        for key in [key for key, until in self.blocked_ips.items() if until <= now]:
+            del self.blocked_ips[key]
     
     def is_allowed(self, key: str, limit: int, window: int) -> tuple[bool, dict]:
         """Check if request is allowed and return status info"""
-        now = time.time()
+        now = self.clock()
+        if now >= self._next_eviction:
+            self._next_eviction = now + self.eviction_interval
+            self._evict_idle(now)
         
         # Check if IP is temporarily blocked
-        if key in self.blocked_ips:
-            if now < self.blocked_ips[key]:
-                remaining_time = int(self.blocked_ips[key] - now)
-                return False, {
-                    "allowed": False,
-                    "limit": limit,
-                    "remaining": 0,
-                    "reset_time": int(self.blocked_ips[key]),
-                    "retry_after": remaining_time,
-                    "blocked": True
-                }
-            else:
-                # Block expired, remove it
-                del self.blocked_ips[key]
+        blocked_until = self.blocked_ips.get(key)
+        if blocked_until is not None and now < blocked_until:
+            return False, _limit_info(False, limit, 0, blocked_until, now, blocked=True)
         
-        # Initialize or clean old requests
-        if key not in self.requests:
-            self.requests[key] = []
+        states = self.windows.get(window)
+        if states is None:
+            states = self.windows[window] = OrderedDict()
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _WindowState(now - now % window)
+            if len(states) > self.max_keys:
+                states.popitem(last=False)
+        else:
+            states.move_to_end(key)
         
-        # Remove requests outside the window
-        self.requests[key] = [req_time for req_time in self.requests[key] if now - req_time < window]
+        allowed, remaining, reset_time, block = _count_request(state, now, limit, window)
+        if block:
+            self.blocked_ips[key] = now + BLOCK_SECONDS
+            if len(self.blocked_ips) > self.max_keys:
+                del self.blocked_ips[next(iter(self.blocked_ips))]
+        return allowed, _limit_info(allowed, limit, remaining, reset_time, now)
+
+class SharedMemoryRateLimiter:
+    """
+    Rate limiter whose counters live in a memory-mapped file shared by all workers.
+
+    With several uvicorn workers each process would otherwise count on its own and
+    the effective limit would be multiplied by the number of workers. The file is a
+    fixed table of slots grouped in buckets; a key hashes to one bucket and only that
+    bucket is locked (``fcntl`` byte-range lock between processes, plus a striped
+    thread lock inside each process). Slots are reused once idle, or the oldest one
+    in the bucket when it is full, so the file never grows. Same sliding window
+    counter as ``InMemoryRateLimiter``.
+    """
+    
+    MAGIC = b"LYRL0001"
+    # key hash, window, previous, current, denied, window start, blocked until
+    SLOT = struct.Struct("<QIIIIdd")
+    BUCKET_SLOTS = 8
+    THREAD_LOCKS = 64
+    
+    def __init__(self, path: str, slots: int = 65536, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.buckets = max(1, slots // self.BUCKET_SLOTS)
+        self.bucket_size = self.SLOT.size * self.BUCKET_SLOTS
+        self.header = struct.Struct("<8sQ")
+        size = self.header.size + self.buckets * self.bucket_size
         
-        # Check if limit exceeded
-        if len(self.requests[key]) >= limit:
-            # Block IP for 15 minutes if limit exceeded multiple times
-            if len(self.requests[key]) >= limit * 2:
-                self.blocked_ips[key] = now + 900  # 15 minutes
-            
-            reset_time = int(min(self.requests[key]) + window)
-            return False, {
-                "allowed": False,
-                "limit": limit,
-                "remaining": 0,
-                "reset_time": reset_time,
-                "retry_after": reset_time - int(now),
-                "blocked": False
-            }
+        # Workers starting together agree on the file under a separate lock, since
+        # the file itself may be replaced
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(lock_fd, fcntl.LOCK_EX)
+        try:
+            self.fd = self._open_file(path, size)
+        finally:
+            fcntl.lockf(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+        self.map = mmap.mmap(self.fd, size)
+        self.thread_locks = [threading.Lock() for _ in range(self.THREAD_LOCKS)]
+    
+    def _open_file(self, path: str, size: int) -> int:
+        """
+        Descriptor of a file with this layout at ``path``.
+
+        A file with a different layout may still be mapped by running workers, and
+        shrinking it under them would crash them with SIGBUS. So it is never resized
+        in place. The new layout is built in a fresh file and renamed over it; older
+        workers keep counting on the old file until they restart.
+        """
+        header = self.header.pack(self.MAGIC, self.buckets)
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            fd = None
+        if fd is not None:
+            if os.fstat(fd).st_size == size and os.pread(fd, self.header.size, 0) == header:
+                return fd
+            os.close(fd)
+            print(f"Rate limit file {path} has a different layout, replacing it")
         
-        # Allow request
-        self.requests[key].append(now)
-        remaining = limit - len(self.requests[key])
-        reset_time = int(now + window)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, header, 0)
+            os.replace(temporary, path)
+        except BaseException:
+            os.close(fd)
+            os.unlink(temporary)
+            raise
+        return fd
+    
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+    
+    @staticmethod
+    def _key_hash(key: str) -> int:
+        # 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+    
+    def is_allowed(self, key: str, limit: int, window: int) -> tuple[bool, dict]:
+        """Check if request is allowed and return status info"""
+        key_hash = self._key_hash(key)
+        bucket = key_hash % self.buckets
+        offset = self.header.size + bucket * self.bucket_size
         
-        return True, {
-            "allowed": True,
-            "limit": limit,
-            "remaining": remaining,
-            "reset_time": reset_time,
-            "retry_after": 0,
-            "blocked": False
-        }
+        with self.thread_locks[bucket % self.THREAD_LOCKS]:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.bucket_size, offset)
+            try:
+                now = self.clock()
+                slot = self._find_slot(offset, key_hash, now)
+                found_hash, slot_window, previous, current, denied, window_start, blocked_until = \
+                    self.SLOT.unpack_from(self.map, slot)
+                
+                if found_hash != key_hash or slot_window != window:
+                    # New key, a reused slot or limits changed at runtime
+                    if found_hash != key_hash:
+                        blocked_until = 0.0
+                    state = _WindowState(now - now % window)
+                else:
+                    state = _WindowState(window_start, previous, current, denied)
+                
+                # Check if IP is temporarily blocked
+                if now < blocked_until:
+                    self.SLOT.pack_into(self.map, slot, key_hash, window, state.previous, state.current,
+                                        state.denied, state.window_start, blocked_until)
+                    return False, _limit_info(False, limit, 0, blocked_until, now, blocked=True)
+                
+                allowed, remaining, reset_time, block = _count_request(state, now, limit, window)
+                if block:
+                    blocked_until = now + BLOCK_SECONDS
+                self.SLOT.pack_into(self.map, slot, key_hash, window, state.previous, state.current,
+                                    state.denied, state.window_start, blocked_until)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.bucket_size, offset)
+        return allowed, _limit_info(allowed, limit, remaining, reset_time, now)
+    
+    def _find_slot(self, offset: int, key_hash: int, now: float) -> int:
+        """Offset of the key's slot in its bucket: its own, a free or idle one, or the oldest"""
+        reusable = oldest = None
+        oldest_start = None
+        for index in range(self.BUCKET_SLOTS):
+            slot = offset + index * self.SLOT.size
+            found_hash, window, _, _, _, window_start, blocked_until = self.SLOT.unpack_from(self.map, slot)
+            if found_hash == key_hash:
+                return slot
+            if reusable is None:
+                if found_hash == 0 or (now >= window_start + 2 * window and now >= blocked_until):
+                    reusable = slot
+                elif oldest_start is None or window_start < oldest_start:
+                    oldest, oldest_start = slot, window_start
+        return reusable if reusable is not None else oldest
+
+# Same sliding window counter as InMemoryRateLimiter, checked and updated atomically.
+# KEYS[1]: state hash; ARGV: limit, window, now (seconds), block seconds.
+# Returns {allowed, remaining, reset time, blocked}; times as strings to keep decimals.
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'start', 'previous', 'current', 'denied', 'blocked_until')
+
+local blocked_until = tonumber(state[5]) or 0
+if now < blocked_until then
+    return {0, 0, tostring(blocked_until), 1}
+end
+
+local start = tonumber(state[1])
+local previous = tonumber(state[2]) or 0
+local current = tonumber(state[3]) or 0
+local denied = tonumber(state[4]) or 0
+if not start then
+    start = now - (now % window)
+else
+    local elapsed = math.floor((now - start) / window)
+    if elapsed > 0 then
+        if elapsed == 1 then previous = current else previous = 0 end
+        current = 0
+        denied = 0
+        start = start + elapsed * window
+    end
+end
+
+local estimate = previous * (1 - (now - start) / window) + current
+local allowed = 0
+local remaining = 0
+local reset
+if estimate >= limit then
+    denied = denied + 1
+    if current + denied >= limit * 2 then
+        blocked_until = now + tonumber(ARGV[4])
+    end
+    if current <= 0 then
+        reset = start + window
+    elseif current < limit then
+        reset = start + window * (1 - (limit - current) / previous)
+    else
+        reset = start + window * (2 - limit / current)
+    end
+else
+    allowed = 1
+    current = current + 1
+    remaining = math.max(0, math.floor(limit - estimate - 1))
+    reset = start + window
+end
+
+redis.call('HSET', KEYS[1], 'start', start, 'previous', previous, 'current', current,
+    'denied', denied, 'blocked_until', blocked_until)
+redis.call('PEXPIRE', KEYS[1], math.ceil((math.max(start + 2 * window, blocked_until) - now) * 1000))
+return {allowed, remaining, tostring(reset), 0}
+"""
 
 class RedisRateLimiter:
-    """Redis-based rate limiter for production"""
+    """
+    Redis-based rate limiter for production.
+
+    The check and the update run in one server-side script, so each request is a
+    single round trip and concurrent workers cannot interleave between them. Each
+    key is one small hash that expires on its own once idle.
+    """
     
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379",
+        client: Optional["redis.Redis"] = None,
+        clock: Callable[[], float] = time.time,
+        key_prefix: str = "ratelimit:"
+    ):
+        self.clock = clock
+        self.key_prefix = key_prefix
         try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            self.redis_client = client or redis.from_url(redis_url, decode_responses=True)
             self.redis_client.ping()  # Test connection
+            self.script = self.redis_client.register_script(SLIDING_WINDOW_SCRIPT)
             self.available = True
         except:
             self.available = False
@@ -88,75 +384,40 @@ class RedisRateLimiter:
         if not self.available:
             return True, {"allowed": True, "limit": limit, "remaining": limit}
         
-        now = time.time()
-        pipeline = self.redis_client.pipeline()
-        
-        # Check if IP is blocked
-        blocked_key = f"blocked:{key}"
-        if self.redis_client.get(blocked_key):
-            ttl = self.redis_client.ttl(blocked_key)
-            return False, {
-                "allowed": False,
-                "limit": limit,
-                "remaining": 0,
-                "reset_time": int(now + ttl),
-                "retry_after": ttl,
-                "blocked": True
-            }
-        
-        # Sliding window counter
-        requests_key = f"requests:{key}"
-        
-        # Remove old requests
-        pipeline.zremrangebyscore(requests_key, "-inf", now - window)
-        
-        # Count current requests
-        pipeline.zcard(requests_key)
-        
-        # Add current request
-        pipeline.zadd(requests_key, {str(now): now})
-        
-        # Set expiry
-        pipeline.expire(requests_key, window)
-        
-        results = pipeline.execute()
-        current_requests = results[1]
-        
-        if current_requests >= limit:
-            # Block IP if severely exceeding limit
-            if current_requests >= limit * 2:
-                self.redis_client.setex(blocked_key, 900, "1")  # 15 minutes
-            
-            # Calculate reset time
-            earliest_request = self.redis_client.zrange(requests_key, 0, 0, withscores=True)
-            reset_time = int(earliest_request[0][1] + window) if earliest_request else int(now + window)
-            
-            return False, {
-                "allowed": False,
-                "limit": limit,
-                "remaining": 0,
-                "reset_time": reset_time,
-                "retry_after": reset_time - int(now),
-                "blocked": False
-            }
+        now = self.clock()
+        try:
+            # EVALSHA, with a fallback to EVAL the first time the server sees the script
+            allowed, remaining, reset_time, blocked = self.script(
+                keys=[f"{self.key_prefix}{key}"],
+                args=[limit, window, repr(now), BLOCK_SECONDS]
+            )
+        except redis.RedisError as e:
+            # Do not take the API down with Redis
+            print(f"Rate limiting unavailable: {e}")
+            return True, {"allowed": True, "limit": limit, "remaining": limit}
         
-        return True, {
-            "allowed": True,
-            "limit": limit,
-            "remaining": limit - current_requests,
-            "reset_time": int(now + window),
-            "retry_after": 0,
-            "blocked": False
-        }
+        return bool(allowed), _limit_info(bool(allowed), limit, int(remaining), float(reset_time), now, bool(blocked))
 
 class RateLimitMiddleware:
     """Rate limiting middleware for FastAPI"""
     
     def __init__(self, redis_url: Optional[str] = None):
+        self.limiter = None
         if redis_url:
-            self.limiter = RedisRateLimiter(redis_url)
-        else:
-            self.limiter = InMemoryRateLimiter()
+            limiter = RedisRateLimiter(redis_url)
+            if limiter.available:
+                self.limiter = limiter
+        if self.limiter is None and settings.RATE_LIMIT_SHARED_PATH and fcntl is not None:
+            # Counters shared by all workers on this host
+            try:
+                self.limiter = SharedMemoryRateLimiter(
+                    settings.RATE_LIMIT_SHARED_PATH,
+                    slots=settings.RATE_LIMIT_SHARED_SLOTS
+                )
+            except OSError as e:
+                print(f"Shared rate limiting not available ({e}), falling back to in-memory rate limiting")
+        if self.limiter is None:
+            self.limiter = InMemoryRateLimiter(max_keys=settings.RATE_LIMIT_MAX_KEYS)
         
         # Rate limit configurations for different endpoints
         self.rate_limits = {
@@ -1,9 +1,10 @@
 from .base import Base
 from .user import User, Staff, Guardian, guardian_student
 from .school import School, Classroom, Student, GradeLevel
-from .access import AccessLog, QRCode, FacialRecognition, AccessType, AuthorizedBy
+from .access import AccessLog, AccessLogArchive, QRCode, QRCodeRevocation, QRBulkBatch, qr_bulk_batch_codes, FacialRecognition, AccessType, AuthorizedBy, DailyPresence, PresenceStatus, AccessEventOutbox, GateScanReceipt
 from .invitation import Invitation, InvitationType
 from .notification import Notification
+from .search import StudentSearchDocument, StudentSearchTrigram, StudentChange
 
 # Para creación de tablas
 def create_tables(engine):
@@ -19,6 +20,14 @@ __all__ = [
     'Student',
     'Grade',
     'AccessLog',
+    'AccessLogArchive',
+    'QRCodeRevocation',
+    'QRBulkBatch',
+    'qr_bulk_batch_codes',
+    'DailyPresence',
+    'AccessEventOutbox',
+    'GateScanReceipt',
+    'StudentChange',
     'Invitation',
     'Notification'
 ] 
\ No newline at end of file
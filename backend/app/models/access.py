@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Date, ForeignKey, Enum, Text, Index, UniqueConstraint, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
@@ -9,6 +9,10 @@ class AccessType(enum.Enum):
     ENTRADA = "entrada"
     SALIDA = "salida"
 
+class PresenceStatus(enum.Enum):
+    PRESENTE = "presente"
+    RETIRADO = "retirado"
+
 class AuthorizedBy(enum.Enum):
     QR_CODE = "qr_code"
     FACIAL_RECOGNITION = "facial_recognition"
@@ -31,6 +35,14 @@ class AccessLog(Base):
     guardian = relationship("Guardian")
     authorized_by_staff = relationship("Staff")
 
+    __table_args__ = (
+        # Historial de un alumno paginado por (timestamp, id)
+        Index("ix_access_logs_student_timestamp_id", "student_id", "timestamp", "id"),
+        Index("ix_access_logs_timestamp_id", "timestamp", "id"),
+        # Los IDs archivados no se reutilizan aunque se vacíe la tabla (ver reserve_archived_ids)
+        {"sqlite_autoincrement": True},
+    )
+
     @staticmethod
     def get_today_date():
         """Returns today's date at midnight (start of day) as a timezone-aware datetime"""
@@ -38,6 +50,112 @@ class AccessLog(Base):
         # Create a timezone-aware datetime at midnight
         return datetime.combine(today, time.min).replace(tzinfo=timezone.utc)
 
+class AccessLogArchive(Base):
+    """
+    Registros de acceso de cursos escolares ya cerrados.
+
+    ``app.services.access_archive`` mueve aquí las filas de ``access_logs`` anteriores
+    al inicio del curso actual, conservando su ID, para que la tabla activa solo
+    contenga el curso en marcha. Las filas se agrupan por escuela y fecha.
+    """
+    __tablename__ = "access_logs_archive"
+    __table_args__ = (
+        Index("ix_access_logs_archive_school_timestamp_id", "school_id", "timestamp", "id"),
+        Index("ix_access_logs_archive_student_timestamp_id", "student_id", "timestamp", "id"),
+        Index("ix_access_logs_archive_timestamp_id", "timestamp", "id"),
+    )
+
+    # Mismo ID que tenía en access_logs
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    access_type = Column(Enum(AccessType))
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+    guardian_id = Column(Integer, ForeignKey("guardians.id"), nullable=True)
+    authorized_by = Column(Enum(AuthorizedBy))
+    authorized_by_staff_id = Column(Integer, ForeignKey("staff.id"), nullable=True)
+    notes = Column(String, nullable=True)
+    # Escuela del alumno en el momento de archivar
+    school_id = Column(Integer, ForeignKey("schools.id"), nullable=True)
+    # Año en que empezó el curso escolar del registro
+    school_year = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class DailyPresence(Base):
+    """
+    Estado de presencia de un alumno en un día, mantenido por el registro de accesos.
+
+    Hay una fila por alumno y día con la primera entrada, la última salida y el
+    estado actual, de modo que las consultas de asistencia no necesitan recorrer
+    ``access_logs``.
+    """
+    __tablename__ = "daily_presence"
+    __table_args__ = (
+        UniqueConstraint("student_id", "date", name="uq_daily_presence_student_date"),
+        Index("ix_daily_presence_school_date_status", "school_id", "date", "status"),
+        Index("ix_daily_presence_date_status", "date", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    school_id = Column(Integer, ForeignKey("schools.id"), nullable=True)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    status = Column(Enum(PresenceStatus), nullable=False)
+    first_entry_at = Column(DateTime(timezone=True), nullable=True)
+    last_exit_at = Column(DateTime(timezone=True), nullable=True)
+    # Último registro que modificó el estado; sin FK para no atar el resumen al almacenamiento de los logs
+    last_access_log_id = Column(Integer, nullable=True)
+    # Momento del último registro aplicado al estado; los registros más antiguos no lo cambian
+    last_access_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relaciones
+    student = relationship("Student")
+
+class AccessEventOutbox(Base):
+    """
+    Eventos de entrada/salida pendientes de notificar a los tutores.
+
+    Se escriben en la misma transacción que el registro de acceso y los procesa
+    en segundo plano ``app.services.access_outbox``.
+    """
+    __tablename__ = "access_event_outbox"
+    __table_args__ = (
+        Index("ix_access_event_outbox_pending", "processed_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Sin FK: el evento lleva sus propios datos y puede sobrevivir al archivado de los logs
+    access_log_id = Column(Integer, nullable=False)
+    student_id = Column(Integer, ForeignKey("students.id"), nullable=False)
+    access_type = Column(Enum(AccessType), nullable=False)
+    occurred_at = Column(DateTime(timezone=True), nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class GateScanReceipt(Base):
+    """
+    Lecturas de los escáneres de puerta ya recibidas por sincronización.
+
+    Cada lectura lleva el ID del dispositivo y un ID propio; guardar el resultado
+    permite reenviar un lote sin registrar dos veces el mismo acceso.
+    """
+    __tablename__ = "gate_scan_receipts"
+    __table_args__ = (
+        UniqueConstraint("device_id", "client_event_id", name="uq_gate_scan_receipts_device_event"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String(64), nullable=False)
+    client_event_id = Column(String(64), nullable=False)
+    # Sin FK, como el resto de referencias a access_logs
+    access_log_id = Column(Integer, nullable=True)
+    success = Column(Boolean, nullable=False)
+    message = Column(Text, nullable=True)
+    scanned_at = Column(DateTime(timezone=True), nullable=False)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class QRCode(Base):
     __tablename__ = "qr_codes"
     
@@ -54,6 +172,45 @@ class QRCode(Base):
     guardian = relationship("Guardian", back_populates="qr_codes")
     student = relationship("Student")
 
+class QRCodeRevocation(Base):
+    """
+    Códigos QR revocados antes de su expiración.
+
+    Los códigos firmados se validan sin consultar ``qr_codes``, así que las revocaciones
+    se guardan aparte y ``app.services.qr_service`` las mantiene en memoria.
+    """
+    __tablename__ = "qr_code_revocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    qr_code_id = Column(Integer, ForeignKey("qr_codes.id"), nullable=False, unique=True)
+    # Pasada la expiración del código la revocación ya no hace falta
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class QRBulkBatch(Base):
+    """
+    Emisión de códigos QR en bloque pendiente de descargar.
+
+    Se guarda en la base de datos para que cualquier worker pueda servir el progreso
+    y la descarga; los códigos emitidos se enlazan en ``qr_bulk_batch_codes``.
+    """
+    __tablename__ = "qr_bulk_batches"
+
+    # Token aleatorio: es el ID que aparece en las URLs de progreso y descarga
+    id = Column(String(32), primary_key=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    total = Column(Integer, nullable=False, default=0)
+    rendered = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+qr_bulk_batch_codes = Table(
+    "qr_bulk_batch_codes",
+    Base.metadata,
+    Column("batch_id", String(32), ForeignKey("qr_bulk_batches.id", ondelete="CASCADE"), primary_key=True),
+    Column("qr_code_id", Integer, ForeignKey("qr_codes.id"), primary_key=True),
+)
+
 class FacialRecognition(Base):
     __tablename__ = "facial_recognition"
     
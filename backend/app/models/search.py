@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from sqlalchemy.sql import func
+from .base import Base
+
+class StudentSearchDocument(Base):
+    """
+    Texto normalizado (sin acentos, en minúsculas) con el que se indexa cada alumno:
+    nombre, apellidos, matrícula y nombres de sus tutores.
+    """
+    __tablename__ = "student_search_documents"
+
+    # Sin FK: es un índice derivado que se mantiene desde app.services.search_index
+    student_id = Column(Integer, primary_key=True)
+    school_id = Column(Integer, nullable=True, index=True)
+    normalized_text = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StudentSearchTrigram(Base):
+    """Trigramas de cada documento de búsqueda, para buscar por coincidencia parcial con índice."""
+    __tablename__ = "student_search_trigrams"
+    __table_args__ = (
+        Index("ix_student_search_trigrams_school_trigram", "school_id", "trigram"),
+        Index("ix_student_search_trigrams_student", "student_id"),
+    )
+
+    trigram = Column(String(3), primary_key=True)
+    student_id = Column(Integer, primary_key=True)
+    school_id = Column(Integer, nullable=True)
+
+class StudentChange(Base):
+    """
+    Registro de los alumnos modificados en cada transacción, en orden de escritura.
+
+    Cada worker lo lee antes de responder el autocompletado para aplicar a su
+    índice en memoria los cambios hechos desde otros procesos.
+    """
+    __tablename__ = "student_changes"
+    # Los ids no se reutilizan aunque se borren las filas antiguas
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Sin FK: también se registran los alumnos eliminados
+    student_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
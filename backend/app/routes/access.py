@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Header
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from sqlalchemy import or_, func
+from sqlalchemy import or_, func, select
 from datetime import datetime, time, timedelta, timezone
 import os
 import json
@@ -9,20 +12,58 @@ import qrcode
 from io import BytesIO
 import base64
 
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import User, AccessType, AuthorizedBy, Student, AccessLog as AccessLogModel, Guardian, QRCode
 from app.services.auth import get_current_active_user, get_password_hash
+from app.services.password_hasher import password_hasher
 from app.services.access_service import (
     register_student_entry,
     process_student_checkout,
+    register_access_batch,
     get_student_access_logs
 )
-from app.services.qr_service import create_qr_code, generate_qr_image
+from app.services.qr_service import create_qr_code, generate_qr_image, render_qr_image, record_qr_revocation, QR_IMAGE_FORMATS
+from app.services.presence_service import (
+    get_presence_date,
+    parse_presence_date,
+    present_students_query,
+    entered_students_query
+)
+from app.services.student_read_model import (
+    fetch_student_rows,
+    student_search_item,
+    student_list_item
+)
+from app.services.search_index import search_student_ids, rank_order
+from app.services.dashboard_stats import dashboard_stats_cache, compute_dashboard_stats
+from app.services.access_archive import access_log_source
+from app.services.gate_sync import build_qr_delta, reconcile_scan_events
+from app.services.qr_bulk import QR_BULK_FORMATS, issue_qr_codes, qr_bulk_jobs, iter_zip, iter_html
+from app.services.access_export import (
+    EXPORT_FORMATS,
+    build_export_query,
+    iter_export_records,
+    iter_ndjson,
+    iter_csv
+)
+from app.services.pagination import (
+    NEXT_CURSOR_HEADER,
+    page_limit,
+    keyset_criteria,
+    keyset_order,
+    split_page
+)
 from app.schemas.access import (
     AccessLog as AccessLogSchema,
     QRCode as QRCodeSchema,
     StudentCheckoutRequest,
     StudentCheckoutResponse,
+    AccessBatchRequest,
+    AccessBatchResponse,
+    QRBulkRequest,
+    QRBulkJobResponse,
+    GateSyncUpload,
+    GateSyncResponse,
     StudentSearch
 )
 from app.schemas.user import User as UserSchema, UserCreate, UserUpdate
@@ -34,135 +75,76 @@ router = APIRouter()
 async def search_students(
     query: str = Query(None, description="Búsqueda por nombre o ID"),
     status: Optional[str] = Query(None, description="Filtrar por estado (present/absent)"),
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Máximo de resultados de la búsqueda"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Busca alumnos por nombre o ID, opcionalmente filtrando por estado de presencia.
     Si no se proporciona un término de búsqueda pero se especifica status=present,
     se devolverán todos los alumnos presentes.
+    La búsqueda ignora acentos y mayúsculas y devuelve primero los más parecidos.
     """
-    # Base query
-    students_query = db.query(Student)
-    
-    # Si hay una búsqueda, aplicar filtros de búsqueda
-    if query:
-        search_query = f"%{query}%"
-        students_query = students_query.filter(
-            or_(
-                Student.first_name.ilike(search_query),
-                Student.last_name.ilike(search_query),
-                Student.enrollment_id.ilike(search_query),
-                # También podríamos buscar por ID numérico si es un número
-                Student.id == query if query.isdigit() else False
-            )
-        )
+    criteria = []
+    include = exclude = None
     
     # Si se solicita filtrar por estado de presencia
     if status:
-        # Get today's date for filtering
-        today = AccessLogModel.get_today_date()
-        tomorrow = today + timedelta(days=1)
+        # El estado de presencia del día se mantiene al registrar cada acceso
+        today = get_presence_date()
         
         if status.lower() == 'present':
-            # Get students with entry records for today
-            students_with_entry = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.ENTRADA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).subquery()
-            
-            # Get students with exit records for today
-            students_with_exit = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.SALIDA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).subquery()
-            
-            # Only return students who have an entry record but NO exit record for today
-            students_query = students_query.filter(
-                Student.id.in_(students_with_entry)
-            ).filter(
-                ~Student.id.in_(students_with_exit)
-            )
+            # Alumnos cuyo último registro de hoy es una entrada
+            include = present_students_query(today)
+            criteria.append(Student.id.in_(include))
             
         elif status.lower() == 'absent':
-            # Subconsulta para obtener IDs de alumnos con entrada hoy
-            present_student_ids = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.ENTRADA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).all()
-            present_student_ids = [id[0] for id in present_student_ids]
-            
-            # Filtrar solo alumnos ausentes
-            students_query = students_query.filter(~Student.id.in_(present_student_ids))
-    
-    # Obtener los resultados
-    students = students_query.all()
-    
-    # Preparar respuesta con los tutores de cada alumno
-    results = []
-    for student in students:
-        # Obtener tutores asociados a este alumno
-        guardians = []
-        for guardian in student.guardians:
-            guardian_data = {
-                "id": guardian.id,
-                "first_name": guardian.user.first_name,
-                "last_name": guardian.user.last_name,
-                "relationship_type": guardian.relationship_type
-            }
-            guardians.append(guardian_data)
-        
-        # Crear objeto de alumno con sus tutores
-        student_data = {
-            "id": student.id,
-            "first_name": student.first_name,
-            "last_name": student.last_name,
-            "enrollment_id": student.enrollment_id,
-            "grade_level": {"name": "No asignado"}
-        }
-        
-        # Add grade level safely to avoid enum errors
-        try:
-            if student.classroom and student.classroom.grade_level:
-                student_data["grade_level"] = {"name": student.classroom.grade_level.value}
-        except (AttributeError, TypeError, LookupError) as e:
-            # Log error but continue without failing
-            print(f"Error al obtener grade_level para alumno {student.id}: {str(e)}")
-        
-        # Add guardians
-        student_data["guardians"] = guardians
-        results.append(student_data)
+            # Alumnos sin entrada registrada hoy
+            exclude = entered_students_query(today)
+            criteria.append(~Student.id.in_(exclude))
+    
+    # Si hay una búsqueda, usar el índice de trigramas (nombre, matrícula, tutores o ID)
+    if query:
+        student_ids = await db.run_sync(
+            lambda session: search_student_ids(session, query, include=include, exclude=exclude, limit=limit)
+        )
+        if not student_ids:
+            return []
+        rows = await db.run_sync(
+            lambda session: fetch_student_rows(session, [Student.id.in_(student_ids)], order_by=[rank_order(student_ids)])
+        )
+        return [student_search_item(row) for row in rows]
     
-    return results
+    # Alumnos, grado y tutores en un número fijo de consultas
+    rows = await db.run_sync(lambda session: fetch_student_rows(session, criteria))
+    return [student_search_item(row) for row in rows]
 
 @router.post("/checkout", response_model=StudentCheckoutResponse)
 async def checkout_student(
     request: StudentCheckoutRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Procesa la salida de un alumno."""
-    return process_student_checkout(request, db)
+    return await db.run_sync(lambda session: process_student_checkout(request, session))
 
 @router.post("/entry/{student_id}", response_model=AccessLogSchema)
 async def register_entry(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Registra la entrada de un alumno."""
-    success, message, access_log = register_student_entry(
+    staff_id = current_user.staff_profile.id if current_user.staff_profile else None
+    success, message, access_log = await db.run_sync(lambda session: register_student_entry(
         student_id=student_id,
         access_type=AccessType.ENTRADA,
         guardian_id=None,
         authorized_by=AuthorizedBy.MANUAL,
-        authorized_by_staff_id=current_user.staff_profile.id if current_user.staff_profile else None,
+        authorized_by_staff_id=staff_id,
         notes=None,
-        db=db
-    )
+        db=session
+    ))
     
     if not success:
         raise HTTPException(
@@ -172,15 +154,88 @@ async def register_entry(
     
     return access_log
 
+@router.post("/batch", response_model=AccessBatchResponse)
+async def register_access_batch_endpoint(
+    request: AccessBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Registra un lote de entradas y salidas (lecturas de los accesos en hora punta).
+    Devuelve el resultado de cada lectura en el mismo orden en que se enviaron.
+    """
+    if not current_user.staff_profile:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede registrar accesos por lotes"
+        )
+    
+    staff_id = current_user.staff_profile.id
+    return await db.run_sync(lambda session: register_access_batch(request.scans, staff_id, session))
+
+@router.get("/sync/qr-codes", response_model=dict)
+async def sync_qr_codes(
+    since: Optional[str] = Query(None, description="Versión devuelta por la sincronización anterior"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Códigos QR vigentes y revocaciones nuevos desde ``since``, para los escáneres de puerta.
+    
+    Sin ``since`` devuelve todos los códigos vigentes; el escáner guarda ``version``
+    y la envía en la siguiente sincronización.
+    """
+    if not current_user.staff_profile:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede sincronizar escáneres"
+        )
+    
+    try:
+        return build_qr_delta(db, since, current_user.staff_profile.school_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/sync/scans", response_model=GateSyncResponse)
+async def sync_scans(
+    request: GateSyncUpload,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Recibe las lecturas hechas por un escáner, con o sin conexión.
+    
+    Reenviar lecturas ya recibidas no crea registros nuevos: se devuelve el resultado
+    guardado marcado como ``duplicate``.
+    """
+    if not current_user.staff_profile:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede sincronizar escáneres"
+        )
+    
+    staff_id = current_user.staff_profile.id
+    return await db.run_sync(lambda session: reconcile_scan_events(request, staff_id, session))
+
 @router.get("/logs/student/{student_id}", response_model=List[AccessLogSchema])
 async def get_student_logs(
     student_id: int,
+    response: Response,
     limit: int = 10,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Obtiene los registros de acceso de un alumno."""
-    return get_student_access_logs(student_id, limit, db)
+    """Obtiene los registros de acceso de un alumno, paginados por cursor."""
+    try:
+        logs, next_cursor = await db.run_sync(
+            lambda session: get_student_access_logs(student_id, limit, session, cursor)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return logs
 
 @router.post("/qrcode/generate/{guardian_id}", response_model=dict)
 async def generate_guardian_qrcode(
@@ -206,8 +261,11 @@ async def generate_guardian_qrcode(
 
 @router.get("/present-students", response_model=List[AccessLogSchema])
 async def get_present_students(
+    response: Response,
     date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format. Defaults to today."),
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor)"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -228,20 +286,87 @@ async def get_present_students(
                 detail="Formato de fecha inválido. Use YYYY-MM-DD."
             )
     
-    # Obtener todas las entradas de hoy
+    # Obtener las entradas de hoy, una página cada vez
     tomorrow = today + timedelta(days=1)
-    access_logs = db.query(AccessLogModel).filter(
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= today,
-        AccessLogModel.timestamp < tomorrow
-    ).all()
-    
+    limit = page_limit(limit)
+    # Hoy solo toca access_logs; las fechas de cursos cerrados incluyen el archivo
+    logs = access_log_source(today)
+    try:
+        after_cursor = keyset_criteria(logs.c.timestamp, logs.c.id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    access_logs = (await db.execute(
+        select(logs).where(
+            logs.c.access_type == AccessType.ENTRADA,
+            logs.c.timestamp >= today,
+            logs.c.timestamp < tomorrow,
+            *after_cursor
+        ).order_by(
+            *keyset_order(logs.c.timestamp, logs.c.id)
+        ).limit(limit + 1)
+    )).all()
+    
+    access_logs, next_cursor = split_page(access_logs, limit, key=lambda log: (log.timestamp, log.id))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return access_logs
 
+@router.get("/export")
+async def export_access_logs(
+    format: str = Query("ndjson", description="Formato de salida: ndjson o csv"),
+    school_id: Optional[int] = Query(None, description="Filtrar por escuela"),
+    classroom_id: Optional[int] = Query(None, description="Filtrar por aula"),
+    date_from: Optional[str] = Query(None, description="Primer día (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Último día incluido (YYYY-MM-DD)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Exporta los registros de acceso con los nombres de alumno, tutor y personal.
+    
+    La respuesta se genera mientras se lee la base de datos, de modo que exportar
+    un curso completo no carga todos los registros en memoria.
+    """
+    if not current_user.staff_profile and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede exportar registros de acceso"
+        )
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato no soportado. Use ndjson o csv."
+        )
+    
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato de fecha inválido. Use YYYY-MM-DD."
+        )
+    
+    # El personal de una escuela solo exporta su escuela
+    if not current_user.is_admin and current_user.staff_profile.school_id:
+        school_id = current_user.staff_profile.school_id
+    
+    query = build_export_query(school_id, classroom_id, start, end)
+    records = iter_export_records(db.get_bind(), query)
+    body = iter_ndjson(records) if format == "ndjson" else iter_csv(records)
+    
+    filename = f"accesos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/stats/dashboard", response_model=dict)
 async def get_dashboard_stats(
     date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format. Defaults to today."),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
@@ -252,46 +377,23 @@ async def get_dashboard_stats(
     - Total de salidas
     """
     # Si no se especifica fecha, usar hoy
-    if not date:
-        today = AccessLogModel.get_today_date()
-    else:
-        # Convertir la fecha de string a datetime
-        try:
-            parsed_date = datetime.strptime(date, '%Y-%m-%d')
-            # Create a timezone-aware datetime
-            today = datetime.combine(parsed_date.date(), time.min).replace(tzinfo=timezone.utc)
-        except ValueError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Formato de fecha inválido. Use YYYY-MM-DD."
-            )
-    
-    # Calcular el día siguiente
-    tomorrow = today + timedelta(days=1)
+    try:
+        presence_date = parse_presence_date(date)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato de fecha inválido. Use YYYY-MM-DD."
+        )
     
-    # Get total number of students in the system
-    total_students = db.query(Student).count()
-    
-    # Get the count of distinct students who entered today
-    entry_students = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= today,
-        AccessLogModel.timestamp < tomorrow
-    ).distinct().all()
-    total_entries = len(entry_students)
-    
-    # Get the count of distinct students who exited today
-    exit_students = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.SALIDA,
-        AccessLogModel.timestamp >= today,
-        AccessLogModel.timestamp < tomorrow
-    ).distinct().all()
-    total_exits = len(exit_students)
-    
-    # Count students currently present (entered but not exited)
-    entry_ids = set([entry[0] for entry in entry_students])
-    exit_ids = set([exit[0] for exit in exit_students])
-    students_present = len(entry_ids - exit_ids)
+    # Todos los contadores en una consulta, compartida entre dashboards durante unos segundos
+    stats = await dashboard_stats_cache.get(
+        (None, presence_date),
+        lambda: db.run_sync(lambda session: compute_dashboard_stats(session, presence_date))
+    )
+    total_students = stats["total_students"]
+    total_entries = stats["entered"]
+    total_exits = stats["exited"]
+    students_present = stats["present"]
     
     return {
         "totalStudents": total_students,
@@ -362,7 +464,9 @@ async def get_student_details(
 @router.get("/student/{student_id}/logs", response_model=List[dict])
 async def get_student_access_logs_endpoint(
     student_id: int,
+    response: Response,
     limit: int = 50,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -383,10 +487,13 @@ async def get_student_access_logs_endpoint(
             detail="No tienes permiso para ver los registros de este alumno"
         )
     
-    # Get access logs
-    logs = db.query(AccessLogModel).filter(
-        AccessLogModel.student_id == student_id
-    ).order_by(AccessLogModel.timestamp.desc()).limit(limit).all()
+    # Get one page of access logs
+    try:
+        logs, next_cursor = get_student_access_logs(student_id, limit, db, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     # Format logs for response
     result = []
@@ -522,7 +629,8 @@ async def get_guardian_qr_codes(
                 "id": qr.id,
                 "code": qr.code,
                 "created_at": qr.created_at,
-                "expires_at": qr.expires_at or qr.expiration_date,
+                "expires_at": qr.expires_at,
+                "image_url": f"/api/access/qr-codes/{qr.id}/image",
                 "student": {
                     "id": student.id,
                     "full_name": f"{student.first_name} {student.last_name}",
@@ -533,6 +641,152 @@ async def get_guardian_qr_codes(
     
     return result
 
+@router.get("/qr-codes/{qr_id}/image")
+async def get_qr_code_image(
+    qr_id: int,
+    format: str = Query("png", description="Formato de la imagen: png o svg"),
+    box_size: int = Query(10, ge=1, le=40, description="Píxeles por módulo"),
+    border: int = Query(4, ge=0, le=10, description="Módulos de margen"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Devuelve la imagen de un código QR en binario, con ETag.
+    
+    Las imágenes se sirven desde una caché en memoria, así que pedir el mismo código
+    repetidamente no lo vuelve a renderizar; con ``If-None-Match`` se responde 304.
+    """
+    if format not in QR_IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato no soportado. Use png o svg."
+        )
+    
+    qr_code = db.query(QRCode).filter(QRCode.id == qr_id).first()
+    if not qr_code:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Código QR no encontrado"
+        )
+    
+    # El personal ve cualquier código; los tutores solo los suyos
+    if not current_user.staff_profile and (
+        not current_user.guardian_profile or qr_code.guardian_id != current_user.guardian_profile.id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para ver este código QR"
+        )
+    
+    image, etag = await run_in_threadpool(render_qr_image, qr_code.code, format, box_size, border)
+    # El código autoriza recogidas: solo el navegador del usuario puede guardarlo
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=image, media_type=QR_IMAGE_FORMATS[format], headers=headers)
+
+@router.post("/qr-codes/bulk", response_model=dict)
+def create_bulk_qr_codes(
+    request: QRBulkRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Emite un código QR para cada tutor de los alumnos de una escuela o un aula.
+    
+    Los códigos se crean en una sola transacción; las imágenes se generan al
+    descargarlas desde ``download_url`` y el progreso se consulta en ``progress_url``.
+    Es una ruta síncrona: la inserción y la firma de una escuela entera se ejecutan
+    en el threadpool y no bloquean el event loop.
+    """
+    if not current_user.staff_profile and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede emitir códigos QR en bloque"
+        )
+    
+    school_id = request.school_id
+    # El personal de una escuela solo emite códigos de su escuela
+    if not current_user.is_admin and current_user.staff_profile.school_id:
+        school_id = current_user.staff_profile.school_id
+        if request.classroom_id is not None:
+            classroom = db.query(Classroom).filter(Classroom.id == request.classroom_id).first()
+            if not classroom or classroom.school_id != school_id:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="No tienes permiso para emitir códigos de esta aula"
+                )
+    
+    try:
+        codes = issue_qr_codes(db, school_id, request.classroom_id, request.expiration_days)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    job = qr_bulk_jobs.create(db, codes, current_user.id)
+    return {
+        **job.progress(),
+        "progress_url": f"/api/access/qr-codes/bulk/{job.id}",
+        "download_url": f"/api/access/qr-codes/bulk/{job.id}/download"
+    }
+
+@router.get("/qr-codes/bulk/{job_id}", response_model=QRBulkJobResponse)
+def get_bulk_qr_codes_progress(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Progreso de renderizado de una emisión en bloque."""
+    if not current_user.staff_profile and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede consultar emisiones en bloque"
+        )
+    job = qr_bulk_jobs.get(db, job_id, current_user, with_codes=False)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Emisión no encontrada o caducada"
+        )
+    return job.progress()
+
+@router.get("/qr-codes/bulk/{job_id}/download")
+def download_bulk_qr_codes(
+    job_id: str,
+    format: str = Query("zip", description="Formato: zip (un PNG por código) o html (imprimible)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Descarga los códigos de una emisión en bloque.
+    
+    Las imágenes se renderizan en un pool de procesos y se envían según se generan.
+    """
+    if not current_user.staff_profile and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo el personal puede descargar códigos QR en bloque"
+        )
+    if format not in QR_BULK_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato no soportado. Use zip o html."
+        )
+    job = qr_bulk_jobs.get(db, job_id, current_user)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Emisión no encontrada o caducada"
+        )
+    
+    body = iter_zip(job) if format == "zip" else iter_html(job)
+    filename = f"codigos_qr_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=QR_BULK_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.post("/qr-codes/generate", response_model=dict)
 async def generate_qr_code(
     request: dict,
@@ -590,6 +844,7 @@ async def generate_qr_code(
             "created_at": qr_code.created_at,
             "expires_at": qr_code.expires_at,
             "qr_image": qr_image,
+            "image_url": f"/api/access/qr-codes/{qr_code.id}/image",
             "student": {
                 "id": student.id,
                 "full_name": f"{student.first_name} {student.last_name}",
@@ -632,13 +887,15 @@ async def revoke_qr_code(
         )
     
     # Revoke QR code
-    qr_code.is_revoked = True
-    db.commit()
+    record_qr_revocation(qr_code, db)
     
     return {"success": True, "message": "Código QR revocado correctamente"}
 
 @router.get("/all-students", response_model=List[dict])
 async def get_all_students(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, description="Tamaño de página"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -650,40 +907,46 @@ async def get_all_students(
             detail="No tienes permiso para ver todos los alumnos"
         )
     
-    # Obtener todos los alumnos activos
-    students = db.query(Student).filter(Student.is_active == True).all()
-    
-    # Formatear resultados
-    results = []
-    for student in students:
-        student_data = {
-            "id": student.id,
-            "first_name": student.first_name,
-            "last_name": student.last_name,
-            "full_name": f"{student.first_name} {student.last_name}",
-            "enrollment_id": student.enrollment_id,
-            "grade_level": {"name": "No asignado"}
-        }
-        
-        # Add grade level safely
-        try:
-            if student.classroom and student.classroom.grade_level:
-                student_data["grade_level"] = {"name": student.classroom.grade_level.value}
-        except (AttributeError, TypeError, LookupError) as e:
-            print(f"Error al obtener grade_level para alumno {student.id}: {str(e)}")
-        
-        results.append(student_data)
+    # Una página de alumnos por ID (sin tutores: el listado no los muestra)
+    limit = page_limit(limit)
+    try:
+        after_cursor = keyset_criteria(Student.id, Student.id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    rows = fetch_student_rows(
+        db,
+        after_cursor,
+        order_by=[Student.id],
+        limit=limit + 1,
+        include_guardians=False
+    )
     
-    return results
+    rows, next_cursor = split_page(rows, limit, key=lambda row: (row.id, row.id))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [student_list_item(row) for row in rows]
 
 @router.get("/users/", response_model=List[UserSchema])
 def read_users(
-    skip: int = 0,
+    response: Response,
     limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    users = db.query(User).offset(skip).limit(limit).all()
+    # Paginación por (created_at, id): las páginas profundas cuestan lo mismo que la primera
+    limit = page_limit(limit)
+    try:
+        after_cursor = keyset_criteria(User.created_at, User.id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    users = db.query(User).filter(*after_cursor).order_by(
+        *keyset_order(User.created_at, User.id)
+    ).limit(limit + 1).all()
+    
+    users, next_cursor = split_page(users, limit, key=lambda user: (user.created_at, user.id))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return users
 
 @router.get("/users/{user_id}", response_model=UserSchema)
@@ -711,7 +974,7 @@ def create_user(
     # Create User object and set properties
     new_user = User(
         email=user.email,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=password_hasher.call(get_password_hash, user.password),
         first_name=user.first_name,
         last_name=user.last_name,
         is_active=True,
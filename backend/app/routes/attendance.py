@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List, Optional
 from datetime import datetime, timedelta
 
-from app.database import get_db
-from app.models import User, AccessLog as AccessLogModel, AccessType, Student, AuthorizedBy
+from app.database import get_db, get_async_db
+from app.models import User, AccessLog as AccessLogModel, AccessType, Student, AuthorizedBy, DailyPresence, PresenceStatus
 from app.services.auth import get_current_active_user
-from app.services.access_service import register_student_entry, process_student_checkout
+from app.services.access_service import register_student_entry, process_student_checkout, get_student_access_logs
+from app.services.presence_service import parse_presence_date
+from app.services.access_archive import access_log_source
+from app.services.dashboard_stats import dashboard_stats_cache, compute_dashboard_stats
+from app.services.pagination import NEXT_CURSOR_HEADER, page_limit, keyset_criteria, keyset_order, split_page
 from app.schemas.access import AccessLog as AccessLogSchema, StudentCheckoutRequest, StudentCheckoutResponse
 
 router = APIRouter()
@@ -14,20 +20,21 @@ router = APIRouter()
 @router.post("/entry/{student_id}", response_model=AccessLogSchema)
 async def register_entry(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Register student entry."""
     
-    success, message, access_log = register_student_entry(
+    staff_id = current_user.staff_profile.id if current_user.staff_profile else None
+    success, message, access_log = await db.run_sync(lambda session: register_student_entry(
         student_id=student_id,
         access_type=AccessType.ENTRADA,
         guardian_id=None,
         authorized_by=AuthorizedBy.MANUAL,
-        authorized_by_staff_id=current_user.staff_profile.id if current_user.staff_profile else None,
+        authorized_by_staff_id=staff_id,
         notes=None,
-        db=db
-    )
+        db=session
+    ))
     
     if not success:
         raise HTTPException(status_code=400, detail=message)
@@ -37,126 +44,101 @@ async def register_entry(
 @router.post("/checkout", response_model=StudentCheckoutResponse)
 async def checkout_student(
     request: StudentCheckoutRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Process student checkout/exit."""
-    return process_student_checkout(request, db)
+    return await db.run_sync(lambda session: process_student_checkout(request, session))
 
 @router.get("/present-students", response_model=List[AccessLogSchema])
 async def get_present_students(
+    response: Response,
     date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format. Defaults to today."),
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Cursor for the next page (X-Next-Cursor header)"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all students currently present (entry without exit) for a given date."""
     
-    if date:
-        try:
-            query_date = datetime.strptime(date, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-    else:
-        query_date = datetime.now().date()
-    
-    start_of_day = datetime.combine(query_date, datetime.min.time())
-    end_of_day = datetime.combine(query_date, datetime.max.time())
-    
-    # Get all entry records for the date
-    entry_records = db.query(AccessLogModel).filter(
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day
-    ).all()
-    
-    # Get all exit records for the date
-    exit_student_ids = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.SALIDA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day
-    ).all()
-    exit_student_ids = [id[0] for id in exit_student_ids]
-    
-    # Filter entry records to only include students who haven't exited
-    present_students = [
-        record for record in entry_records 
-        if record.student_id not in exit_student_ids
-    ]
-    
+    try:
+        query_date = parse_presence_date(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    
+    limit = page_limit(limit)
+    # Past school years live in the archive; today only reads access_logs
+    logs = access_log_source(datetime.combine(query_date, datetime.min.time()))
+    try:
+        after_cursor = keyset_criteria(logs.c.timestamp, logs.c.id, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The daily presence state points at the entry that made each student present
+    present_students = (await db.execute(
+        select(logs).join(
+            DailyPresence, DailyPresence.last_access_log_id == logs.c.id
+        ).where(
+            DailyPresence.date == query_date,
+            DailyPresence.status == PresenceStatus.PRESENTE,
+            *after_cursor
+        ).order_by(
+            *keyset_order(logs.c.timestamp, logs.c.id)
+        ).limit(limit + 1)
+    )).all()
+    
+    present_students, next_cursor = split_page(present_students, limit, key=lambda log: (log.timestamp, log.id))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return present_students
 
 @router.get("/logs/student/{student_id}", response_model=List[AccessLogSchema])
 async def get_student_logs(
     student_id: int,
+    response: Response,
     limit: int = Query(10, description="Maximum number of records to return"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Cursor for the next page (X-Next-Cursor header)"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get access logs for a specific student."""
+    """Get access logs for a specific student, newest first, paginated by cursor."""
     
-    logs = db.query(AccessLogModel).filter(
-        AccessLogModel.student_id == student_id
-    ).order_by(
-        AccessLogModel.timestamp.desc()
-    ).limit(limit).all()
+    try:
+        logs, next_cursor = await db.run_sync(
+            lambda session: get_student_access_logs(student_id, limit, session, cursor)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     return logs
 
 @router.get("/stats/dashboard", response_model=dict)
 async def get_dashboard_stats(
     date: Optional[str] = Query(None, description="Date in YYYY-MM-DD format. Defaults to today."),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get dashboard statistics for attendance."""
     
-    if date:
-        try:
-            query_date = datetime.strptime(date, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-    else:
-        query_date = datetime.now().date()
+    try:
+        query_date = parse_presence_date(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
     
-    start_of_day = datetime.combine(query_date, datetime.min.time())
-    end_of_day = datetime.combine(query_date, datetime.max.time())
-    
-    # Total students
-    total_students = db.query(Student).count()
-    
-    # Students with entries today
-    students_with_entry = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day
-    ).distinct().count()
-    
-    # Students with exits today
-    students_with_exit = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.SALIDA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day
-    ).distinct().count()
-    
-    # Currently present (entry but no exit)
-    exit_student_ids = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.SALIDA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day
-    ).subquery()
-    
-    currently_present = db.query(AccessLogModel.student_id).filter(
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= start_of_day,
-        AccessLogModel.timestamp <= end_of_day,
-        ~AccessLogModel.student_id.in_(exit_student_ids)
-    ).distinct().count()
+    # All counters in one aggregate, shared by concurrent dashboards for a few seconds
+    stats = await dashboard_stats_cache.get(
+        (None, query_date),
+        lambda: db.run_sync(lambda session: compute_dashboard_stats(session, query_date))
+    )
+    total_students = stats["total_students"]
     
     return {
         "date": query_date.isoformat(),
         "total_students": total_students,
-        "students_entered": students_with_entry,
-        "students_exited": students_with_exit,
-        "currently_present": currently_present,
-        "absent_today": total_students - students_with_entry
-    } 
\ No newline at end of file
+        "students_entered": stats["entered"],
+        "students_exited": stats["exited"],
+        "currently_present": stats["present"],
+        "absent_today": total_students - stats["entered"]
+    }
@@ -6,7 +6,7 @@ from datetime import timedelta
 from app.database import get_db
 from app.models import User
 from app.services.auth import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     get_current_active_user
@@ -20,7 +20,7 @@ async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
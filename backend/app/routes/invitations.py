@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, BackgroundTasks, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from app.database import get_db
-from app.services.auth import get_current_active_user
+from app.services.auth import get_current_active_user, get_password_hash_async
 from app.schemas.user import User, UserCreate
 from app.schemas.invitation import (
     InvitationCreate, 
@@ -18,21 +18,25 @@ from app.services.invitation_service import (
     is_invitation_valid,
     complete_registration,
     generate_invitation_url,
-    get_all_invitations,
+    get_invitations_page,
     delete_invitation_by_id,
     resend_invitation_by_id
 )
+from app.services.pagination import NEXT_CURSOR_HEADER
 
 router = APIRouter()
 
 @router.get("/", response_model=List[InvitationResponse])
 async def get_invitations(
     request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, description="Page size"),
+    cursor: Optional[str] = Query(None, description="Cursor for the next page (X-Next-Cursor header)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Get list of invitations (for admin users).
+    Get list of invitations (for admin users), newest first and paginated by cursor.
     """
     if not current_user.is_admin:
         raise HTTPException(
@@ -40,7 +44,12 @@ async def get_invitations(
             detail="Solo los administradores pueden ver la lista de invitaciones"
         )
     
-    db_invitations = get_all_invitations(db)
+    try:
+        db_invitations, next_cursor = get_invitations_page(db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     base_url = str(request.base_url).rstrip('/')
     response_invitations = [
@@ -134,14 +143,17 @@ async def register_with_invitation(
             detail="Invitación inválida o expirada"
         )
     
-    # Completar registro
+    # Completar registro; el hash se calcula fuera del event loop y sin retener la conexión
+    db.commit()
+    hashed_password = await get_password_hash_async(registration.password)
     user = complete_registration(
         db=db,
         token=registration.token,
         first_name=registration.first_name,
         last_name=registration.last_name,
         password=registration.password,
-        phone=registration.phone
+        phone=registration.phone,
+        hashed_password=hashed_password
     )
     
     if not user:
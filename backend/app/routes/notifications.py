@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from ..database import get_db
+from ..database import get_async_db
 from ..dependencies import get_current_user
 from ..models.user import User
 from ..services.notification_service import NotificationService
@@ -19,33 +19,37 @@ async def get_notifications(
     limit: int = 50,
     offset: int = 0,
     unread_only: bool = False,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get user notifications"""
-    service = NotificationService(db)
+    user_id = current_user.id
     
     if unread_only:
-        notifications = service.get_unread_notifications(current_user.id)
+        notifications = await db.run_sync(
+            lambda session: NotificationService(session).get_unread_notifications(user_id)
+        )
     else:
-        notifications = service.get_user_notifications(current_user.id, limit, offset)
+        notifications = await db.run_sync(
+            lambda session: NotificationService(session).get_user_notifications(user_id, limit, offset)
+        )
     
     return notifications
 
 @router.get("/unread/count")
 async def get_unread_count(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get count of unread notifications"""
-    service = NotificationService(db)
-    count = service.get_unread_count(current_user.id)
+    user_id = current_user.id
+    count = await db.run_sync(lambda session: NotificationService(session).get_unread_count(user_id))
     return {"unread_count": count}
 
 @router.post("/", response_model=NotificationResponse)
 async def create_notification(
     notification: NotificationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new notification (admin only for now)"""
@@ -55,18 +59,19 @@ async def create_notification(
             detail="Only administrators can create notifications"
         )
     
-    service = NotificationService(db)
-    return service.create_notification(notification)
+    return await db.run_sync(lambda session: NotificationService(session).create_notification(notification))
 
 @router.patch("/{notification_id}/read", response_model=NotificationResponse)
 async def mark_notification_read(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Mark a notification as read"""
-    service = NotificationService(db)
-    notification = service.mark_notification_as_read(notification_id, current_user.id)
+    user_id = current_user.id
+    notification = await db.run_sync(
+        lambda session: NotificationService(session).mark_notification_as_read(notification_id, user_id)
+    )
     
     if not notification:
         raise HTTPException(
@@ -78,24 +83,26 @@ async def mark_notification_read(
 
 @router.patch("/mark-all-read")
 async def mark_all_notifications_read(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Mark all notifications as read"""
-    service = NotificationService(db)
-    updated_count = service.mark_all_as_read(current_user.id)
+    user_id = current_user.id
+    updated_count = await db.run_sync(lambda session: NotificationService(session).mark_all_as_read(user_id))
     
     return {"updated_count": updated_count, "message": f"Marked {updated_count} notifications as read"}
 
 @router.delete("/{notification_id}")
 async def delete_notification(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete a notification"""
-    service = NotificationService(db)
-    deleted = service.delete_notification(notification_id, current_user.id)
+    user_id = current_user.id
+    deleted = await db.run_sync(
+        lambda session: NotificationService(session).delete_notification(notification_id, user_id)
+    )
     
     if not deleted:
         raise HTTPException(
@@ -108,12 +115,14 @@ async def delete_notification(
 @router.get("/{notification_id}", response_model=NotificationResponse)
 async def get_notification(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific notification"""
-    service = NotificationService(db)
-    notification = service.get_notification_by_id(notification_id, current_user.id)
+    user_id = current_user.id
+    notification = await db.run_sync(
+        lambda session: NotificationService(session).get_notification_by_id(notification_id, user_id)
+    )
     
     if not notification:
         raise HTTPException(
@@ -1,12 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from sqlalchemy import or_
+from sqlalchemy import or_, select
 from datetime import datetime, timedelta
 
-from app.database import get_db
-from app.models import User, Student, AccessLog as AccessLogModel, AccessType
+from app.database import get_db, get_async_db
+from app.models import User, Student, Guardian, AccessLog as AccessLogModel, AccessType, PresenceStatus
 from app.services.auth import get_current_active_user
+from app.services.presence_service import (
+    get_presence_date,
+    present_students_query,
+    entered_students_query,
+    get_student_presence
+)
+from app.services.student_read_model import fetch_student_rows, student_search_item
+from app.services.search_index import search_student_ids, rank_order
+from app.services.student_typeahead import student_typeahead
 from app.schemas.access import StudentSearch
 
 router = APIRouter()
@@ -15,106 +25,90 @@ router = APIRouter()
 async def search_students(
     query: str = Query(None, description="Búsqueda por nombre o ID"),
     status: Optional[str] = Query(None, description="Filtrar por estado (present/absent)"),
-    db: Session = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Máximo de resultados de la búsqueda"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Search students by name or ID, optionally filtering by attendance status."""
+    """Search students by name or ID, optionally filtering by attendance status.
+
+    Name searches ignore accents and case and are ranked by relevance.
+    """
     
-    # Base query
-    students_query = db.query(Student)
-    
-    # Apply search filters
-    if query:
-        search_query = f"%{query}%"
-        students_query = students_query.filter(
-            or_(
-                Student.first_name.ilike(search_query),
-                Student.last_name.ilike(search_query),
-                Student.enrollment_id.ilike(search_query),
-                Student.id == query if query.isdigit() else False
-            )
-        )
+    criteria = []
+    include = exclude = None
     
     # Apply status filter
     if status:
-        today = AccessLogModel.get_today_date()
-        tomorrow = today + timedelta(days=1)
+        today = get_presence_date()
         
         if status.lower() == 'present':
-            # Students with entry but no exit today
-            students_with_entry = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.ENTRADA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).subquery()
-            
-            students_with_exit = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.SALIDA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).subquery()
-            
-            students_query = students_query.filter(
-                Student.id.in_(students_with_entry)
-            ).filter(
-                ~Student.id.in_(students_with_exit)
-            )
+            # Students whose latest access today is an entry
+            include = present_students_query(today)
+            criteria.append(Student.id.in_(include))
             
         elif status.lower() == 'absent':
             # Students without entry today
-            present_student_ids = db.query(AccessLogModel.student_id).filter(
-                AccessLogModel.access_type == AccessType.ENTRADA,
-                AccessLogModel.timestamp >= today,
-                AccessLogModel.timestamp < tomorrow
-            ).all()
-            present_student_ids = [id[0] for id in present_student_ids]
-            
-            students_query = students_query.filter(~Student.id.in_(present_student_ids))
-    
-    students = students_query.all()
-    
-    # Format response
-    results = []
-    for student in students:
-        guardians = []
-        for guardian in student.guardians:
-            guardian_data = {
-                "id": guardian.id,
-                "first_name": guardian.user.first_name,
-                "last_name": guardian.user.last_name,
-                "relationship_type": guardian.relationship_type
-            }
-            guardians.append(guardian_data)
-        
-        student_data = {
-            "id": student.id,
-            "first_name": student.first_name,
-            "last_name": student.last_name,
-            "enrollment_id": student.enrollment_id,
-            "grade_level": {"name": "No asignado"}
-        }
-        
-        # Add grade level safely
-        try:
-            if student.classroom and student.classroom.grade_level:
-                student_data["grade_level"] = {"name": student.classroom.grade_level.value}
-        except (AttributeError, TypeError, LookupError) as e:
-            print(f"Error getting grade_level for student {student.id}: {str(e)}")
-        
-        student_data["guardians"] = guardians
-        results.append(student_data)
+            exclude = entered_students_query(today)
+            criteria.append(~Student.id.in_(exclude))
     
-    return results
+    # Apply search filters through the trigram index
+    if query:
+        student_ids = await db.run_sync(
+            lambda session: search_student_ids(session, query, include=include, exclude=exclude, limit=limit)
+        )
+        if not student_ids:
+            return []
+        rows = await db.run_sync(
+            lambda session: fetch_student_rows(session, [Student.id.in_(student_ids)], order_by=[rank_order(student_ids)])
+        )
+        return [student_search_item(row) for row in rows]
+    
+    # Students, grade level and guardians in a fixed number of queries
+    rows = await db.run_sync(lambda session: fetch_student_rows(session, criteria))
+    return [student_search_item(row) for row in rows]
+
+@router.get("/typeahead", response_model=List[dict])
+async def typeahead_students(
+    q: str = Query(..., description="Texto escrito hasta ahora"),
+    limit: Optional[int] = Query(None, ge=1, le=50, description="Máximo de sugerencias"),
+    school_id: Optional[int] = Query(None, description="Escuela (solo administradores sin escuela asignada)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Suggest students of the staff member's school whose name or enrollment ID starts with the typed text.
+
+    Served from an in-memory prefix index. Before answering, the changes other
+    workers logged since the last request are applied to it; the whole roster is
+    only read the first time, if the index was not warmed at startup.
+    """
+    
+    if current_user.staff_profile and current_user.staff_profile.school_id:
+        school_id = current_user.staff_profile.school_id
+    elif not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Only school staff can search students")
+    
+    student_typeahead.sync(db)
+    
+    return student_typeahead.search(school_id, q, limit)
+
+async def _load_student(db: AsyncSession, student_id: int, *options) -> Optional[Student]:
+    """Load a student with its guardians eagerly; async sessions cannot lazy-load."""
+    return await db.scalar(
+        select(Student).options(
+            selectinload(Student.guardians).joinedload(Guardian.user),
+            *options
+        ).where(Student.id == student_id)
+    )
 
 @router.get("/{student_id}", response_model=dict)
 async def get_student_details(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get detailed information about a specific student."""
     
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = await _load_student(db, student_id, joinedload(Student.classroom))
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
@@ -126,33 +120,21 @@ async def get_student_details(
             "first_name": guardian.user.first_name,
             "last_name": guardian.user.last_name,
             "email": guardian.user.email,
-            "phone": guardian.user.phone,
+            "phone": guardian.phone,
             "relationship_type": guardian.relationship_type
         }
         guardians.append(guardian_data)
     
     # Get today's attendance status
-    today = AccessLogModel.get_today_date()
-    tomorrow = today + timedelta(days=1)
-    
-    entry_log = db.query(AccessLogModel).filter(
-        AccessLogModel.student_id == student_id,
-        AccessLogModel.access_type == AccessType.ENTRADA,
-        AccessLogModel.timestamp >= today,
-        AccessLogModel.timestamp < tomorrow
-    ).first()
-    
-    exit_log = db.query(AccessLogModel).filter(
-        AccessLogModel.student_id == student_id,
-        AccessLogModel.access_type == AccessType.SALIDA,
-        AccessLogModel.timestamp >= today,
-        AccessLogModel.timestamp < tomorrow
-    ).first()
+    presence_date = get_presence_date()
+    presence = await db.run_sync(lambda session: get_student_presence(student_id, presence_date, session))
+    entry_time = presence.first_entry_at if presence else None
+    exit_time = presence.last_exit_at if presence else None
     
     attendance_status = "absent"
-    if entry_log and not exit_log:
+    if presence and presence.status == PresenceStatus.PRESENTE:
         attendance_status = "present"
-    elif entry_log and exit_log:
+    elif entry_time and exit_time:
         attendance_status = "completed"
     
     student_data = {
@@ -163,8 +145,8 @@ async def get_student_details(
         "enrollment_id": student.enrollment_id,
         "guardians": guardians,
         "attendance_status": attendance_status,
-        "entry_time": entry_log.timestamp.isoformat() if entry_log else None,
-        "exit_time": exit_log.timestamp.isoformat() if exit_log else None
+        "entry_time": entry_time.isoformat() if entry_time else None,
+        "exit_time": exit_time.isoformat() if exit_time else None
     }
     
     # Add grade level safely
@@ -179,12 +161,12 @@ async def get_student_details(
 @router.get("/{student_id}/guardians", response_model=List[dict])
 async def get_student_guardians(
     student_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get all guardians for a specific student."""
     
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = await _load_student(db, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
@@ -195,7 +177,7 @@ async def get_student_guardians(
             "first_name": guardian.user.first_name,
             "last_name": guardian.user.last_name,
             "email": guardian.user.email,
-            "phone": guardian.user.phone,
+            "phone": guardian.phone,
             "relationship_type": guardian.relationship_type
         }
         guardians.append(guardian_data)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -78,6 +78,71 @@ class StudentCheckoutResponse(BaseModel):
     message: str
     access_log_id: Optional[int] = None
 
+# Esquemas para el registro de accesos por lotes
+ACCESS_BATCH_MAX_SCANS = 500
+
+class AccessScan(BaseModel):
+    student_id: int
+    access_type: AccessTypeEnum
+    qr_code: Optional[str] = None
+    guardian_id: Optional[int] = None
+    staff_id: Optional[int] = None
+    notes: Optional[str] = None
+
+class AccessBatchRequest(BaseModel):
+    scans: List[AccessScan] = Field(..., min_length=1, max_length=ACCESS_BATCH_MAX_SCANS)
+
+class AccessBatchItemResult(BaseModel):
+    index: int
+    student_id: int
+    success: bool
+    message: str
+    access_log_id: Optional[int] = None
+
+class AccessBatchResponse(BaseModel):
+    processed: int
+    failed: int
+    results: List[AccessBatchItemResult]
+
+# Esquemas para la sincronización de los escáneres de puerta
+class GateScanEvent(BaseModel):
+    client_event_id: str = Field(..., min_length=1, max_length=64)
+    student_id: int
+    access_type: AccessTypeEnum
+    scanned_at: datetime
+    qr_code: Optional[str] = None
+    guardian_id: Optional[int] = None
+    notes: Optional[str] = None
+
+class GateSyncUpload(BaseModel):
+    device_id: str = Field(..., min_length=1, max_length=64)
+    events: List[GateScanEvent] = Field(..., min_length=1, max_length=ACCESS_BATCH_MAX_SCANS)
+
+class GateScanResult(BaseModel):
+    client_event_id: str
+    success: bool
+    message: str
+    access_log_id: Optional[int] = None
+    duplicate: bool = False
+
+class GateSyncResponse(BaseModel):
+    processed: int
+    failed: int
+    duplicates: int
+    results: List[GateScanResult]
+
+# Esquemas para la emisión masiva de códigos QR
+class QRBulkRequest(BaseModel):
+    school_id: Optional[int] = None
+    classroom_id: Optional[int] = None
+    expiration_days: int = Field(30, ge=1, le=400)
+
+class QRBulkJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total: int
+    rendered: int
+
 # Esquemas para búsqueda de alumnos
 class GuardianInfo(BaseModel):
     id: int
@@ -0,0 +1,160 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, delete, union_all, func, text
+from typing import Optional
+from datetime import date, datetime, time
+import logging
+
+from app.core.config import settings
+from app.models import AccessLog, AccessLogArchive, Student
+
+logger = logging.getLogger(__name__)
+
+# Columnas comunes a access_logs y access_logs_archive, en el orden de la unión
+ACCESS_LOG_COLUMNS = (
+    "id",
+    "student_id",
+    "access_type",
+    "timestamp",
+    "guardian_id",
+    "authorized_by",
+    "authorized_by_staff_id",
+    "notes"
+)
+
+def school_year_of(day: date) -> int:
+    """Año en que empezó el curso escolar al que pertenece un día."""
+    if day.month >= settings.SCHOOL_YEAR_START_MONTH:
+        return day.year
+    return day.year - 1
+
+def school_year_start(day: date) -> date:
+    """Primer día del curso escolar al que pertenece un día."""
+    return date(school_year_of(day), settings.SCHOOL_YEAR_START_MONTH, 1)
+
+def hot_boundary() -> datetime:
+    """
+    Inicio del curso escolar actual.
+
+    Todo lo archivado es anterior a este momento, así que una consulta que empieza
+    en él o después solo necesita ``access_logs``.
+    """
+    today = AccessLog.get_today_date().date()
+    return datetime.combine(school_year_start(today), time.min)
+
+def access_log_source(since: Optional[datetime] = None):
+    """
+    Origen de registros de acceso para consultas a partir de ``since``.
+
+    Devuelve la tabla ``access_logs`` si el rango empieza en el curso actual y, si no,
+    la unión de ``access_logs`` con ``access_logs_archive``. En ambos casos las columnas
+    son las de ``ACCESS_LOG_COLUMNS`` y se usan como ``source.c.timestamp``.
+
+    Args:
+        since: Primer momento que interesa a la consulta (None para todo el historial)
+    """
+    hot = AccessLog.__table__
+    if since is not None and since.replace(tzinfo=None) >= hot_boundary():
+        return hot
+
+    cold = AccessLogArchive.__table__
+    return union_all(
+        select(*(hot.c[name] for name in ACCESS_LOG_COLUMNS)),
+        select(*(cold.c[name] for name in ACCESS_LOG_COLUMNS))
+    ).subquery("access_log_history")
+
+def archive_access_logs(
+    db: Session,
+    before: Optional[date] = None,
+    batch_size: Optional[int] = None
+) -> int:
+    """
+    Mueve a ``access_logs_archive`` los registros anteriores a ``before``.
+
+    Cada lote se copia y se borra de ``access_logs`` en la misma transacción, de modo
+    que un registro está siempre en una sola de las dos tablas y conserva su ID.
+
+    Args:
+        db: Sesión de base de datos
+        before: Primer día que se queda en la tabla activa (por defecto, el inicio del curso actual)
+        batch_size: Registros movidos por transacción
+
+    Returns:
+        Número de registros archivados
+
+    Raises:
+        ValueError: Si ``before`` es posterior al inicio del curso actual
+    """
+    boundary = hot_boundary().date()
+    if before is None:
+        before = boundary
+    elif before > boundary:
+        raise ValueError("Solo se pueden archivar registros de cursos escolares cerrados")
+
+    cutoff = datetime.combine(before, time.min)
+    batch_size = batch_size or settings.ACCESS_ARCHIVE_BATCH_SIZE
+    columns = [getattr(AccessLog, name) for name in ACCESS_LOG_COLUMNS]
+
+    archived = 0
+    while True:
+        rows = db.execute(
+            select(*columns, Student.school_id).outerjoin(
+                Student, Student.id == AccessLog.student_id
+            ).where(
+                AccessLog.timestamp < cutoff
+            ).order_by(AccessLog.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        db.execute(insert(AccessLogArchive), [
+            {
+                **{name: getattr(row, name) for name in ACCESS_LOG_COLUMNS},
+                "school_id": row.school_id,
+                "school_year": school_year_of(row.timestamp.date())
+            }
+            for row in rows
+        ])
+        db.execute(
+            delete(AccessLog).where(AccessLog.id.in_([row.id for row in rows])),
+            execution_options={"synchronize_session": False}
+        )
+        db.commit()
+        archived += len(rows)
+
+    if archived:
+        reserve_archived_ids(db)
+    return archived
+
+def reserve_archived_ids(db: Session) -> None:
+    """
+    Hace que los nuevos registros de ``access_logs`` tengan IDs mayores que los archivados.
+
+    El archivo conserva el ID original, y SQLite sin AUTOINCREMENT o MySQL anterior
+    a 8.0 (que recalcula el contador al reiniciar) volverían a usar los IDs más altos
+    si salen de la tabla activa. Se llama tras archivar y al arrancar.
+    """
+    archived_max = db.scalar(select(func.max(AccessLogArchive.id)))
+    if archived_max is None:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        table_sql = db.scalar(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'access_logs'"
+        ))
+        if not table_sql or "AUTOINCREMENT" not in table_sql.upper():
+            logger.warning("access_logs was created without AUTOINCREMENT; archived IDs may be reused")
+            return
+        updated = db.execute(text(
+            "UPDATE sqlite_sequence SET seq = :seq WHERE name = 'access_logs' AND seq < :seq"
+        ), {"seq": archived_max})
+        if updated.rowcount == 0 and db.scalar(text(
+            "SELECT COUNT(*) FROM sqlite_sequence WHERE name = 'access_logs'"
+        )) == 0:
+            db.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('access_logs', :seq)"
+            ), {"seq": archived_max})
+    elif dialect == "mysql":
+        # MySQL no baja el contador por debajo del mayor ID existente
+        db.execute(text(f"ALTER TABLE access_logs AUTO_INCREMENT = {int(archived_max) + 1}"))
+    db.commit()
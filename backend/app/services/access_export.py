@@ -0,0 +1,174 @@
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import select
+from typing import Iterator, Optional
+from datetime import date, datetime, timedelta
+import csv
+import enum
+import io
+import json
+
+from app.models import Student, Guardian, User, Staff
+from app.models.school import Classroom
+from app.services.access_archive import access_log_source
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+EXPORT_COLUMNS = [
+    "id",
+    "timestamp",
+    "access_type",
+    "authorized_by",
+    "student_id",
+    "enrollment_id",
+    "student_name",
+    "classroom",
+    "guardian_id",
+    "guardian_name",
+    "relationship",
+    "staff_name",
+    "notes"
+]
+
+# Filas leídas de la base de datos por cada viaje del cursor
+EXPORT_BATCH_SIZE = 1000
+
+def build_export_query(
+    school_id: Optional[int] = None,
+    classroom_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None
+):
+    """
+    Construye la consulta de exportación de registros de acceso con los nombres ya unidos.
+
+    Si el rango empieza antes del curso actual incluye los registros archivados.
+
+    Args:
+        school_id: Filtrar por escuela del alumno
+        classroom_id: Filtrar por aula del alumno
+        date_from: Primer día incluido
+        date_to: Último día incluido
+
+    Returns:
+        Consulta ordenada por (timestamp, id)
+    """
+    start = datetime.combine(date_from, datetime.min.time()) if date_from is not None else None
+    logs = access_log_source(start)
+    guardian_user = aliased(User)
+    staff_user = aliased(User)
+
+    query = select(
+        logs.c.id,
+        logs.c.timestamp,
+        logs.c.access_type,
+        logs.c.authorized_by,
+        logs.c.student_id,
+        Student.enrollment_id,
+        Student.first_name.label("student_first_name"),
+        Student.last_name.label("student_last_name"),
+        Classroom.name.label("classroom"),
+        logs.c.guardian_id,
+        guardian_user.first_name.label("guardian_first_name"),
+        guardian_user.last_name.label("guardian_last_name"),
+        Guardian.relationship_type.label("relationship"),
+        staff_user.first_name.label("staff_first_name"),
+        staff_user.last_name.label("staff_last_name"),
+        logs.c.notes
+    ).join(
+        Student, Student.id == logs.c.student_id
+    ).outerjoin(
+        Classroom, Classroom.id == Student.classroom_id
+    ).outerjoin(
+        Guardian, Guardian.id == logs.c.guardian_id
+    ).outerjoin(
+        guardian_user, guardian_user.id == Guardian.user_id
+    ).outerjoin(
+        Staff, Staff.id == logs.c.authorized_by_staff_id
+    ).outerjoin(
+        staff_user, staff_user.id == Staff.user_id
+    )
+
+    if school_id is not None:
+        query = query.where(Student.school_id == school_id)
+    if classroom_id is not None:
+        query = query.where(Student.classroom_id == classroom_id)
+    if date_from is not None:
+        query = query.where(logs.c.timestamp >= start)
+    if date_to is not None:
+        query = query.where(logs.c.timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+
+    return query.order_by(logs.c.timestamp, logs.c.id)
+
+def _full_name(first_name: Optional[str], last_name: Optional[str]) -> Optional[str]:
+    if first_name is None and last_name is None:
+        return None
+    return " ".join(part for part in (first_name, last_name) if part)
+
+def _export_record(row) -> dict:
+    def plain(value):
+        if isinstance(value, enum.Enum):
+            return value.value
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    return {
+        "id": row.id,
+        "timestamp": plain(row.timestamp),
+        "access_type": plain(row.access_type),
+        "authorized_by": plain(row.authorized_by),
+        "student_id": row.student_id,
+        "enrollment_id": row.enrollment_id,
+        "student_name": _full_name(row.student_first_name, row.student_last_name),
+        "classroom": row.classroom,
+        "guardian_id": row.guardian_id,
+        "guardian_name": _full_name(row.guardian_first_name, row.guardian_last_name),
+        "relationship": row.relationship,
+        "staff_name": _full_name(row.staff_first_name, row.staff_last_name),
+        "notes": row.notes
+    }
+
+def iter_export_records(bind, query) -> Iterator[dict]:
+    """
+    Recorre el resultado con un cursor del servidor, sin cargarlo entero en memoria.
+
+    Usa su propia sesión sobre ``bind`` porque la respuesta se sigue enviando
+    después de que la petición haya liberado la suya.
+    """
+    db = Session(bind=bind)
+    try:
+        result = db.execute(query, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+        for partition in result.partitions():
+            for row in partition:
+                yield _export_record(row)
+    finally:
+        db.close()
+
+def iter_ndjson(records: Iterator[dict]) -> Iterator[str]:
+    """Una línea JSON por registro, agrupadas en bloques para no enviar trozos diminutos."""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def iter_csv(records: Iterator[dict]) -> Iterator[str]:
+    """CSV con cabecera, escrito por bloques."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
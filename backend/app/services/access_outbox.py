@@ -0,0 +1,275 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+import json
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import logging
+
+from app.models import AccessEventOutbox, AccessLog, AccessType, Guardian, Student, Notification, guardian_student
+from app.services.notification_service import NotificationService
+from app.services.connection_manager import user_topic, school_topic, classroom_topic
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def enqueue_access_event(access_log: AccessLog, db: Session) -> AccessEventOutbox:
+    """
+    Añade un evento de acceso al outbox sin confirmar la transacción.
+
+    Debe llamarse después de ``db.flush()`` para que el registro tenga ID y hora,
+    y antes del ``commit`` para que ambos se guarden juntos.
+    """
+    event = AccessEventOutbox(
+        access_log_id=access_log.id,
+        student_id=access_log.student_id,
+        access_type=access_log.access_type,
+        occurred_at=access_log.timestamp,
+        attempts=0
+    )
+    db.add(event)
+    return event
+
+def build_access_notification(student_name: str, access_type: AccessType, occurred_at: datetime):
+    """
+    Construye título, mensaje y tipo de la notificación de una entrada o salida.
+
+    Returns:
+        Tupla con (título, mensaje, tipo de notificación)
+    """
+    action_text = "entrada" if access_type == AccessType.ENTRADA else "salida"
+    title = f"Registro de {action_text}"
+    time_str = occurred_at.strftime("%H:%M")
+
+    if access_type == AccessType.ENTRADA:
+        return title, f"{student_name} ha llegado a la escuela a las {time_str}", "success"
+    return title, f"{student_name} ha salido de la escuela a las {time_str}", "info"
+
+def build_access_event_message(event: AccessEventOutbox) -> str:
+    """Mensaje WebSocket de una entrada o salida para las vistas del personal"""
+    entered = event.access_type == AccessType.ENTRADA
+    return json.dumps({
+        "type": "student_entry" if entered else "student_exit",
+        "data": {
+            "student_id": event.student_id,
+            "status": "present" if entered else "absent",
+            "access_log_id": event.access_log_id,
+            "occurred_at": event.occurred_at.isoformat()
+        },
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+def _notify_events(db: Session, events: List[AccessEventOutbox]) -> List[Tuple[str, str]]:
+    """
+    Crea las notificaciones de un grupo de eventos y los marca como procesados, sin confirmar.
+
+    Returns:
+        Pares (tema, mensaje WebSocket) a publicar tras el ``commit``
+    """
+    student_ids = {event.student_id for event in events}
+    students = {
+        row.id: row
+        for row in db.query(
+            Student.id, Student.first_name, Student.last_name, Student.school_id, Student.classroom_id
+        ).filter(Student.id.in_(student_ids))
+    }
+    guardian_users: Dict[int, Set[int]] = {}
+    rows = db.execute(
+        select(guardian_student.c.student_id, Guardian.user_id).join(
+            Guardian, Guardian.id == guardian_student.c.guardian_id
+        ).where(
+            guardian_student.c.student_id.in_(student_ids),
+            Guardian.user_id.isnot(None)
+        )
+    )
+    for row in rows:
+        guardian_users.setdefault(row.student_id, set()).add(row.user_id)
+
+    now = datetime.utcnow()
+    notifications = []
+    messages: List[Tuple[str, str]] = []
+    for event in events:
+        student = students.get(event.student_id)
+        title, message, notification_type = build_access_notification(
+            f"{student.first_name} {student.last_name}" if student else "",
+            event.access_type,
+            event.occurred_at
+        )
+        if student is not None:
+            access_message = build_access_event_message(event)
+            if student.school_id is not None:
+                messages.append((school_topic(student.school_id), access_message))
+            if student.classroom_id is not None:
+                messages.append((classroom_topic(student.classroom_id), access_message))
+        for user_id in sorted(guardian_users.get(event.student_id, ())):
+            notifications.append(Notification(
+                title=title,
+                message=message,
+                type=notification_type,
+                read=False,
+                user_id=user_id,
+                created_at=now
+            ))
+        event.attempts += 1
+        event.processed_at = now
+
+    db.add_all(notifications)
+    db.flush()
+    messages.extend(
+        (user_topic(n.user_id), NotificationService.build_notification_message(n))
+        for n in notifications
+    )
+    return messages
+
+def process_access_outbox(db: Session, batch_size: int = None) -> Tuple[int, List[Tuple[str, str]]]:
+    """
+    Procesa un lote de eventos pendientes y crea las notificaciones de los tutores.
+
+    Los nombres de los alumnos y los usuarios de sus tutores se cargan con una
+    consulta cada uno para todo el lote, y las notificaciones se insertan y los
+    eventos se marcan como procesados en una sola transacción. Si el lote falla,
+    se reintenta evento a evento en savepoints para que solo el que falla sume un
+    intento; al llegar a ``ACCESS_OUTBOX_MAX_ATTEMPTS`` queda agotado y se cuenta
+    en ``count_exhausted_events``.
+
+    Args:
+        db: Sesión de base de datos
+        batch_size: Número máximo de eventos a procesar
+
+    Returns:
+        Tupla con (eventos procesados, pares (tema, mensaje WebSocket)): las notificaciones
+        van al tema de cada tutor y las entradas y salidas a los de la escuela y el aula
+    """
+    batch_size = batch_size or settings.ACCESS_OUTBOX_BATCH_SIZE
+    events = db.query(AccessEventOutbox).filter(
+        AccessEventOutbox.processed_at.is_(None),
+        AccessEventOutbox.attempts < settings.ACCESS_OUTBOX_MAX_ATTEMPTS
+    ).order_by(AccessEventOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    if not events:
+        db.rollback()
+        return 0, []
+
+    try:
+        with db.begin_nested():
+            messages = _notify_events(db, events)
+    except Exception as e:
+        logger.warning(f"Access outbox batch failed, retrying events one by one: {e}")
+    else:
+        db.commit()
+        return len(events), messages
+
+    # Los eventos siguen bloqueados por esta transacción: reintentar cada uno en un savepoint
+    processed = 0
+    messages: List[Tuple[str, str]] = []
+    for event in events:
+        try:
+            with db.begin_nested():
+                messages.extend(_notify_events(db, [event]))
+            processed += 1
+        except Exception as e:
+            logger.error(f"Error processing access outbox event {event.id}: {e}")
+            event.attempts += 1
+            event.last_error = str(e)
+    db.commit()
+    return processed, messages
+
+def count_exhausted_events(db: Session) -> int:
+    """Cuenta los eventos que agotaron sus intentos sin procesarse (sus tutores no fueron notificados)"""
+    return db.query(AccessEventOutbox).filter(
+        AccessEventOutbox.processed_at.is_(None),
+        AccessEventOutbox.attempts >= settings.ACCESS_OUTBOX_MAX_ATTEMPTS
+    ).count()
+
+def purge_processed_events(db: Session, retention_days: int = None) -> int:
+    """Elimina los eventos procesados más antiguos que el periodo de retención"""
+    retention_days = retention_days or settings.ACCESS_OUTBOX_RETENTION_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    deleted = db.query(AccessEventOutbox).filter(
+        AccessEventOutbox.processed_at.isnot(None),
+        AccessEventOutbox.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+class AccessOutboxWorker:
+    """
+    Tarea en segundo plano que vacía el outbox de eventos de acceso.
+
+    Las consultas se ejecutan en el threadpool para no bloquear el event loop, y la
+    publicación por WebSocket se hace desde el loop. ``wake`` permite que el registro
+    de un acceso despierte al worker sin esperar al siguiente sondeo.
+    """
+
+    def __init__(self):
+        self._session_factory: Optional[Callable[[], Session]] = None
+        self._publish: Optional[Callable[[str, str], int]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_purge: Optional[datetime] = None
+        self.exhausted = 0
+
+    def start(self, session_factory: Callable[[], Session], publish: Callable[[str, str], int]):
+        """Arranca el worker en el event loop actual"""
+        self._session_factory = session_factory
+        self._publish = publish
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detiene el worker"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    def wake(self):
+        """Despierta al worker; se puede llamar desde cualquier hilo"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stats(self) -> Dict[str, int]:
+        """Eventos agotados en el último sondeo, para ``/health``"""
+        return {"exhausted": self.exhausted}
+
+    def _drain_once(self) -> Tuple[int, List[Tuple[str, str]]]:
+        db = self._session_factory()
+        try:
+            processed, messages = process_access_outbox(db)
+            self.exhausted = count_exhausted_events(db)
+            now = datetime.utcnow()
+            if self._last_purge is None or now - self._last_purge > timedelta(hours=1):
+                purge_processed_events(db)
+                self._last_purge = now
+            return processed, messages
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                processed, messages = await run_in_threadpool(self._drain_once)
+                for topic, message in messages:
+                    self._publish(topic, message)
+                if processed > 0:
+                    # Puede haber más eventos pendientes: seguir sin esperar
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Access outbox worker error: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.ACCESS_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+access_outbox_worker = AccessOutboxWorker()
@@ -1,11 +1,20 @@
 from sqlalchemy.orm import Session
-from app.models import Student, Guardian, AccessLog, QRCode, AccessType, AuthorizedBy
-from app.schemas.access import StudentCheckoutRequest, StudentCheckoutResponse
-from app.services.notification_service import NotificationService
-from app.schemas.notification import NotificationCreate
-from typing import Optional, Tuple
+from sqlalchemy import select, func
+from app.models import Student, Guardian, AccessLog, QRCode, AccessType, AuthorizedBy, DailyPresence, guardian_student
+from app.schemas.access import (
+    StudentCheckoutRequest,
+    StudentCheckoutResponse,
+    AccessScan,
+    AccessBatchItemResult,
+    AccessBatchResponse
+)
+from typing import Optional, Tuple, List
 from datetime import datetime
-from app.services.qr_service import validate_qr_code
+from app.services.qr_service import validate_qr_code, resolve_qr_codes
+from app.services.presence_service import record_presence, apply_presence, get_presence_date, utc_to_local
+from app.services.access_outbox import enqueue_access_event, access_outbox_worker
+from app.services.pagination import page_limit, keyset_criteria, keyset_order, split_page
+from app.services.access_archive import access_log_source
 
 def register_student_entry(
     student_id: int,
@@ -57,50 +66,22 @@ def register_student_entry(
     )
     
     db.add(access_log)
+    db.flush()
+    
+    # Actualizar el estado de presencia y encolar el aviso a los tutores en la misma transacción
+    record_presence(student, access_log, db)
+    enqueue_access_event(access_log, db)
+    
     db.commit()
     db.refresh(access_log)
     
-    # Create notifications for all guardians of the student
-    _create_access_notifications(student, access_type, access_log, db)
+    # Las notificaciones a los tutores las crea el worker del outbox
+    access_outbox_worker.wake()
     
     # Mensaje según el tipo de acceso
     action = "entrada" if access_type == AccessType.ENTRADA else "salida"
     return True, f"Se ha registrado la {action} del alumno {student.full_name()}", access_log
 
-def _create_access_notifications(student: Student, access_type: AccessType, access_log: AccessLog, db: Session):
-    """
-    Crea notificaciones para todos los tutores de un alumno cuando entra o sale.
-    """
-    notification_service = NotificationService(db)
-    
-    # Determinar el tipo de notificación y mensaje
-    action_text = "entrada" if access_type == AccessType.ENTRADA else "salida"
-    title = f"Registro de {action_text}"
-    
-    # Obtener la hora en formato legible
-    time_str = access_log.timestamp.strftime("%H:%M")
-    
-    if access_type == AccessType.ENTRADA:
-        message = f"{student.full_name()} ha llegado a la escuela a las {time_str}"
-        notification_type = "success"
-    else:
-        message = f"{student.full_name()} ha salido de la escuela a las {time_str}"
-        notification_type = "info"
-    
-    # Crear notificaciones para todos los tutores del alumno
-    for guardian in student.guardians:
-        if guardian.user:  # Verificar que el tutor tiene un usuario asociado
-            try:
-                notification_service.create_system_notification(
-                    user_id=guardian.user.id,
-                    title=title,
-                    message=message,
-                    notification_type=notification_type
-                )
-            except Exception as e:
-                # Log error but don't fail the access registration
-                print(f"Error creating notification for guardian {guardian.id}: {str(e)}")
-
 def process_student_checkout(request: StudentCheckoutRequest, db: Session) -> StudentCheckoutResponse:
     """
     Procesa una solicitud de salida de alumno.
@@ -168,20 +149,199 @@ def process_student_checkout(request: StudentCheckoutRequest, db: Session) -> St
         access_log_id=access_log.id if access_log else None
     )
 
-def get_student_access_logs(student_id: int, limit: int, db: Session):
+def register_access_batch(
+    scans: List[AccessScan],
+    default_staff_id: Optional[int],
+    db: Session,
+    scanned_at: Optional[List[datetime]] = None,
+    commit: bool = True
+) -> AccessBatchResponse:
     """
-    Obtiene los registros de acceso de un alumno.
+    Registra un lote de entradas y salidas en una sola transacción.
+    
+    Cada elemento se valida con las mismas reglas que ``register_student_entry``
+    (entradas) y ``process_student_checkout`` (salidas), pero los alumnos, tutores,
+    vínculos y códigos QR del lote se cargan con una consulta por tipo en lugar
+    de una por elemento. Los elementos inválidos no impiden registrar el resto.
+    
+    Args:
+        scans: Lecturas a registrar, en el orden en que ocurrieron
+        default_staff_id: ID del personal que envía el lote, usado en las entradas
+            que no indican otro
+        db: Sesión de base de datos
+        scanned_at: Hora UTC de cada lectura, para lecturas hechas sin conexión
+            (por defecto todas usan la hora del servidor)
+        commit: Si es False, deja los registros en la transacción para que el
+            llamante la confirme y despierte el worker del outbox
+        
+    Returns:
+        Resultado por elemento, en el mismo orden que ``scans``
+    """
+    student_ids = {scan.student_id for scan in scans}
+    codes = {scan.qr_code for scan in scans if scan.qr_code}
+    
+    students = {
+        student.id: student
+        for student in db.query(Student).filter(Student.id.in_(student_ids))
+    }
+    # Los códigos firmados se validan sin consultar la base de datos; los de lecturas
+    # sin conexión se comprueban con la hora en que se leyeron
+    now = datetime.utcnow()
+    qr_codes = resolve_qr_codes(codes, db, min(scanned_at or [now])) if codes else {}
+    
+    # Resolver el tutor de cada lectura antes de consultar tutores y vínculos
+    results: List[AccessBatchItemResult] = []
+    pending = []
+    for index, scan in enumerate(scans):
+        access_type = AccessType(scan.access_type.value)
+        guardian_id = scan.guardian_id
+        staff_id = scan.staff_id
+        authorized_by = AuthorizedBy.MANUAL
+        error = None
+        
+        if scan.student_id not in students:
+            error = f"No se encontró un alumno con ID {scan.student_id}"
+        elif scan.qr_code:
+            qr_code = qr_codes.get(scan.qr_code)
+            scan_time = scanned_at[index] if scanned_at else now
+            if not qr_code or (qr_code.expires_at and qr_code.expires_at < scan_time):
+                error = "Código QR inválido o expirado"
+            else:
+                guardian_id = qr_code.guardian_id
+                authorized_by = AuthorizedBy.QR_CODE
+        elif access_type == AccessType.SALIDA and not guardian_id and not staff_id:
+            error = "Se requiere un método de autorización"
+        
+        if access_type == AccessType.ENTRADA and staff_id is None:
+            staff_id = default_staff_id
+        
+        results.append(AccessBatchItemResult(
+            index=index,
+            student_id=scan.student_id,
+            success=error is None,
+            message=error or ""
+        ))
+        if error is None:
+            pending.append((index, scan, access_type, guardian_id, authorized_by, staff_id))
+    
+    guardian_ids = {item[3] for item in pending if item[3]}
+    existing_guardians = set()
+    links = set()
+    if guardian_ids:
+        existing_guardians = {
+            row.id for row in db.query(Guardian.id).filter(Guardian.id.in_(guardian_ids))
+        }
+        links = {
+            (row.guardian_id, row.student_id)
+            for row in db.execute(
+                select(guardian_student.c.guardian_id, guardian_student.c.student_id).where(
+                    guardian_student.c.guardian_id.in_(guardian_ids),
+                    guardian_student.c.student_id.in_(student_ids)
+                )
+            )
+        }
+    
+    # Sin horas de lectura, todos los registros del lote comparten la hora del servidor
+    if scanned_at:
+        timestamps = scanned_at
+        presence_dates = [get_presence_date(utc_to_local(moment)) for moment in scanned_at]
+    else:
+        timestamps = [db.scalar(select(func.now()))] * len(scans)
+        presence_dates = [get_presence_date()] * len(scans)
+    presences = {
+        (presence.student_id, presence.date): presence
+        for presence in db.query(DailyPresence).filter(
+            DailyPresence.date.in_(set(presence_dates)),
+            DailyPresence.student_id.in_(student_ids)
+        )
+    }
+    
+    created = []
+    for index, scan, access_type, guardian_id, authorized_by, staff_id in pending:
+        result = results[index]
+        if guardian_id:
+            if guardian_id not in existing_guardians:
+                result.success = False
+                result.message = f"No se encontró un tutor con ID {guardian_id}"
+                continue
+            if (guardian_id, scan.student_id) not in links:
+                result.success = False
+                result.message = "El tutor no está autorizado para este alumno"
+                continue
+        
+        access_log = AccessLog(
+            student_id=scan.student_id,
+            access_type=access_type,
+            timestamp=timestamps[index],
+            guardian_id=guardian_id,
+            authorized_by=authorized_by,
+            authorized_by_staff_id=staff_id,
+            notes=scan.notes
+        )
+        db.add(access_log)
+        created.append((index, result, access_log))
+    
+    if created:
+        db.flush()
+        for index, result, access_log in created:
+            student = students[access_log.student_id]
+            presence_key = (student.id, presence_dates[index])
+            presence = apply_presence(
+                presences.get(presence_key),
+                student_id=student.id,
+                school_id=student.school_id,
+                access_type=access_log.access_type,
+                timestamp=timestamps[index],
+                access_log_id=access_log.id,
+                presence_date=presence_dates[index]
+            )
+            presences[presence_key] = presence
+            db.add(presence)
+            enqueue_access_event(access_log, db)
+            
+            action = "entrada" if access_log.access_type == AccessType.ENTRADA else "salida"
+            result.access_log_id = access_log.id
+            result.message = f"Se ha registrado la {action} del alumno {student.full_name()}"
+        
+        if commit:
+            db.commit()
+            access_outbox_worker.wake()
+        else:
+            db.flush()
+    
+    failed = sum(1 for result in results if not result.success)
+    return AccessBatchResponse(
+        processed=len(results) - failed,
+        failed=failed,
+        results=results
+    )
+
+def get_student_access_logs(student_id: int, limit: int, db: Session, cursor: Optional[str] = None):
+    """
+    Obtiene una página de registros de acceso de un alumno, del más reciente al más antiguo.
+    
+    Recorre también los cursos archivados, así que el historial no se corta al archivar.
     
     Args:
         student_id: ID del alumno
         limit: Número máximo de registros a devolver
         db: Sesión de base de datos
+        cursor: Cursor devuelto por la página anterior
         
     Returns:
-        Lista de registros de acceso
+        Tupla con (lista de registros de acceso, cursor de la página siguiente o None)
+        
+    Raises:
+        ValueError: Si el cursor no es válido
     """
-    return db.query(AccessLog).filter(
-        AccessLog.student_id == student_id
-    ).order_by(
-        AccessLog.timestamp.desc()
-    ).limit(limit).all() 
\ No newline at end of file
+    limit = page_limit(limit)
+    logs = access_log_source()
+    rows = db.execute(
+        select(logs).where(
+            logs.c.student_id == student_id,
+            *keyset_criteria(logs.c.timestamp, logs.c.id, cursor, descending=True)
+        ).order_by(
+            *keyset_order(logs.c.timestamp, logs.c.id, descending=True)
+        ).limit(limit + 1)
+    ).all()
+    return split_page(rows, limit, key=lambda log: (log.timestamp, log.id))
@@ -3,13 +3,15 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from typing import Optional
 
-from app.models import User, Staff
+from app.models import User
 from app.database import get_db
 from app.schemas.user import TokenData
 from app.core.config import settings
+from app.services.principal_cache import principal_cache
+from app.services.password_hasher import password_hasher
 
 # Configuración para JWT
 SECRET_KEY = settings.SECRET_KEY
@@ -28,6 +30,14 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    """``verify_password`` en el pool de hash, sin bloquear el event loop."""
+    return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """``get_password_hash`` en el pool de hash, sin bloquear el event loop."""
+    return await password_hasher.run(pwd_context.hash, password)
+
 def get_user(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
@@ -39,6 +49,20 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(db: Session, email: str, password: str):
+    user = get_user(db, email)
+    if not user:
+        return False
+    hashed_password = user.hashed_password
+    # Devolver la conexión al pool durante la espera: con muchos inicios de sesión
+    # en cola el pool se agotaría y el siguiente checkout bloquearía el event loop.
+    # Solo se ha leído: close() separa el usuario sin caducar sus atributos (commit
+    # los caducaría y se volverían a consultar) y la sesión puede seguir usándose
+    db.close()
+    if not await verify_password_async(password, hashed_password):
+        return False
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -64,15 +88,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
     
-    user = (
-        db.query(User)
-        .options(
-            joinedload(User.staff_profile).joinedload(Staff.school),
-            joinedload(User.guardian_profile)
-        )
-        .filter(User.email == token_data.email)
-        .first()
-    )
+    # Sin consulta si el usuario ya está en la caché de usuarios autenticados
+    user = principal_cache.get(db, token_data.email)
     
     if user is None:
         raise credentials_exception
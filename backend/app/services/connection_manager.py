@@ -0,0 +1,454 @@
+from fastapi import WebSocket
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from app.models import User, Classroom
+from app.core.config import settings
+from app.services.principal_cache import principal_cache
+from app.services.websocket_backplane import Backplane, create_backplane
+
+logger = logging.getLogger(__name__)
+
+# Topic kinds a socket can subscribe to, as "<kind>:<id>"
+TOPIC_KINDS = ("user", "school", "classroom")
+
+def user_topic(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def school_topic(school_id: int) -> str:
+    return f"school:{school_id}"
+
+def classroom_topic(classroom_id: int) -> str:
+    return f"classroom:{classroom_id}"
+
+def parse_topic(topic: str) -> Optional[Tuple[str, int]]:
+    """Split a topic into (kind, id), or None if it is not a valid topic"""
+    if not isinstance(topic, str):
+        return None
+    kind, _, raw_id = topic.partition(":")
+    if kind not in TOPIC_KINDS or not raw_id.isdigit():
+        return None
+    return kind, int(raw_id)
+
+class _Connection:
+    """A socket with its bounded outbound queue, the task that writes it and its liveness"""
+    __slots__ = (
+        "websocket", "user_id", "expires_at", "queue", "writer", "dropped", "last_seen", "ping_sent_at"
+    )
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: Optional[int],
+        expires_at: Optional[float],
+        queue_size: int,
+        now: float
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Expiry of the token the socket authenticated with (epoch seconds)
+        self.expires_at = expires_at
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.last_seen = now
+        self.ping_sent_at: Optional[float] = None
+
+class ConnectionManager:
+    """
+    Active WebSocket connections and their topic subscriptions.
+
+    Each topic keeps the set of sockets subscribed to it, so publishing an event
+    costs as many sends as there are subscribers, whatever the total number of
+    connections. A reverse index per socket makes disconnecting proportional to
+    its own subscriptions. Sockets are also indexed by their authenticated user
+    (a parent may have the app open on several devices), and ``user:<id>`` events
+    go to all of that user's sockets without a subscription.
+
+    Every connection has a bounded outbound queue drained by its own writer task,
+    so publishing never waits on a socket and a slow client only delays itself.
+    When a client's queue is full it is disconnected (it reconnects and reloads)
+    or, with the ``drop_oldest`` policy, loses its oldest pending messages.
+
+    With a backplane, ``publish`` and ``broadcast`` go through it so that every
+    worker delivers the event to the sockets it holds; without one they are
+    delivered in this process only.
+
+    A heartbeat task pings the sockets that have been silent for
+    ``heartbeat_interval`` seconds and reaps those that do not answer within
+    ``heartbeat_timeout``, so half-open connections do not linger until a send
+    happens to fail on them. Any message from the client counts as an answer.
+
+    Sockets are authenticated once, when they open. So the heartbeat also closes
+    those whose token has expired. When a user or their profile changes (e.g. they
+    are deactivated), every worker closes that user's sockets. The client
+    reconnects and authenticates again.
+    """
+
+    # Topic of the events for every connection
+    BROADCAST_TOPIC = "*"
+    # Control topic: the message is the ID of a user whose sockets must be closed
+    REVOKE_TOPIC = "revoke"
+
+    def __init__(
+        self,
+        queue_size: int = None,
+        slow_client_policy: str = None,
+        backplane: Backplane = None,
+        heartbeat_interval: float = None,
+        heartbeat_timeout: float = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.queue_size = settings.WEBSOCKET_SEND_QUEUE_SIZE if queue_size is None else queue_size
+        self.slow_client_policy = (
+            settings.WEBSOCKET_SLOW_CLIENT_POLICY if slow_client_policy is None else slow_client_policy
+        )
+        self.active_connections: Dict[WebSocket, _Connection] = {}
+        self.user_connections: Dict[int, Set[WebSocket]] = {}
+        self.topics: Dict[str, Set[WebSocket]] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.heartbeat_interval = (
+            settings.WEBSOCKET_HEARTBEAT_INTERVAL_SECONDS if heartbeat_interval is None else heartbeat_interval
+        )
+        self.heartbeat_timeout = (
+            settings.WEBSOCKET_HEARTBEAT_TIMEOUT_SECONDS if heartbeat_timeout is None else heartbeat_timeout
+        )
+        self.clock = clock
+        self.dropped_messages = 0
+        self.slow_disconnects = 0
+        self.pings_sent = 0
+        self.reaped = 0
+        self.expired = 0
+        self.revoked = 0
+        self.backplane = backplane
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Join the backplane (at startup); without it events stay in this process"""
+        self._loop = asyncio.get_running_loop()
+        if self.backplane is not None:
+            try:
+                await self.backplane.start(self.deliver)
+            except Exception as e:
+                logger.error(f"WebSocket backplane not available, delivering locally only: {e}")
+                self.backplane = None
+        if self.heartbeat_interval > 0 and self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        if self.backplane is not None:
+            await self.backplane.stop()
+
+    async def _run_heartbeat(self):
+        # Ticks short enough to reap an unanswered ping close to its timeout
+        tick = min(self.heartbeat_interval, self.heartbeat_timeout) / 2
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                self.check_heartbeats()
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat error: {e}")
+
+    def check_heartbeats(self) -> int:
+        """Ping silent sockets and reap the ones whose ping went unanswered; returns how many were reaped"""
+        now = self.clock()
+        wall_now = time.time()
+        ping = json.dumps({"type": "ping"})
+        dead = []
+        expired = []
+        for websocket, connection in self.active_connections.items():
+            if connection.expires_at is not None and wall_now >= connection.expires_at:
+                expired.append(websocket)
+            elif connection.ping_sent_at is not None:
+                if now - connection.ping_sent_at >= self.heartbeat_timeout:
+                    dead.append(websocket)
+            elif now - connection.last_seen >= self.heartbeat_interval:
+                connection.ping_sent_at = now
+                self.pings_sent += 1
+                try:
+                    connection.queue.put_nowait(ping)
+                except asyncio.QueueFull:
+                    # A client this far behind will not answer in time either
+                    pass
+
+        for websocket in dead:
+            self.reaped += 1
+            self.disconnect(websocket)
+            asyncio.get_running_loop().create_task(self._close(websocket, 1001))  # Going away
+        if dead:
+            logger.info(f"Reaped {len(dead)} unresponsive WebSocket connections")
+
+        for websocket in expired:
+            self.expired += 1
+            self.disconnect(websocket)
+            asyncio.get_running_loop().create_task(self._close(websocket, 1008))  # Policy violation
+        return len(dead)
+
+    def touch(self, websocket: WebSocket):
+        """Record that a client is alive (it sent something)"""
+        connection = self.active_connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = self.clock()
+            connection.ping_sent_at = None
+
+    def stats(self) -> dict:
+        """Live connections, pending sends and the connections dropped or reaped so far"""
+        depths = [connection.queue.qsize() for connection in self.active_connections.values()]
+        return {
+            "connections": len(self.active_connections),
+            "users": len(self.user_connections),
+            "topics": len(self.topics),
+            "queued_messages": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped_messages": self.dropped_messages,
+            "slow_disconnects": self.slow_disconnects,
+            "pings_sent": self.pings_sent,
+            "reaped": self.reaped,
+            "expired": self.expired,
+            "revoked": self.revoked
+        }
+
+    async def connect(self, websocket: WebSocket, user_id: int = None, expires_at: float = None):
+        await websocket.accept()
+        self._loop = asyncio.get_running_loop()
+        connection = _Connection(websocket, user_id, expires_at, self.queue_size, self.clock())
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.active_connections[websocket] = connection
+        if user_id is not None:
+            self.user_connections.setdefault(user_id, set()).add(websocket)
+        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.active_connections.pop(websocket, None)
+        if connection is not None:
+            if connection.writer is not asyncio.current_task():
+                connection.writer.cancel()
+            sockets = self.user_connections.get(connection.user_id)
+            if sockets is not None:
+                sockets.discard(websocket)
+                if not sockets:
+                    del self.user_connections[connection.user_id]
+        self.unsubscribe(websocket)
+        if connection is not None:
+            logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+
+    async def _write(self, connection: _Connection):
+        """Writer task: send the queued messages of one socket in order"""
+        while True:
+            message = await connection.queue.get()
+            try:
+                await connection.websocket.send_text(message)
+            except Exception as e:
+                logger.error(f"Error sending WebSocket message: {e}")
+                self.disconnect(connection.websocket)
+                return
+
+    def _enqueue(self, websocket: WebSocket, message: str) -> bool:
+        """Queue a message for a socket without waiting; applies the slow client policy"""
+        connection = self.active_connections.get(websocket)
+        if connection is None:
+            return False
+        try:
+            connection.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        connection.dropped += 1
+        self.dropped_messages += 1
+        if self.slow_client_policy == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.put_nowait(message)
+            return True
+
+        self.slow_disconnects += 1
+        logger.warning("Disconnecting slow WebSocket client with a full send queue")
+        self.disconnect(websocket)
+        asyncio.get_running_loop().create_task(self._close(websocket, 1013))  # Try again later
+        return False
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> Set[str]:
+        """Subscribe a socket to topics; returns all of its subscriptions"""
+        subscribed = self.subscriptions.setdefault(websocket, set())
+        for topic in topics:
+            self.topics.setdefault(topic, set()).add(websocket)
+            subscribed.add(topic)
+        return subscribed
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str] = None) -> Set[str]:
+        """Unsubscribe a socket from topics (all of them if none are given)"""
+        subscribed = self.subscriptions.get(websocket, set())
+        for topic in list(subscribed if topics is None else topics):
+            subscribed.discard(topic)
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.topics[topic]
+        if not subscribed:
+            self.subscriptions.pop(websocket, None)
+        return subscribed
+
+    def publish(self, topic: str, message: str):
+        """Send a message to the sockets subscribed to a topic, in every worker"""
+        if self.backplane is not None:
+            self.backplane.publish(topic, message)
+        else:
+            self.deliver(topic, message)
+
+    def deliver(self, topic: str, message: str) -> int:
+        """Queue a message for this process' sockets of a topic; returns how many took it"""
+        if topic == self.REVOKE_TOPIC:
+            return self._close_user(int(message))
+        if topic == self.BROADCAST_TOPIC:
+            subscribers = self.active_connections
+        else:
+            subscribers = self.topics.get(topic, set())
+            parsed = parse_topic(topic)
+            if parsed is not None and parsed[0] == "user":
+                subscribers = subscribers | self.user_connections.get(parsed[1], set())
+        return sum(self._enqueue(connection, message) for connection in list(subscribers))
+
+    def _close_user(self, user_id: int) -> int:
+        """Close this process' sockets of a user; returns how many there were"""
+        sockets = list(self.user_connections.get(user_id, ()))
+        for websocket in sockets:
+            self.revoked += 1
+            self.disconnect(websocket)
+            asyncio.get_running_loop().create_task(self._close(websocket, 1008))  # Policy violation
+        return len(sockets)
+
+    def revoke_users(self, user_ids: Iterable[int]):
+        """Close the sockets of these users in every worker; can be called from any thread"""
+        for user_id in user_ids:
+            self.publish_threadsafe(self.REVOKE_TOPIC, str(user_id))
+
+    def publish_threadsafe(self, topic: str, message: str):
+        """``publish`` from any thread, e.g. a sync route running in the threadpool"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # No socket has connected in this process
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.publish(topic, message)
+        else:
+            loop.call_soon_threadsafe(self.publish, topic, message)
+
+    def send_personal_message(self, message: str, websocket: WebSocket):
+        self._enqueue(websocket, message)
+
+    def broadcast(self, message: str):
+        self.publish(self.BROADCAST_TOPIC, message)
+
+    def send_to_user(self, user_id: int, message: str):
+        """Send a message to every socket of a user, in every worker"""
+        self.publish(user_topic(user_id), message)
+
+manager = ConnectionManager(backplane=create_backplane(settings.WEBSOCKET_BACKPLANE_URL))
+# Committed changes to a user or their profiles close the user's sockets
+principal_cache.add_listener(manager.revoke_users)
+
+def authorize_topics(user: Optional[User], topics: Iterable[str], db: Session) -> Tuple[List[str], List[str]]:
+    """
+    Split the requested topics into the ones the user may follow and the rest.
+
+    Admins may follow any topic, staff their school and its classrooms, and every
+    user their own topic. Without a user nothing is allowed.
+    """
+    granted, denied = [], []
+    requested = []
+    for topic in dict.fromkeys(topic for topic in topics if isinstance(topic, str)):
+        parsed = parse_topic(topic)
+        if parsed is None or user is None or not user.is_active:
+            denied.append(topic)
+        else:
+            requested.append((topic, *parsed))
+
+    staff_school_id = user.staff_profile.school_id if user is not None and user.staff_profile else None
+    classroom_ids = [topic_id for _, kind, topic_id in requested if kind == "classroom"]
+    classroom_schools = {}
+    if classroom_ids and staff_school_id is not None and not user.is_admin:
+        classroom_schools = dict(
+            db.query(Classroom.id, Classroom.school_id).filter(Classroom.id.in_(classroom_ids)).all()
+        )
+
+    for topic, kind, topic_id in requested:
+        if user.is_admin:
+            allowed = True
+        elif kind == "user":
+            allowed = topic_id == user.id
+        elif kind == "school":
+            allowed = staff_school_id is not None and topic_id == staff_school_id
+        else:
+            allowed = staff_school_id is not None and classroom_schools.get(topic_id) == staff_school_id
+        (granted if allowed else denied).append(topic)
+    return granted, denied
+
+def default_topics(user: User) -> List[str]:
+    """Topics followed on connecting, besides the user's own: the school of staff members"""
+    if user.staff_profile and user.staff_profile.school_id:
+        return [school_topic(user.staff_profile.school_id)]
+    return []
+
+class WebSocketPrincipal(NamedTuple):
+    """User behind a WebSocket, as checked when it was opened"""
+    user_id: int
+    email: str
+    topics: List[str]
+    # Token expiry as epoch seconds, or None if the token does not expire
+    expires_at: Optional[float]
+
+def authenticate_websocket(token: Optional[str], db: Session) -> Optional[WebSocketPrincipal]:
+    """
+    Check the access token sent when opening a WebSocket.
+
+    Returns:
+        The user and their default topics, or None if the token is not valid
+        or the user is inactive
+    """
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    user = principal_cache.get(db, email) if email else None
+    if user is None or not user.is_active:
+        return None
+    return WebSocketPrincipal(user.id, user.email, default_topics(user), payload.get("exp"))
+
+def authorize_subscription(
+    email: str,
+    topics: Optional[Iterable[str]],
+    db: Session
+) -> Tuple[List[str], List[str]]:
+    """``authorize_topics`` for the authenticated user of a socket (its default topics if none)"""
+    user = principal_cache.get(db, email)
+    if topics is None:
+        topics = default_topics(user) if user is not None else []
+    return authorize_topics(user, topics, db)
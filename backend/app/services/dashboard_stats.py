@@ -0,0 +1,169 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, event, inspect
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+from datetime import date
+import asyncio
+import threading
+import time
+
+from app.models import DailyPresence, PresenceStatus, Student
+from app.core.config import settings
+
+_DIRTY_KEY = "dashboard_stats_dirty"
+_ALL = "all"
+
+StatsKey = Tuple[Optional[int], date]
+
+def compute_dashboard_stats(db: Session, stats_date: date, school_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Calcula los contadores del dashboard con una sola consulta agregada.
+
+    Args:
+        db: Sesión de base de datos
+        stats_date: Día de asistencia
+        school_id: Restringir a una escuela (None para todas)
+
+    Returns:
+        Diccionario con ``total_students``, ``present``, ``entered`` y ``exited``
+    """
+    total_students = select(func.count(Student.id))
+    if school_id is not None:
+        total_students = total_students.where(Student.school_id == school_id)
+
+    query = select(
+        total_students.scalar_subquery(),
+        func.count(DailyPresence.first_entry_at),
+        func.count(DailyPresence.last_exit_at),
+        func.coalesce(func.sum(
+            case((DailyPresence.status == PresenceStatus.PRESENTE, 1), else_=0)
+        ), 0)
+    ).where(DailyPresence.date == stats_date)
+    if school_id is not None:
+        query = query.where(DailyPresence.school_id == school_id)
+
+    total, entered, exited, present = db.execute(query).one()
+    return {
+        "total_students": int(total or 0),
+        "present": int(present or 0),
+        "entered": int(entered or 0),
+        "exited": int(exited or 0)
+    }
+
+class DashboardStatsCache:
+    """
+    Caché de corta duración de los contadores del dashboard por (escuela, día).
+
+    Las peticiones simultáneas de la misma clave esperan a un único cálculo, y las
+    transacciones que cambian la presencia o los alumnos invalidan sus claves al
+    confirmarse. El contador de generación evita guardar un resultado calculado
+    antes de una invalidación.
+    """
+
+    def __init__(self, ttl_seconds: float = None):
+        self.ttl_seconds = settings.DASHBOARD_STATS_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: Dict[StatsKey, Tuple[float, Dict[str, int]]] = {}
+        self._inflight: Dict[StatsKey, asyncio.Future] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key: StatsKey, compute: Callable[[], Awaitable[Dict[str, int]]]) -> Dict[str, int]:
+        """
+        Devuelve los contadores de ``key``, calculándolos si no están en caché.
+
+        Args:
+            key: Tupla (ID de escuela o None, día)
+            compute: Función que devuelve un awaitable con los contadores, p. ej.
+                ``lambda: db.run_sync(...)`` con la sesión asíncrona de la petición
+
+        Returns:
+            Copia de los contadores
+        """
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] > time.monotonic():
+                return dict(cached[1])
+            generation = self._generation
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return dict(await asyncio.shield(inflight))
+            except asyncio.CancelledError:
+                # El cálculo compartido se canceló (su cliente se desconectó), no esta
+                # petición: repetirlo en lugar de propagar la cancelación
+                task = asyncio.current_task()
+                if not inflight.cancelled() or getattr(task, "cancelling", lambda: 0)():
+                    raise
+                return await self.get(key, compute)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            stats = await compute()
+            with self._lock:
+                if generation == self._generation and self.ttl_seconds > 0:
+                    now = time.monotonic()
+                    # Descartar las entradas caducadas para que no se acumulen días y escuelas
+                    for expired in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+                        del self._entries[expired]
+                    self._entries[key] = (now + self.ttl_seconds, stats)
+            future.set_result(stats)
+            return dict(stats)
+        except Exception as e:
+            future.set_exception(e)
+            # Marcar la excepción como recuperada aunque nadie más la espere
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            if not future.done():
+                # Cancelado (p. ej. CancelledError al desconectarse el cliente): sin esto
+                # las peticiones que esperan el mismo cálculo no terminarían nunca
+                future.cancel()
+
+    def invalidate(self, keys: Set[StatsKey] = None):
+        """Descarta las claves indicadas (todas si no se indica ninguna); seguro desde cualquier hilo."""
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._entries.clear()
+                return
+            for school_id, stats_date in keys:
+                self._entries.pop((school_id, stats_date), None)
+                # Los totales de todas las escuelas también cambian
+                self._entries.pop((None, stats_date), None)
+
+dashboard_stats_cache = DashboardStatsCache()
+
+def _collect_after_flush(session: Session, flush_context):
+    """Anota en la sesión qué contadores cambian; se invalidan al confirmar."""
+    dirty = session.info.get(_DIRTY_KEY)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, DailyPresence):
+            if dirty is None:
+                dirty = session.info.setdefault(_DIRTY_KEY, set())
+            dirty.add((instance.school_id, instance.date))
+        elif isinstance(instance, Student) and (
+            instance in session.new
+            or instance in session.deleted
+            or inspect(instance).attrs.school_id.history.has_changes()
+        ):
+            # El total de alumnos cambia en todos los días
+            session.info[_DIRTY_KEY] = dirty = {_ALL}
+
+def _invalidate_after_commit(session: Session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        dashboard_stats_cache.invalidate(None if _ALL in dirty else dirty)
+
+def _discard_after_rollback(session: Session):
+    session.info.pop(_DIRTY_KEY, None)
+
+for _name, _listener in (
+    ("after_flush", _collect_after_flush),
+    ("after_commit", _invalidate_after_commit),
+    ("after_rollback", _discard_after_rollback)
+):
+    if not event.contains(Session, _name, _listener):
+        event.listen(Session, _name, _listener)
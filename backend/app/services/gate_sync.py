@@ -0,0 +1,229 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_, exists
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timezone
+
+from app.models import GateScanReceipt, QRCode, QRCodeRevocation, Student
+from app.schemas.access import (
+    AccessScan,
+    GateScanEvent,
+    GateScanResult,
+    GateSyncResponse,
+    GateSyncUpload
+)
+from app.services.access_service import register_access_batch
+from app.services.access_outbox import access_outbox_worker
+
+def parse_sync_version(version: Optional[str]) -> Tuple[int, int]:
+    """
+    Decodifica la versión ``<último QR>.<última revocación>`` devuelta por ``build_qr_delta``.
+
+    Raises:
+        ValueError: Si la versión no es válida
+    """
+    if not version:
+        return 0, 0
+    try:
+        qr_version, revocation_version = (int(part) for part in version.split("."))
+    except ValueError:
+        raise ValueError("Versión de sincronización inválida")
+    if qr_version < 0 or revocation_version < 0:
+        raise ValueError("Versión de sincronización inválida")
+    return qr_version, revocation_version
+
+def build_qr_delta(db: Session, since: Optional[str] = None, school_id: Optional[int] = None) -> dict:
+    """
+    Códigos QR válidos y revocaciones nuevos desde una versión, para validar sin conexión.
+
+    Los códigos solo se insertan y las revocaciones solo se añaden, así que la versión
+    es el último ID de cada tabla que el escáner ya tiene. Sin versión se devuelven
+    todos los códigos vigentes. El escáner descarta por sí mismo los códigos expirados.
+
+    Args:
+        db: Sesión de base de datos
+        since: Versión devuelta por la sincronización anterior (None para empezar)
+        school_id: Restringir a los alumnos de una escuela
+
+    Returns:
+        Diccionario con ``version``, ``full``, ``codes``, ``students`` y ``revoked``
+
+    Raises:
+        ValueError: Si la versión no es válida
+    """
+    qr_version, revocation_version = parse_sync_version(since)
+    # Fijar primero los límites para que la versión devuelta cubra exactamente lo enviado
+    last_qr = db.scalar(select(func.max(QRCode.id))) or 0
+    last_revocation = db.scalar(select(func.max(QRCodeRevocation.id))) or 0
+    now = datetime.utcnow()
+
+    revoked = exists().where(QRCodeRevocation.qr_code_id == QRCode.id)
+    query = select(
+        QRCode.id,
+        QRCode.code,
+        QRCode.guardian_id,
+        QRCode.student_id,
+        QRCode.expires_at,
+        Student.first_name,
+        Student.last_name,
+        Student.enrollment_id
+    ).join(
+        Student, Student.id == QRCode.student_id
+    ).where(
+        QRCode.id > qr_version,
+        QRCode.id <= last_qr,
+        QRCode.is_active.is_(True),
+        or_(QRCode.expires_at.is_(None), QRCode.expires_at >= now),
+        ~revoked
+    )
+    if school_id is not None:
+        query = query.where(Student.school_id == school_id)
+    rows = db.execute(query.order_by(QRCode.id)).all()
+
+    revoked_ids = []
+    if since:
+        revocations = select(QRCodeRevocation.qr_code_id).join(
+            QRCode, QRCode.id == QRCodeRevocation.qr_code_id
+        ).join(
+            Student, Student.id == QRCode.student_id
+        ).where(
+            QRCodeRevocation.id > revocation_version,
+            QRCodeRevocation.id <= last_revocation
+        )
+        if school_id is not None:
+            revocations = revocations.where(Student.school_id == school_id)
+        revoked_ids = list(db.scalars(revocations.order_by(QRCodeRevocation.id)))
+
+    students: Dict[int, dict] = {}
+    for row in rows:
+        students.setdefault(row.student_id, {
+            "id": row.student_id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "enrollment_id": row.enrollment_id
+        })
+
+    return {
+        "version": f"{last_qr}.{last_revocation}",
+        "full": not since,
+        "codes": [
+            {
+                "id": row.id,
+                "code": row.code,
+                "guardian_id": row.guardian_id,
+                "student_id": row.student_id,
+                "expires_at": row.expires_at.isoformat() if row.expires_at else None
+            }
+            for row in rows
+        ],
+        "students": list(students.values()),
+        "revoked": revoked_ids
+    }
+
+def _scanned_at_utc(event: GateScanEvent, now: datetime) -> datetime:
+    """Hora UTC sin zona de una lectura; las horas sin zona se toman como UTC."""
+    scanned_at = event.scanned_at
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    # Un reloj del dispositivo adelantado no puede crear registros en el futuro
+    return min(scanned_at, now)
+
+def reconcile_scan_events(
+    upload: GateSyncUpload,
+    staff_id: Optional[int],
+    db: Session,
+    retry: bool = True
+) -> GateSyncResponse:
+    """
+    Registra las lecturas subidas por un escáner, una sola vez cada una.
+
+    Las lecturas ya recibidas (mismo dispositivo e ID de lectura) devuelven el resultado
+    guardado. Las nuevas se registran en orden cronológico con su hora de lectura,
+    con las mismas reglas que ``register_access_batch``, y su resultado se guarda en
+    la misma transacción que los registros de acceso.
+
+    Args:
+        upload: Lote del escáner
+        staff_id: ID del personal que sube el lote, usado en las entradas
+        db: Sesión de base de datos
+        retry: Reintentar una vez si otra subida del mismo lote se confirma a la vez
+
+    Returns:
+        Resultado por lectura, en el orden del lote y sin repetidos
+    """
+    events: Dict[str, GateScanEvent] = {}
+    for event in upload.events:
+        events.setdefault(event.client_event_id, event)
+
+    receipts = {
+        receipt.client_event_id: receipt
+        for receipt in db.query(GateScanReceipt).filter(
+            GateScanReceipt.device_id == upload.device_id,
+            GateScanReceipt.client_event_id.in_(events.keys())
+        )
+    }
+
+    now = datetime.utcnow()
+    new_events = sorted(
+        (event for event in events.values() if event.client_event_id not in receipts),
+        key=lambda event: _scanned_at_utc(event, now)
+    )
+    fresh = set()
+    if new_events:
+        scanned_at = [_scanned_at_utc(event, now) for event in new_events]
+        batch = register_access_batch(
+            [
+                AccessScan(
+                    student_id=event.student_id,
+                    access_type=event.access_type,
+                    qr_code=event.qr_code,
+                    guardian_id=event.guardian_id,
+                    notes=event.notes
+                )
+                for event in new_events
+            ],
+            staff_id,
+            db,
+            scanned_at=scanned_at,
+            commit=False
+        )
+        for event, moment, result in zip(new_events, scanned_at, batch.results):
+            receipt = GateScanReceipt(
+                device_id=upload.device_id,
+                client_event_id=event.client_event_id,
+                access_log_id=result.access_log_id,
+                success=result.success,
+                message=result.message,
+                scanned_at=moment
+            )
+            db.add(receipt)
+            receipts[event.client_event_id] = receipt
+            fresh.add(event.client_event_id)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if not retry:
+                raise
+            # Otra subida del mismo lote se adelantó: sus resultados ya están guardados
+            return reconcile_scan_events(upload, staff_id, db, retry=False)
+        access_outbox_worker.wake()
+
+    results = [
+        GateScanResult(
+            client_event_id=client_event_id,
+            success=receipts[client_event_id].success,
+            message=receipts[client_event_id].message or "",
+            access_log_id=receipts[client_event_id].access_log_id,
+            duplicate=client_event_id not in fresh
+        )
+        for client_event_id in events
+    ]
+    duplicates = sum(1 for result in results if result.duplicate)
+    failed = sum(1 for result in results if not result.success and not result.duplicate)
+    return GateSyncResponse(
+        processed=len(results) - duplicates - failed,
+        failed=failed,
+        duplicates=duplicates,
+        results=results
+    )
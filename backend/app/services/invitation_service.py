@@ -1,10 +1,11 @@
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from app.models import Invitation, InvitationType, User, Guardian, Staff
 from app.services.auth import get_password_hash
 from app.schemas.invitation import InvitationCreate
+from app.services.pagination import page_limit, keyset_criteria, keyset_order, split_page
 from app.core.config import settings
 
 def create_invitation(
@@ -88,7 +89,8 @@ def complete_registration(
     first_name: str,
     last_name: str,
     password: str,
-    phone: Optional[str] = None
+    phone: Optional[str] = None,
+    hashed_password: Optional[str] = None
 ) -> Optional[User]:
     """
     Completa el registro de un usuario a partir de una invitación.
@@ -100,6 +102,7 @@ def complete_registration(
         last_name: Apellido del usuario
         password: Contraseña del usuario
         phone: Teléfono (opcional)
+        hashed_password: Hash de ``password`` ya calculado (opcional)
         
     Returns:
         Usuario creado si todo es correcto, None en caso contrario
@@ -114,7 +117,7 @@ def complete_registration(
     # Crear usuario
     user = User(
         email=invitation.email,
-        hashed_password=get_password_hash(password),
+        hashed_password=hashed_password or get_password_hash(password),
         first_name=first_name,
         last_name=last_name,
         is_active=True,
@@ -171,9 +174,31 @@ def generate_invitation_url(base_url: str, token: str) -> str:
     """
     return f"{base_url}/register?token={token}"
 
-def get_all_invitations(db: Session) -> List[Invitation]:
-    """Retrieve all invitations from the database."""
-    return db.query(Invitation).order_by(Invitation.created_at.desc()).all()
+def get_invitations_page(
+    db: Session,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[Invitation], Optional[str]]:
+    """Retrieve one page of invitations, newest first.
+    
+    Args:
+        db: Database session.
+        limit: Page size.
+        cursor: Cursor returned with the previous page.
+        
+    Returns:
+        Tuple of (invitations, cursor for the next page or None).
+        
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    limit = page_limit(limit)
+    invitations = db.query(Invitation).filter(
+        *keyset_criteria(Invitation.created_at, Invitation.id, cursor, descending=True)
+    ).order_by(
+        *keyset_order(Invitation.created_at, Invitation.id, descending=True)
+    ).limit(limit + 1).all()
+    return split_page(invitations, limit, key=lambda inv: (inv.created_at, inv.id))
 
 def delete_invitation_by_id(db: Session, invitation_id: int) -> bool:
     """Delete an invitation by its ID."""
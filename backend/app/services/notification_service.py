@@ -23,44 +23,36 @@ class NotificationService:
         
         return notification
     
+    @staticmethod
+    def build_notification_message(notification: Notification) -> str:
+        """Serialize a notification as the WebSocket message sent to clients"""
+        notification_data = {
+            "id": notification.id,
+            "title": notification.title,
+            "message": notification.message,
+            "type": notification.type,
+            "read": notification.read,
+            "user_id": notification.user_id,
+            "created_at": notification.created_at.isoformat()
+        }
+        
+        return json.dumps({
+            "type": "notification",
+            "data": notification_data,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    
     def _broadcast_notification(self, notification: Notification):
-        """Broadcast notification via WebSocket"""
+        """Send notification via WebSocket to every socket of its user"""
         try:
-            # Import here to avoid circular imports
-            from ..main import manager
-            
-            notification_data = {
-                "id": notification.id,
-                "title": notification.title,
-                "message": notification.message,
-                "type": notification.type,
-                "read": notification.read,
-                "user_id": notification.user_id,
-                "created_at": notification.created_at.isoformat()
-            }
-            
-            # Create the message to broadcast
-            message = json.dumps({
-                "type": "notification",
-                "data": notification_data,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            from .connection_manager import manager, user_topic
             
-            # Use asyncio to send the message
-            import asyncio
+            # Create the message to publish
+            message = self.build_notification_message(notification)
+            topic = user_topic(notification.user_id)
             
-            # If there's a running event loop, schedule the broadcast
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    # Schedule the broadcast as a task
-                    asyncio.create_task(manager.broadcast(message))
-                else:
-                    # Run the broadcast in a new event loop
-                    asyncio.run(manager.broadcast(message))
-            except RuntimeError:
-                # No event loop running, create one
-                asyncio.run(manager.broadcast(message))
+            # Queued on the event loop that owns the sockets, from whatever thread we are in
+            manager.publish_threadsafe(topic, message)
                 
         except Exception as e:
             # Don't let broadcasting errors affect notification creation
@@ -0,0 +1,111 @@
+from sqlalchemy import select, and_, or_, func, DateTime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from datetime import datetime
+import base64
+import binascii
+import json
+
+from app.core.config import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def page_limit(limit: Optional[int]) -> int:
+    """Tamaño de página pedido, acotado al máximo configurado."""
+    if not limit or limit < 1:
+        return settings.PAGINATION_DEFAULT_LIMIT
+    return min(limit, settings.PAGINATION_MAX_LIMIT)
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Codifica la posición (valor de orden, ID) de la última fila de una página."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """
+    Decodifica un cursor de ``encode_cursor``.
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(row_id, int):
+        raise ValueError("Cursor inválido")
+    return sort_value, row_id
+
+def keyset_criteria(sort_column, id_column, cursor: Optional[str], descending: bool = False) -> list:
+    """
+    Condiciones para continuar después del cursor en el orden (``sort_column``, ``id_column``).
+
+    El valor de orden se relee de la fila del cursor por su clave primaria, de modo que
+    la comparación es exacta aunque la base de datos guarde las fechas con otro formato
+    o precisión; el valor del cursor solo se usa si esa fila ya no existe. Con un índice
+    sobre las columnas de orden, cualquier página cuesta lo mismo que la primera.
+
+    Args:
+        sort_column: Columna de orden (p. ej. ``created_at`` o ``timestamp``)
+        id_column: Clave primaria de la misma tabla, para desempatar
+        cursor: Cursor recibido (None para la primera página)
+        descending: Si el orden es descendente
+
+    Returns:
+        Lista de condiciones para ``filter``/``where`` (vacía en la primera página)
+
+    Raises:
+        ValueError: Si el cursor no es válido
+    """
+    if not cursor:
+        return []
+    sort_value, row_id = decode_cursor(cursor)
+
+    sort_expression = sort_column.expression
+    if sort_value is not None and isinstance(sort_expression.type, DateTime):
+        try:
+            sort_value = datetime.fromisoformat(sort_value)
+        except (TypeError, ValueError):
+            raise ValueError("Cursor inválido")
+
+    anchor_table = id_column.expression.table.alias()
+    anchor = func.coalesce(
+        select(anchor_table.c[sort_expression.name]).where(
+            anchor_table.c[id_column.expression.name] == row_id
+        ).scalar_subquery(),
+        sort_value
+    )
+
+    if descending:
+        return [or_(sort_column < anchor, and_(sort_column == anchor, id_column < row_id))]
+    return [or_(sort_column > anchor, and_(sort_column == anchor, id_column > row_id))]
+
+def keyset_order(sort_column, id_column, descending: bool = False) -> list:
+    """Orden que corresponde a ``keyset_criteria``."""
+    if descending:
+        return [sort_column.desc(), id_column.desc()]
+    return [sort_column.asc(), id_column.asc()]
+
+def split_page(
+    rows: Sequence,
+    limit: int,
+    key: Callable[[Any], Tuple[Any, int]]
+) -> Tuple[List, Optional[str]]:
+    """
+    Separa una página pedida con ``limit + 1`` filas y calcula el cursor siguiente.
+
+    Args:
+        rows: Filas obtenidas con un límite de ``limit + 1``
+        limit: Tamaño de página
+        key: Devuelve (valor de orden, ID) de una fila
+
+    Returns:
+        Tupla con (filas de la página, cursor siguiente o None si es la última)
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -0,0 +1,117 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+import asyncio
+import threading
+import time
+
+from app.core.config import settings
+
+class PasswordHasherBusy(Exception):
+    """Hay demasiadas operaciones de hash de contraseñas pendientes."""
+
+class PasswordHasher:
+    """
+    Pool de hilos acotado para el hash y la verificación de contraseñas.
+
+    bcrypt tarda del orden de 200 ms por operación y libera el GIL, así que se ejecuta
+    en hilos propios en lugar de en el event loop o en el pool de hilos de las rutas.
+    Como mucho hay ``workers`` operaciones a la vez y ``max_pending`` admitidas
+    (en curso o en cola); por encima se rechazan con ``PasswordHasherBusy`` para que
+    una avalancha de inicios de sesión no acumule esperas sin límite.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        self.workers = settings.PASSWORD_HASH_WORKERS if workers is None else workers
+        self.max_pending = settings.PASSWORD_HASH_MAX_PENDING if max_pending is None else max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Encola ``fn(*args)`` en el pool.
+
+        Raises:
+            PasswordHasherBusy: Si ya hay ``max_pending`` operaciones pendientes
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise PasswordHasherBusy("Demasiados inicios de sesión simultáneos, inténtalo de nuevo")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(self.workers, 1),
+                    thread_name_prefix="password-hash"
+                )
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+            executor = self._executor
+
+        queued_at = time.monotonic()
+
+        def run():
+            with self._lock:
+                self._running += 1
+                self._wait_seconds += time.monotonic() - queued_at
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        def release(future: Future):
+            # También para las operaciones canceladas antes de empezar (petición
+            # abandonada por el cliente o apagado), que nunca llegan a ``run``
+            with self._lock:
+                self._pending -= 1
+                if future.cancelled():
+                    self._cancelled += 1
+                else:
+                    self._completed += 1
+
+        try:
+            future = executor.submit(run)
+        except RuntimeError:
+            # Pool cerrado durante el apagado
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """Ejecuta ``fn(*args)`` en el pool sin bloquear el event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def call(self, fn: Callable, *args):
+        """Ejecuta ``fn(*args)`` en el pool desde código síncrono y espera el resultado."""
+        return self.submit(fn, *args).result()
+
+    def stats(self) -> dict:
+        """Métricas del pool: operaciones en cola y en curso, completadas y rechazadas."""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "peak_pending": self._peak_pending,
+                "completed": self._completed,
+                "cancelled": self._cancelled,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_seconds / self._completed * 1000, 2) if self._completed else 0.0
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,237 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func, case, inspect, text
+from typing import Optional, Dict, Tuple
+from datetime import date, datetime, time, timedelta, timezone
+
+from app.models import AccessLog, AccessType, DailyPresence, PresenceStatus, Student
+from app.services.access_archive import access_log_source
+
+def get_presence_date(moment: Optional[datetime] = None) -> date:
+    """
+    Devuelve el día de asistencia al que pertenece un momento dado.
+
+    Usa la misma convención que ``AccessLog.get_today_date``: la fecha local del servidor.
+    """
+    if moment is None:
+        return AccessLog.get_today_date().date()
+    return moment.date()
+
+def utc_to_local(moment: datetime) -> datetime:
+    """Convierte una hora UTC sin zona (como la guarda ``func.now()``) a la hora local del servidor."""
+    return moment.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def local_day_bounds_utc(presence_date: date) -> Tuple[datetime, datetime]:
+    """Inicio y fin de un día local del servidor, como horas UTC sin zona para comparar con ``timestamp``."""
+    start = datetime.combine(presence_date, time.min).astimezone(timezone.utc).replace(tzinfo=None)
+    end = datetime.combine(presence_date + timedelta(days=1), time.min).astimezone(timezone.utc).replace(tzinfo=None)
+    return start, end
+
+def parse_presence_date(value: Optional[str]) -> date:
+    """
+    Convierte un parámetro ``YYYY-MM-DD`` en fecha de asistencia (hoy si no se indica).
+
+    Raises:
+        ValueError: Si el formato no es válido
+    """
+    if not value:
+        return get_presence_date()
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def apply_presence(
+    presence: Optional[DailyPresence],
+    student_id: int,
+    school_id: Optional[int],
+    access_type: AccessType,
+    timestamp: datetime,
+    access_log_id: Optional[int],
+    presence_date: date
+) -> DailyPresence:
+    """
+    Aplica un registro de acceso al estado de presencia del día.
+
+    Args:
+        presence: Estado actual del alumno para ese día (None si aún no existe)
+        student_id: ID del alumno
+        school_id: ID de la escuela del alumno
+        access_type: Tipo de acceso (entrada/salida)
+        timestamp: Momento del acceso
+        access_log_id: ID del registro de acceso que provoca el cambio
+        presence_date: Día de asistencia
+
+    Los registros pueden llegar desordenados (p. ej. escaneos sin conexión que se
+    sincronizan tarde): la primera entrada y la última salida se actualizan siempre,
+    pero el estado y ``last_access_log_id`` solo si el registro no es anterior al
+    último aplicado.
+
+    Returns:
+        El estado de presencia actualizado (nuevo si no existía)
+    """
+    if presence is None:
+        presence = DailyPresence(
+            school_id=school_id,
+            student_id=student_id,
+            date=presence_date
+        )
+
+    # Filas anteriores a last_access_at: lo más reciente que se conoce de ellas
+    latest = presence.last_access_at
+    if latest is None:
+        known = [moment for moment in (presence.first_entry_at, presence.last_exit_at) if moment is not None]
+        latest = max(known) if known else None
+
+    if access_type == AccessType.ENTRADA:
+        if presence.first_entry_at is None or timestamp < presence.first_entry_at:
+            presence.first_entry_at = timestamp
+    else:
+        if presence.last_exit_at is None or timestamp > presence.last_exit_at:
+            presence.last_exit_at = timestamp
+
+    if latest is None or timestamp >= latest:
+        presence.status = PresenceStatus.PRESENTE if access_type == AccessType.ENTRADA else PresenceStatus.RETIRADO
+        presence.last_access_log_id = access_log_id
+        presence.last_access_at = timestamp
+    return presence
+
+def ensure_presence_schema(engine) -> None:
+    """Añade a ``daily_presence`` las columnas creadas después de la tabla (``create_all`` no altera tablas)."""
+    columns = {column["name"] for column in inspect(engine).get_columns(DailyPresence.__tablename__)}
+    if "last_access_at" not in columns:
+        column_type = DailyPresence.__table__.c.last_access_at.type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE daily_presence ADD COLUMN last_access_at {column_type}"))
+
+def record_presence(student: Student, access_log: AccessLog, db: Session) -> DailyPresence:
+    """
+    Actualiza el estado de presencia diario con un registro de acceso recién creado.
+
+    Debe llamarse después de ``db.flush()`` y antes del ``commit`` para que el estado
+    se guarde en la misma transacción que el registro de acceso.
+
+    Args:
+        student: Alumno al que pertenece el registro
+        access_log: Registro de acceso ya insertado
+        db: Sesión de base de datos
+
+    Returns:
+        Estado de presencia actualizado
+    """
+    presence_date = get_presence_date()
+    presence = db.query(DailyPresence).filter(
+        DailyPresence.student_id == student.id,
+        DailyPresence.date == presence_date
+    ).first()
+
+    presence = apply_presence(
+        presence,
+        student_id=student.id,
+        school_id=student.school_id,
+        access_type=access_log.access_type,
+        timestamp=access_log.timestamp,
+        access_log_id=access_log.id,
+        presence_date=presence_date
+    )
+    db.add(presence)
+    return presence
+
+def present_students_query(presence_date: date, school_id: Optional[int] = None):
+    """Consulta con los IDs de los alumnos presentes en un día."""
+    query = select(DailyPresence.student_id).where(
+        DailyPresence.date == presence_date,
+        DailyPresence.status == PresenceStatus.PRESENTE
+    )
+    if school_id is not None:
+        query = query.where(DailyPresence.school_id == school_id)
+    return query
+
+def entered_students_query(presence_date: date, school_id: Optional[int] = None):
+    """Consulta con los IDs de los alumnos que registraron entrada en un día."""
+    query = select(DailyPresence.student_id).where(
+        DailyPresence.date == presence_date,
+        DailyPresence.first_entry_at.isnot(None)
+    )
+    if school_id is not None:
+        query = query.where(DailyPresence.school_id == school_id)
+    return query
+
+def get_presence_counts(db: Session, presence_date: date, school_id: Optional[int] = None) -> Dict[str, int]:
+    """
+    Obtiene los contadores de asistencia de un día a partir del estado de presencia.
+
+    Returns:
+        Diccionario con ``present``, ``entered`` y ``exited``
+    """
+    query = db.query(
+        func.count(DailyPresence.first_entry_at),
+        func.count(DailyPresence.last_exit_at),
+        func.coalesce(func.sum(
+            case((DailyPresence.status == PresenceStatus.PRESENTE, 1), else_=0)
+        ), 0)
+    ).filter(DailyPresence.date == presence_date)
+    if school_id is not None:
+        query = query.filter(DailyPresence.school_id == school_id)
+
+    entered, exited, present = query.one()
+    return {
+        "present": int(present or 0),
+        "entered": int(entered or 0),
+        "exited": int(exited or 0)
+    }
+
+def get_student_presence(student_id: int, presence_date: date, db: Session) -> Optional[DailyPresence]:
+    """Obtiene el estado de presencia de un alumno en un día."""
+    return db.query(DailyPresence).filter(
+        DailyPresence.student_id == student_id,
+        DailyPresence.date == presence_date
+    ).first()
+
+def rebuild_daily_presence(presence_date: date, db: Session) -> int:
+    """
+    Reconstruye el estado de presencia de un día a partir de los registros de acceso.
+
+    Se usa para rellenar días anteriores a la existencia de la tabla o para
+    reparar el estado tras una carga manual de registros. Los días de cursos
+    cerrados se leen del archivo.
+
+    Args:
+        presence_date: Día a reconstruir
+        db: Sesión de base de datos
+
+    Returns:
+        Número de alumnos con estado de presencia para ese día
+    """
+    # Los registros guardan la hora en UTC y el día de asistencia es local
+    start, end = local_day_bounds_utc(presence_date)
+
+    source = access_log_source(start)
+    logs = db.query(
+        source.c.id,
+        source.c.student_id,
+        source.c.access_type,
+        source.c.timestamp,
+        Student.school_id
+    ).join(
+        Student, Student.id == source.c.student_id
+    ).filter(
+        source.c.timestamp >= start,
+        source.c.timestamp < end
+    ).order_by(source.c.timestamp, source.c.id).all()
+
+    db.query(DailyPresence).filter(
+        DailyPresence.date == presence_date
+    ).delete(synchronize_session=False)
+
+    states: Dict[int, DailyPresence] = {}
+    for log in logs:
+        states[log.student_id] = apply_presence(
+            states.get(log.student_id),
+            student_id=log.student_id,
+            school_id=log.school_id,
+            access_type=log.access_type,
+            timestamp=log.timestamp,
+            access_log_id=log.id,
+            presence_date=presence_date
+        )
+
+    db.add_all(states.values())
+    db.commit()
+    return len(states)
@@ -0,0 +1,136 @@
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import event, inspect
+from collections import OrderedDict
+from typing import Callable, List, Optional, Set, Tuple
+import logging
+import threading
+import time
+
+from app.models import User, Staff, Guardian
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_DIRTY_KEY = "principal_cache_dirty"
+
+def load_principal(db: Session, email: str) -> Optional[User]:
+    """Usuario autenticado con los perfiles que usan las rutas ya cargados."""
+    return (
+        db.query(User)
+        .options(
+            joinedload(User.staff_profile).joinedload(Staff.school),
+            joinedload(User.guardian_profile)
+        )
+        .filter(User.email == email)
+        .first()
+    )
+
+class PrincipalCache:
+    """
+    Caché LRU de corta duración de los usuarios autenticados, por sujeto del token.
+
+    Guarda copias desconectadas de cualquier sesión. ``get`` las une a la sesión de la
+    petición con ``merge(load=False)``, que no ejecuta SQL, así que las relaciones no
+    cargadas siguen funcionando con esa sesión. Los cambios confirmados en usuarios
+    y perfiles invalidan sus entradas; en otros procesos caducan con el TTL.
+    Los oyentes de ``add_listener`` se enteran de esos cambios (p. ej. para cerrar
+    los WebSocket de un usuario desactivado).
+    """
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        self.ttl_seconds = settings.AUTH_PRINCIPAL_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = settings.AUTH_PRINCIPAL_CACHE_SIZE if max_entries is None else max_entries
+        self._entries: "OrderedDict[str, Tuple[float, User]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Set[int]], None]] = []
+
+    def get(self, db: Session, email: str) -> Optional[User]:
+        """
+        Devuelve el usuario del sujeto ``email`` unido a ``db``.
+
+        En un fallo lo carga con una sesión propia sobre la misma conexión, para que
+        la copia guardada no dependa de la sesión de la petición.
+        """
+        with self._lock:
+            cached = self._entries.get(email)
+            if cached and cached[0] > time.monotonic():
+                self._entries.move_to_end(email)
+                return db.merge(cached[1], load=False)
+            generation = self._generation
+
+        loader = Session(bind=db.get_bind())
+        try:
+            user = load_principal(loader, email)
+        finally:
+            loader.close()
+        if user is None:
+            return None
+
+        with self._lock:
+            # Una invalidación durante la carga puede dejar la copia obsoleta
+            if generation == self._generation and self.ttl_seconds > 0 and self.max_entries > 0:
+                self._entries[email] = (time.monotonic() + self.ttl_seconds, user)
+                self._entries.move_to_end(email)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return db.merge(user, load=False)
+
+    def invalidate(self, user_ids: Set[int] = None, emails: Set[str] = None):
+        """Descarta las entradas de esos usuarios (todas si no se indica ninguno)."""
+        with self._lock:
+            self._generation += 1
+            if user_ids is None and emails is None:
+                self._entries.clear()
+                return
+            user_ids = user_ids or set()
+            emails = emails or set()
+            for key in [
+                key for key, (_, user) in self._entries.items()
+                if key in emails or user.id in user_ids
+            ]:
+                del self._entries[key]
+
+    def add_listener(self, listener: Callable[[Set[int]], None]):
+        """Llama a ``listener(user_ids)`` cada vez que se confirman cambios en esos usuarios."""
+        self._listeners.append(listener)
+
+    def notify(self, user_ids: Set[int]):
+        for listener in list(self._listeners):
+            try:
+                listener(user_ids)
+            except Exception as e:
+                logger.error(f"Principal change listener failed: {e}")
+
+principal_cache = PrincipalCache()
+
+def _collect_after_flush(session: Session, flush_context):
+    """Anota qué usuarios cambian; sus entradas se descartan al confirmar."""
+    for instance in (*session.dirty, *session.deleted):
+        if isinstance(instance, User):
+            dirty = session.info.setdefault(_DIRTY_KEY, (set(), set()))
+            dirty[0].add(instance.id)
+            # El sujeto del token es el email, también el anterior si ha cambiado
+            history = inspect(instance).attrs.email.history
+            dirty[1].update(email for email in (*history.deleted, *history.added) if email)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Staff, Guardian)) and instance.user_id is not None:
+            session.info.setdefault(_DIRTY_KEY, (set(), set()))[0].add(instance.user_id)
+
+def _invalidate_after_commit(session: Session):
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if dirty:
+        principal_cache.invalidate(*dirty)
+        if dirty[0]:
+            principal_cache.notify(dirty[0])
+
+def _discard_after_rollback(session: Session):
+    session.info.pop(_DIRTY_KEY, None)
+
+for _name, _listener in (
+    ("after_flush", _collect_after_flush),
+    ("after_commit", _invalidate_after_commit),
+    ("after_rollback", _discard_after_rollback)
+):
+    if not event.contains(Session, _name, _listener):
+        event.listen(Session, _name, _listener)
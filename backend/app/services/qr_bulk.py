@@ -0,0 +1,386 @@
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import select, insert, delete
+from concurrent.futures import ProcessPoolExecutor
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Callable, List, NamedTuple, Optional
+from datetime import datetime, timedelta
+from html import escape
+import asyncio
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+import unicodedata
+import zipfile
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import Guardian, QRBulkBatch, QRCode, Student, User, guardian_student, qr_bulk_batch_codes
+from app.models.school import Classroom
+from app.services.qr_service import (
+    QR_DEFAULT_BORDER,
+    QR_DEFAULT_BOX_SIZE,
+    generate_unique_code,
+    render_qr_bytes,
+    sign_qr_token
+)
+
+QR_BULK_FORMATS = {
+    "zip": "application/zip",
+    "html": "text/html; charset=utf-8"
+}
+
+class IssuedQRCode(NamedTuple):
+    id: int
+    code: str
+    expires_at: datetime
+    student_name: str
+    enrollment_id: str
+    classroom: Optional[str]
+    guardian_name: str
+
+def issue_qr_codes(
+    db: Session,
+    school_id: Optional[int] = None,
+    classroom_id: Optional[int] = None,
+    expiration_days: int = 30
+) -> List[IssuedQRCode]:
+    """
+    Crea un código QR firmado para cada vínculo tutor-alumno de una escuela o un aula.
+
+    Todos los códigos se insertan y firman en una sola transacción.
+
+    Args:
+        db: Sesión de base de datos
+        school_id: Escuela de los alumnos
+        classroom_id: Aula de los alumnos
+        expiration_days: Días hasta la expiración de los códigos
+
+    Returns:
+        Códigos creados, ordenados por aula, alumno y tutor
+
+    Raises:
+        ValueError: Si no se indica escuela ni aula
+    """
+    if school_id is None and classroom_id is None:
+        raise ValueError("Se requiere una escuela o un aula")
+
+    guardian_user = aliased(User)
+    query = select(
+        guardian_student.c.guardian_id,
+        Student.id.label("student_id"),
+        Student.first_name,
+        Student.last_name,
+        Student.enrollment_id,
+        Classroom.name.label("classroom"),
+        guardian_user.first_name.label("guardian_first_name"),
+        guardian_user.last_name.label("guardian_last_name")
+    ).join(
+        Student, Student.id == guardian_student.c.student_id
+    ).join(
+        Guardian, Guardian.id == guardian_student.c.guardian_id
+    ).join(
+        guardian_user, guardian_user.id == Guardian.user_id
+    ).outerjoin(
+        Classroom, Classroom.id == Student.classroom_id
+    )
+    if school_id is not None:
+        query = query.where(Student.school_id == school_id)
+    if classroom_id is not None:
+        query = query.where(Student.classroom_id == classroom_id)
+    links = db.execute(query.order_by(
+        Classroom.name, Student.last_name, Student.first_name, Student.id, guardian_student.c.guardian_id
+    )).all()
+
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=expiration_days)
+    qr_codes = [
+        QRCode(
+            guardian_id=link.guardian_id,
+            student_id=link.student_id,
+            code=generate_unique_code(),
+            is_active=True,
+            created_at=now,
+            expires_at=expires_at
+        )
+        for link in links
+    ]
+    db.add_all(qr_codes)
+    db.flush()
+    for qr_code in qr_codes:
+        qr_code.code = sign_qr_token(qr_code)
+    db.commit()
+
+    return [
+        IssuedQRCode(
+            id=qr_code.id,
+            code=qr_code.code,
+            expires_at=expires_at,
+            student_name=f"{link.first_name} {link.last_name}",
+            enrollment_id=link.enrollment_id,
+            classroom=link.classroom,
+            guardian_name=f"{link.guardian_first_name} {link.guardian_last_name}"
+        )
+        for qr_code, link in zip(qr_codes, links)
+    ]
+
+class QRBulkJob:
+    """Lote de códigos emitidos pendiente de descargar, con su progreso de renderizado."""
+
+    def __init__(
+        self,
+        job_id: str,
+        created_by: int,
+        codes: List[IssuedQRCode],
+        total: int,
+        status: str = "pending",
+        rendered: int = 0
+    ):
+        self.id = job_id
+        # Usuario que emitió los códigos: solo él (o un administrador) puede verlos
+        self.created_by = created_by
+        self.codes = codes
+        self.total = total
+        self.rendered = rendered
+        self.status = status
+
+    def progress(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "rendered": self.rendered
+        }
+
+def load_issued_codes(db: Session, job_id: str) -> List[IssuedQRCode]:
+    """Códigos de una emisión, en el orden en que se emitieron."""
+    guardian_user = aliased(User)
+    rows = db.execute(
+        select(
+            QRCode.id,
+            QRCode.code,
+            QRCode.expires_at,
+            Student.first_name,
+            Student.last_name,
+            Student.enrollment_id,
+            Classroom.name.label("classroom"),
+            guardian_user.first_name.label("guardian_first_name"),
+            guardian_user.last_name.label("guardian_last_name")
+        ).join(
+            qr_bulk_batch_codes, qr_bulk_batch_codes.c.qr_code_id == QRCode.id
+        ).join(
+            Student, Student.id == QRCode.student_id
+        ).join(
+            Guardian, Guardian.id == QRCode.guardian_id
+        ).join(
+            guardian_user, guardian_user.id == Guardian.user_id
+        ).outerjoin(
+            Classroom, Classroom.id == Student.classroom_id
+        ).where(
+            qr_bulk_batch_codes.c.batch_id == job_id
+        ).order_by(QRCode.id)
+    ).all()
+    return [
+        IssuedQRCode(
+            id=row.id,
+            code=row.code,
+            expires_at=row.expires_at,
+            student_name=f"{row.first_name} {row.last_name}",
+            enrollment_id=row.enrollment_id,
+            classroom=row.classroom,
+            guardian_name=f"{row.guardian_first_name} {row.guardian_last_name}"
+        )
+        for row in rows
+    ]
+
+class QRBulkJobRegistry:
+    """
+    Trabajos de emisión guardados en ``qr_bulk_batches``; caducan pasados ``QR_BULK_JOB_TTL_SECONDS``.
+
+    Cualquier worker puede consultar el progreso o servir la descarga: el trabajo se
+    reconstruye a partir de los códigos enlazados, y el worker que renderiza guarda
+    el progreso con su propia sesión (``session_factory``).
+    """
+
+    def __init__(self, ttl_seconds: float = None, session_factory: Callable[[], Session] = None):
+        self.ttl_seconds = settings.QR_BULK_JOB_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.session_factory = session_factory or SessionLocal
+
+    def create(self, db: Session, codes: List[IssuedQRCode], created_by: int) -> QRBulkJob:
+        """Guarda un trabajo con los códigos ya emitidos y descarta los caducados."""
+        now = datetime.utcnow()
+        expired = [
+            job_id for (job_id,) in db.query(QRBulkBatch.id).filter(
+                QRBulkBatch.created_at < now - timedelta(seconds=self.ttl_seconds)
+            )
+        ]
+        if expired:
+            db.execute(delete(qr_bulk_batch_codes).where(qr_bulk_batch_codes.c.batch_id.in_(expired)))
+            db.query(QRBulkBatch).filter(QRBulkBatch.id.in_(expired)).delete(synchronize_session=False)
+
+        job = QRBulkJob(secrets.token_urlsafe(16), created_by, codes, total=len(codes))
+        db.add(QRBulkBatch(id=job.id, created_by=created_by, status=job.status, total=job.total,
+                           rendered=0, created_at=now))
+        db.flush()
+        if codes:
+            db.execute(insert(qr_bulk_batch_codes), [
+                {"batch_id": job.id, "qr_code_id": issued.id} for issued in codes
+            ])
+        db.commit()
+        return job
+
+    def get(self, db: Session, job_id: str, user: User, with_codes: bool = True) -> Optional[QRBulkJob]:
+        """
+        Devuelve el trabajo si ``user`` puede verlo: quien lo creó o un administrador.
+
+        Los códigos firmados autorizan recogidas, así que conocer el ID no basta.
+        """
+        batch = db.query(QRBulkBatch).populate_existing().filter(QRBulkBatch.id == job_id).first()
+        if batch is None or (batch.created_by != user.id and not user.is_admin):
+            return None
+        created_at = batch.created_at.replace(tzinfo=None)
+        if created_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+        codes = load_issued_codes(db, job_id) if with_codes else []
+        return QRBulkJob(batch.id, batch.created_by, codes, batch.total, batch.status, batch.rendered)
+
+    def save_progress(self, job: QRBulkJob):
+        """Guarda el estado de renderizado para que lo vean los demás workers."""
+        db = self.session_factory()
+        try:
+            db.query(QRBulkBatch).filter(QRBulkBatch.id == job.id).update(
+                {QRBulkBatch.status: job.status, QRBulkBatch.rendered: job.rendered},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+qr_bulk_jobs = QRBulkJobRegistry()
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
+
+def render_workers() -> int:
+    return settings.QR_BULK_RENDER_WORKERS or os.cpu_count() or 1
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Pool de procesos compartido para renderizar imágenes QR fuera del event loop."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn: el servidor tiene hilos y hacer fork con hilos activos no es seguro
+            _render_pool = ProcessPoolExecutor(
+                max_workers=render_workers(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _render_pool
+
+def shutdown_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(cancel_futures=True)
+            _render_pool = None
+
+async def iter_rendered(job: QRBulkJob, image_format: str) -> AsyncIterator[tuple]:
+    """
+    Renderiza las imágenes del trabajo en el pool de procesos, en orden.
+
+    Mantiene un número acotado de imágenes en curso para no acumular el lote entero
+    en memoria, y guarda el progreso del trabajo cada ventana de imágenes.
+
+    Yields:
+        Tuplas con (código emitido, bytes de la imagen)
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    window = render_workers() * 4
+    pending = []
+    job.status = "rendering"
+    job.rendered = 0
+    await run_in_threadpool(qr_bulk_jobs.save_progress, job)
+    try:
+        for issued in job.codes:
+            pending.append((issued, loop.run_in_executor(
+                pool, render_qr_bytes, issued.code, image_format, QR_DEFAULT_BOX_SIZE, QR_DEFAULT_BORDER
+            )))
+            if len(pending) >= window:
+                issued, future = pending.pop(0)
+                yield issued, await future
+                job.rendered += 1
+                if job.rendered % window == 0:
+                    await run_in_threadpool(qr_bulk_jobs.save_progress, job)
+        for issued, future in pending:
+            yield issued, await future
+            job.rendered += 1
+        job.status = "completed"
+        await run_in_threadpool(qr_bulk_jobs.save_progress, job)
+    except BaseException:
+        job.status = "failed"
+        for _, future in pending:
+            future.cancel()
+        # Sin esperar: el generador puede estar cerrándose porque el cliente se fue
+        loop.run_in_executor(None, qr_bulk_jobs.save_progress, job)
+        raise
+
+def _slug(value: Optional[str]) -> str:
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Za-z0-9]+", "_", value).strip("_") or "sin_nombre"
+
+class _ZipSink:
+    """Destino de ``zipfile`` que acumula lo escrito hasta que se envía."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def iter_zip(job: QRBulkJob) -> AsyncIterator[bytes]:
+    """ZIP con un PNG por código, enviado entrada a entrada."""
+    sink = _ZipSink()
+    # Los PNG ya están comprimidos
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    async for issued, image in iter_rendered(job, "png"):
+        name = f"{_slug(issued.classroom)}/{_slug(issued.student_name)}_{issued.enrollment_id}_{_slug(issued.guardian_name)}_{issued.id}.png"
+        archive.writestr(name, image)
+        yield sink.take()
+    archive.close()
+    yield sink.take()
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>Códigos QR</title>
+<style>
+body{font-family:sans-serif;margin:0}
+.sheet{display:flex;flex-wrap:wrap;gap:8mm;padding:8mm}
+.card{width:60mm;border:1px solid #999;padding:4mm;break-inside:avoid;page-break-inside:avoid;text-align:center}
+.card svg{width:50mm;height:50mm}
+.card p{margin:1mm 0;font-size:9pt}
+</style></head><body><div class="sheet">
+"""
+
+async def iter_html(job: QRBulkJob) -> AsyncIterator[str]:
+    """Documento HTML imprimible con una tarjeta SVG por código; el navegador lo pagina al imprimir."""
+    yield _HTML_HEAD
+    async for issued, image in iter_rendered(job, "svg"):
+        yield (
+            '<div class="card">'
+            f"{image.decode('utf-8')}"
+            f"<p><strong>{escape(issued.student_name)}</strong> ({escape(issued.enrollment_id or '')})</p>"
+            f"<p>{escape(issued.classroom or '')}</p>"
+            f"<p>{escape(issued.guardian_name)}</p>"
+            f"<p>Válido hasta {issued.expires_at.strftime('%d/%m/%Y')}</p>"
+            "</div>\n"
+        )
+    yield "</div></body></html>\n"
@@ -1,12 +1,33 @@
 import qrcode
 import secrets
 import base64
+import calendar
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from io import BytesIO
-from typing import Optional
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
 from sqlalchemy.orm import Session
-from app.models import Guardian, QRCode, Student
+from sqlalchemy import event, or_
+from app.core.config import settings
+from app.models import Guardian, QRCode, QRCodeRevocation, Student
 from datetime import datetime, timedelta
 
+_PENDING_REVOCATIONS_KEY = "qr_revocations_pending"
+QR_TOKEN_VERSION = "v1"
+
+QR_IMAGE_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+QR_DEFAULT_BOX_SIZE = 10
+QR_DEFAULT_BORDER = 4
+
+RenderKey = Tuple[str, str, int, int]
+
 def generate_unique_code():
     """Genera un código único para el QR."""
     return secrets.token_urlsafe(32)
@@ -34,29 +55,152 @@ def create_qr_code(guardian_id: int, student_id: int, expiration_days: int = 30,
     if not student:
         raise ValueError(f"No se encontró un alumno con ID {student_id}")
     
-    # Generar código único
-    unique_code = generate_unique_code()
-    
     # Calcular fecha de expiración
     expiration_date = datetime.utcnow() + timedelta(days=expiration_days)
     
-    # Crear y guardar el nuevo código QR
+    # Crear el código QR; el código definitivo lleva el ID, así que primero se inserta
+    # con un valor único provisional
     qr_code = QRCode(
         guardian_id=guardian_id,
         student_id=student_id,
-        code=unique_code,
+        code=generate_unique_code(),
         is_active=True,
-        expiration_date=expiration_date,
         created_at=datetime.utcnow(),
         expires_at=expiration_date
     )
     
     db.add(qr_code)
+    db.flush()
+    qr_code.code = sign_qr_token(qr_code)
     db.commit()
     db.refresh(qr_code)
     
     return qr_code
 
+class QRImageCache:
+    """
+    Caché LRU de imágenes QR ya renderizadas, acotada por el total de bytes.
+
+    La clave es (código, formato, tamaño de módulo, borde); cada entrada guarda la
+    imagen y su ETag. Es segura desde varios hilos.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = settings.QR_IMAGE_CACHE_BYTES if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[RenderKey, Tuple[bytes, str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: RenderKey) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: RenderKey, image: bytes, etag: str):
+        # Una imagen mayor que todo el presupuesto no se guarda
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = (image, etag)
+            self._size += len(image)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+qr_image_cache = QRImageCache()
+
+def _svg_path(matrix) -> str:
+    """Path SVG con un rectángulo por cada tramo horizontal de módulos oscuros."""
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            parts.append(f"M{start} {y}h{x - start}v1H{start}z")
+    return "".join(parts)
+
+def render_qr_bytes(code: str, image_format: str, box_size: int, border: int) -> bytes:
+    """Renderiza un código QR sin caché; es una función de módulo para poder usarla en otro proceso."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(code)
+    qr.make(fit=True)
+    
+    if image_format == "svg":
+        # Vectorial para imprimir a cualquier tamaño; get_matrix ya incluye el borde
+        matrix = qr.get_matrix()
+        size = len(matrix)
+        pixels = size * box_size
+        svg = (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+            f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+            f'<rect width="{size}" height="{size}" fill="#fff"/>'
+            f'<path d="{_svg_path(matrix)}" fill="#000"/></svg>'
+        )
+        return svg.encode("utf-8")
+    
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def render_qr_image(
+    code: str,
+    image_format: str = "png",
+    box_size: int = QR_DEFAULT_BOX_SIZE,
+    border: int = QR_DEFAULT_BORDER
+) -> Tuple[bytes, str]:
+    """
+    Devuelve la imagen QR de un código y su ETag, renderizándola solo si no está en caché.
+    
+    Args:
+        code: Código a convertir en QR
+        image_format: ``png`` o ``svg``
+        box_size: Píxeles por módulo (en SVG solo cambia el tamaño nominal)
+        border: Módulos de margen
+        
+    Returns:
+        Tupla con (bytes de la imagen, ETag)
+        
+    Raises:
+        ValueError: Si el formato no está soportado
+    """
+    if image_format not in QR_IMAGE_FORMATS:
+        raise ValueError(f"Formato de imagen no soportado: {image_format}")
+    
+    key = (code, image_format, box_size, border)
+    cached = qr_image_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    image = render_qr_bytes(code, image_format, box_size, border)
+    etag = '"' + hashlib.sha256(image).hexdigest()[:32] + '"'
+    qr_image_cache.put(key, image, etag)
+    return image, etag
+
 def generate_qr_image(code: str) -> str:
     """
     Genera una imagen QR a partir de un código.
@@ -67,24 +211,161 @@ def generate_qr_image(code: str) -> str:
     Returns:
         String en formato base64 de la imagen QR
     """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+    image, _ = render_qr_image(code)
+    return base64.b64encode(image).decode("utf-8")
+
+class QRClaims(NamedTuple):
+    """Datos que autoriza un código QR válido."""
+    id: int
+    guardian_id: int
+    student_id: int
+    expires_at: Optional[datetime]
+
+def _signature(body: str) -> str:
+    key = hashlib.sha256(b"qr-token:" + settings.SECRET_KEY.encode()).digest()
+    digest = hmac.new(key, body.encode(), hashlib.sha256).digest()[:18]
+    return base64.urlsafe_b64encode(digest).decode()
+
+def sign_qr_token(qr_code: QRCode) -> str:
+    """
+    Genera el código firmado de un QR ya insertado.
+    
+    El código es ``v1.<id>.<tutor>.<alumno>.<expiración>.<firma>``, con la expiración
+    en segundos Unix (0 si no expira) y una firma HMAC-SHA256 con la clave del servidor.
+    """
+    expires = calendar.timegm(qr_code.expires_at.utctimetuple()) if qr_code.expires_at else 0
+    body = f"{QR_TOKEN_VERSION}.{qr_code.id}.{qr_code.guardian_id}.{qr_code.student_id}.{expires}"
+    return f"{body}.{_signature(body)}"
+
+def verify_qr_token(code: str) -> Optional[QRClaims]:
+    """
+    Comprueba la firma de un código generado por ``sign_qr_token`` sin consultar la base de datos.
+    
+    No comprueba la expiración ni las revocaciones.
+    
+    Returns:
+        Los datos del código, o None si no es un código firmado válido con la clave actual
+    """
+    parts = code.split(".")
+    if len(parts) != 6 or parts[0] != QR_TOKEN_VERSION:
+        return None
+    body, signature = code.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _signature(body)):
+        return None
+    try:
+        qr_id, guardian_id, student_id, expires = (int(part) for part in parts[1:5])
+    except ValueError:
+        return None
+    return QRClaims(
+        id=qr_id,
+        guardian_id=guardian_id,
+        student_id=student_id,
+        expires_at=datetime.utcfromtimestamp(expires) if expires else None
     )
-    qr.add_data(code)
-    qr.make(fit=True)
+
+class QRRevocationSet:
+    """
+    IDs de los códigos QR revocados y aún no expirados, en memoria.
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    Las revocaciones confirmadas en este proceso se añaden al confirmar la transacción;
+    las de otros procesos se leen como mucho cada ``QR_REVOCATION_REFRESH_SECONDS``,
+    pidiendo solo las filas nuevas.
+    """
     
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    def __init__(self, refresh_seconds: float = None):
+        self.refresh_seconds = (
+            settings.QR_REVOCATION_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        )
+        self._ids: Set[int] = set()
+        self._last_id = 0
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def __contains__(self, qr_code_id: int) -> bool:
+        return qr_code_id in self._ids
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    def load(self, db: Session) -> int:
+        """Carga todas las revocaciones vigentes, descartando las de códigos ya expirados."""
+        rows = db.query(QRCodeRevocation.id, QRCodeRevocation.qr_code_id).filter(
+            or_(QRCodeRevocation.expires_at.is_(None), QRCodeRevocation.expires_at >= datetime.utcnow())
+        ).all()
+        last_id = db.query(QRCodeRevocation.id).order_by(QRCodeRevocation.id.desc()).limit(1).scalar()
+        with self._lock:
+            self._ids = {row.qr_code_id for row in rows}
+            self._last_id = last_id or 0
+            self._refreshed_at = time.monotonic()
+            return len(self._ids)
+    
+    def refresh(self, db: Session, force: bool = False):
+        """Añade las revocaciones guardadas desde la última lectura, si ha pasado el intervalo."""
+        if self._refreshed_at is None:
+            self.load(db)
+            return
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return
+        rows = db.query(QRCodeRevocation.id, QRCodeRevocation.qr_code_id).filter(
+            QRCodeRevocation.id > self._last_id
+        ).all()
+        with self._lock:
+            self._ids.update(row.qr_code_id for row in rows)
+            self._last_id = max([self._last_id, *(row.id for row in rows)])
+            self._refreshed_at = time.monotonic()
+    
+    def add(self, qr_code_ids: Iterable[int]):
+        with self._lock:
+            self._ids.update(qr_code_ids)
+    
+    def clear(self):
+        with self._lock:
+            self._ids = set()
+            self._last_id = 0
+            self._refreshed_at = None
+
+qr_revocations = QRRevocationSet()
+
+def resolve_qr_codes(codes: Iterable[str], db: Session, now: Optional[datetime] = None) -> Dict[str, QRClaims]:
+    """
+    Valida varios códigos QR a la vez.
+    
+    Los códigos firmados se validan en memoria (firma, expiración y revocaciones).
+    Los códigos antiguos, o firmados con otra clave, se buscan en ``qr_codes`` con
+    una sola consulta.
+    
+    Args:
+        codes: Códigos leídos
+        db: Sesión de base de datos
+        now: Momento de referencia (por defecto ahora, en UTC)
+        
+    Returns:
+        Diccionario código -> datos, solo con los códigos válidos
+    """
+    now = now or datetime.utcnow()
+    qr_revocations.refresh(db)
     
-    return img_str
+    resolved: Dict[str, QRClaims] = {}
+    unsigned = []
+    for code in set(codes):
+        claims = verify_qr_token(code)
+        if claims is None:
+            unsigned.append(code)
+        elif claims.id not in qr_revocations and not (claims.expires_at and claims.expires_at < now):
+            resolved[code] = claims
+    
+    if unsigned:
+        for qr_code in db.query(QRCode).filter(QRCode.code.in_(unsigned)):
+            if is_qr_code_usable(qr_code, now):
+                resolved[qr_code.code] = QRClaims(
+                    id=qr_code.id,
+                    guardian_id=qr_code.guardian_id,
+                    student_id=qr_code.student_id,
+                    expires_at=qr_code.expires_at
+                )
+    return resolved
 
-def validate_qr_code(code: str, db: Session) -> Optional[QRCode]:
+def validate_qr_code(code: str, db: Session) -> Optional[QRClaims]:
     """
     Valida un código QR.
     
@@ -93,19 +374,70 @@ def validate_qr_code(code: str, db: Session) -> Optional[QRCode]:
         db: Sesión de base de datos
         
     Returns:
-        Objeto QRCode si es válido, None en caso contrario
+        Datos del código (tutor y alumno) si es válido, None en caso contrario
+    """
+    return resolve_qr_codes([code], db).get(code)
+
+def record_qr_revocation(qr_code: QRCode, db: Session) -> QRCodeRevocation:
     """
-    qr_code = db.query(QRCode).filter(QRCode.code == code).first()
+    Revoca un código QR y guarda la revocación para la validación sin base de datos.
     
-    if not qr_code:
-        return None
+    Args:
+        qr_code: Código a revocar
+        db: Sesión de base de datos
+        
+    Returns:
+        La revocación guardada
+    """
+    qr_code.is_active = False
+    revocation = db.query(QRCodeRevocation).filter(
+        QRCodeRevocation.qr_code_id == qr_code.id
+    ).first()
+    if revocation is None:
+        revocation = QRCodeRevocation(qr_code_id=qr_code.id, expires_at=qr_code.expires_at)
+        db.add(revocation)
+    db.commit()
+    return revocation
+
+def is_qr_code_usable(qr_code: QRCode, now: Optional[datetime] = None) -> bool:
+    """
+    Indica si un código QR ya cargado puede usarse para autorizar una salida.
     
+    Args:
+        qr_code: Código QR a comprobar
+        now: Momento de referencia (por defecto ahora, en UTC)
+        
+    Returns:
+        True si está activo y no ha expirado
+    """
     # Verificar si está activo
     if not qr_code.is_active:
-        return None
+        return False
     
     # Verificar si no ha expirado
-    if qr_code.expiration_date and qr_code.expiration_date < datetime.utcnow():
-        return None
+    if qr_code.expires_at and qr_code.expires_at < (now or datetime.utcnow()):
+        return False
     
-    return qr_code 
\ No newline at end of file
+    return True 
+
+def _collect_after_flush(session: Session, flush_context):
+    """Anota las revocaciones nuevas; pasan al conjunto en memoria al confirmar."""
+    for instance in session.new:
+        if isinstance(instance, QRCodeRevocation):
+            session.info.setdefault(_PENDING_REVOCATIONS_KEY, set()).add(instance.qr_code_id)
+
+def _apply_after_commit(session: Session):
+    pending = session.info.pop(_PENDING_REVOCATIONS_KEY, None)
+    if pending:
+        qr_revocations.add(pending)
+
+def _discard_after_rollback(session: Session):
+    session.info.pop(_PENDING_REVOCATIONS_KEY, None)
+
+for _name, _listener in (
+    ("after_flush", _collect_after_flush),
+    ("after_commit", _apply_after_commit),
+    ("after_rollback", _discard_after_rollback)
+):
+    if not event.contains(Session, _name, _listener):
+        event.listen(Session, _name, _listener)
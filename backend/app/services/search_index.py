@@ -0,0 +1,278 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, delete, func, case, event, inspect
+from sqlalchemy.engine import Connection
+from typing import Dict, Iterable, List, Optional, Set
+import math
+import re
+import unicodedata
+
+from app.models import Student, Guardian, User, guardian_student
+from app.models.search import StudentSearchDocument, StudentSearchTrigram
+from app.core.config import settings
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_ALPHA_OR_DIGITS = re.compile(r"[a-z]+|[0-9]+")
+
+# Atributos cuyo cambio obliga a reindexar
+_STUDENT_FIELDS = ("first_name", "last_name", "enrollment_id", "school_id", "guardians")
+_GUARDIAN_FIELDS = ("user_id", "students")
+_USER_FIELDS = ("first_name", "last_name")
+
+def normalize_search_text(text: Optional[str]) -> str:
+    """
+    Normaliza un texto para búsqueda: sin acentos, en minúsculas y solo letras y dígitos.
+
+    >>> normalize_search_text("  González-Núñez ")
+    'gonzalez nunez'
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", stripped.lower()).strip()
+
+def _tokens(normalized: str) -> List[str]:
+    """Palabras del texto; las matrículas como ``abc001`` aportan también ``abc`` y ``001``."""
+    tokens = []
+    for word in normalized.split():
+        tokens.append(word)
+        parts = _ALPHA_OR_DIGITS.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+def document_trigrams(normalized: str) -> Set[str]:
+    """Trigramas de un documento, con cada palabra rellenada como en pg_trgm."""
+    trigrams = set()
+    for token in _tokens(normalized):
+        padded = f"  {token} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def query_trigrams(normalized: str) -> Set[str]:
+    """
+    Trigramas de una búsqueda. Sin relleno final, para que lo escrito hasta ahora
+    coincida como prefijo de una palabra ("gonz" encuentra "gonzalez").
+    """
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word}"
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def _load_documents(connection: Connection, student_ids: Set[int]) -> Dict[int, dict]:
+    """Carga los textos a indexar de un conjunto de alumnos (dos consultas)."""
+    documents = {}
+    rows = connection.execute(
+        select(
+            Student.id,
+            Student.school_id,
+            Student.first_name,
+            Student.last_name,
+            Student.enrollment_id
+        ).where(Student.id.in_(student_ids))
+    )
+    for row in rows:
+        documents[row.id] = {
+            "school_id": row.school_id,
+            "parts": [row.first_name, row.last_name, row.enrollment_id]
+        }
+
+    if documents:
+        rows = connection.execute(
+            select(guardian_student.c.student_id, User.first_name, User.last_name).join(
+                Guardian, Guardian.id == guardian_student.c.guardian_id
+            ).join(
+                User, User.id == Guardian.user_id
+            ).where(guardian_student.c.student_id.in_(documents.keys()))
+        )
+        for row in rows:
+            documents[row.student_id]["parts"].extend([row.first_name, row.last_name])
+
+    return documents
+
+def index_students(connection: Connection, student_ids: Iterable[int]) -> int:
+    """
+    Reindexa un conjunto de alumnos; los que ya no existen se eliminan del índice.
+
+    Args:
+        connection: Conexión dentro de la transacción que modificó los alumnos
+        student_ids: IDs de los alumnos a reindexar
+
+    Returns:
+        Número de alumnos indexados
+    """
+    student_ids = set(student_ids)
+    if not student_ids:
+        return 0
+
+    # Por bloques para no superar el límite de parámetros de SQLite
+    chunk_size = 500
+    ids = sorted(student_ids)
+    indexed = 0
+    for start in range(0, len(ids), chunk_size):
+        chunk = set(ids[start:start + chunk_size])
+        documents = _load_documents(connection, chunk)
+
+        connection.execute(delete(StudentSearchTrigram).where(StudentSearchTrigram.student_id.in_(chunk)))
+        connection.execute(delete(StudentSearchDocument).where(StudentSearchDocument.student_id.in_(chunk)))
+
+        if not documents:
+            continue
+
+        document_rows = []
+        trigram_rows = []
+        for student_id, document in documents.items():
+            normalized = normalize_search_text(" ".join(p for p in document["parts"] if p))
+            document_rows.append({
+                "student_id": student_id,
+                "school_id": document["school_id"],
+                "normalized_text": normalized
+            })
+            trigram_rows.extend(
+                {"trigram": trigram, "student_id": student_id, "school_id": document["school_id"]}
+                for trigram in document_trigrams(normalized)
+            )
+
+        connection.execute(insert(StudentSearchDocument), document_rows)
+        if trigram_rows:
+            connection.execute(insert(StudentSearchTrigram), trigram_rows)
+        indexed += len(documents)
+
+    return indexed
+
+def rebuild_search_index(db: Session) -> int:
+    """Reconstruye el índice de búsqueda completo."""
+    connection = db.connection()
+    connection.execute(delete(StudentSearchTrigram))
+    connection.execute(delete(StudentSearchDocument))
+    student_ids = db.scalars(select(Student.id)).all()
+    indexed = index_students(connection, student_ids)
+    db.commit()
+    return indexed
+
+def ensure_search_index(db: Session) -> Optional[int]:
+    """Construye el índice si está vacío y hay alumnos (p. ej. tras un despliegue)."""
+    has_documents = db.execute(select(StudentSearchDocument.student_id).limit(1)).first()
+    has_students = db.execute(select(Student.id).limit(1)).first()
+    if has_documents or not has_students:
+        return None
+    return rebuild_search_index(db)
+
+def search_student_ids(
+    db: Session,
+    query: str,
+    school_id: Optional[int] = None,
+    include=None,
+    exclude=None,
+    limit: Optional[int] = None
+) -> List[int]:
+    """
+    Busca alumnos por nombre, matrícula o nombre de sus tutores, ordenados por relevancia.
+
+    La relevancia es la proporción de trigramas de la búsqueda presentes en el
+    documento del alumno; se descartan los que no llegan a ``SEARCH_MIN_SIMILARITY``.
+
+    Args:
+        db: Sesión de base de datos
+        query: Texto buscado, tal como lo escribió el usuario
+        school_id: Restringir a una escuela
+        include: Consulta de IDs de alumno a la que restringir (p. ej. presentes hoy)
+        exclude: Consulta de IDs de alumno a descartar (p. ej. con entrada hoy)
+        limit: Número máximo de resultados
+
+    Returns:
+        IDs de alumno, del más al menos relevante
+    """
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    trigrams = query_trigrams(normalize_search_text(query))
+    ranked: List[int] = []
+
+    # Un número exacto también puede ser el ID interno del alumno
+    if query and query.strip().isdigit():
+        id_query = select(Student.id).where(Student.id == int(query.strip()))
+        if school_id is not None:
+            id_query = id_query.where(Student.school_id == school_id)
+        if include is not None:
+            id_query = id_query.where(Student.id.in_(include))
+        if exclude is not None:
+            id_query = id_query.where(~Student.id.in_(exclude))
+        ranked.extend(db.scalars(id_query).all())
+
+    if not trigrams:
+        return ranked
+
+    min_hits = max(1, math.ceil(len(trigrams) * settings.SEARCH_MIN_SIMILARITY))
+    hits = func.count().label("hits")
+    search_query = select(StudentSearchTrigram.student_id, hits).where(
+        StudentSearchTrigram.trigram.in_(trigrams)
+    )
+    if school_id is not None:
+        search_query = search_query.where(StudentSearchTrigram.school_id == school_id)
+    if include is not None:
+        search_query = search_query.where(StudentSearchTrigram.student_id.in_(include))
+    if exclude is not None:
+        search_query = search_query.where(~StudentSearchTrigram.student_id.in_(exclude))
+    search_query = search_query.group_by(
+        StudentSearchTrigram.student_id
+    ).having(
+        hits >= min_hits
+    ).order_by(
+        hits.desc(), StudentSearchTrigram.student_id
+    ).limit(limit)
+
+    for student_id, _ in db.execute(search_query):
+        if student_id not in ranked:
+            ranked.append(student_id)
+    return ranked[:limit]
+
+def rank_order(student_ids: List[int]):
+    """Expresión ``ORDER BY`` que respeta el orden de relevancia de ``search_student_ids``."""
+    return case({student_id: position for position, student_id in enumerate(student_ids)}, value=Student.id)
+
+def _changed(instance, fields) -> bool:
+    state = inspect(instance)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+def _reindex_after_flush(session: Session, flush_context):
+    """Mantiene el índice al día en la misma transacción en que cambian alumnos, tutores o usuarios."""
+    student_ids: Set[int] = set()
+    guardian_ids: Set[int] = set()
+    user_ids: Set[int] = set()
+
+    for instance in session.new:
+        if isinstance(instance, Student):
+            student_ids.add(instance.id)
+        elif isinstance(instance, Guardian):
+            guardian_ids.add(instance.id)
+    for instance in session.dirty:
+        if isinstance(instance, Student) and _changed(instance, _STUDENT_FIELDS):
+            student_ids.add(instance.id)
+        elif isinstance(instance, Guardian) and _changed(instance, _GUARDIAN_FIELDS):
+            guardian_ids.add(instance.id)
+            student_ids.update(s.id for s in inspect(instance).attrs.students.history.deleted or ())
+        elif isinstance(instance, User) and _changed(instance, _USER_FIELDS):
+            user_ids.add(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, Student):
+            student_ids.add(instance.id)
+        elif isinstance(instance, Guardian):
+            guardian_ids.add(instance.id)
+
+    if not (student_ids or guardian_ids or user_ids):
+        return
+
+    connection = session.connection()
+    if user_ids:
+        guardian_ids.update(connection.execute(
+            select(Guardian.id).where(Guardian.user_id.in_(user_ids))
+        ).scalars())
+    if guardian_ids:
+        student_ids.update(connection.execute(
+            select(guardian_student.c.student_id).where(guardian_student.c.guardian_id.in_(guardian_ids))
+        ).scalars())
+
+    index_students(connection, student_ids)
+
+if not event.contains(Session, "after_flush", _reindex_after_flush):
+    event.listen(Session, "after_flush", _reindex_after_flush)
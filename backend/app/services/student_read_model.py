@@ -0,0 +1,135 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, String, type_coerce
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from app.models import Student, Guardian, User, guardian_student
+from app.models.school import Classroom, GradeLevel
+
+DEFAULT_GRADE_LEVEL = "No asignado"
+
+class GuardianRow(NamedTuple):
+    id: int
+    first_name: Optional[str]
+    last_name: Optional[str]
+    relationship_type: Optional[str]
+
+class StudentRow(NamedTuple):
+    id: int
+    first_name: str
+    last_name: str
+    enrollment_id: str
+    grade_level: str
+    guardians: List[GuardianRow]
+
+def grade_level_value(name: Optional[str]) -> str:
+    """Traduce el nombre guardado en la columna Enum a su valor legible."""
+    if name and name in GradeLevel.__members__:
+        return GradeLevel[name].value
+    return DEFAULT_GRADE_LEVEL
+
+def fetch_student_rows(
+    db: Session,
+    criteria: Sequence = (),
+    order_by: Sequence = (),
+    limit: Optional[int] = None,
+    include_guardians: bool = True
+) -> List[StudentRow]:
+    """
+    Obtiene alumnos con su grado y tutores sin hidratar objetos ORM.
+
+    Hace siempre dos consultas, sea cual sea el número de alumnos: una para los
+    alumnos con el grado de su aula y otra para los nombres de todos sus tutores.
+
+    Args:
+        db: Sesión de base de datos
+        criteria: Condiciones sobre ``Student`` (o tablas ya unidas) para filtrar
+        order_by: Orden de los resultados (por defecto por ID)
+        limit: Número máximo de alumnos
+        include_guardians: Si es False no se consultan los tutores
+
+    Returns:
+        Lista de filas de alumno en el orden pedido
+    """
+    order_by = list(order_by) or [Student.id]
+
+    # Solo los IDs con el mismo filtro, orden y límite: se une como tabla derivada
+    ids_query = select(Student.id).where(*criteria).order_by(*order_by)
+    if limit is not None:
+        ids_query = ids_query.limit(limit)
+
+    students_query = select(
+        Student.id,
+        Student.first_name,
+        Student.last_name,
+        Student.enrollment_id,
+        # El nombre crudo evita que un valor inesperado haga fallar toda la consulta
+        type_coerce(Classroom.grade_level, String).label("grade_level")
+    ).outerjoin(
+        Classroom, Classroom.id == Student.classroom_id
+    ).where(*criteria).order_by(*order_by)
+    if limit is not None:
+        students_query = students_query.limit(limit)
+
+    student_rows = db.execute(students_query).all()
+    if not student_rows:
+        return []
+
+    guardians: Dict[int, List[GuardianRow]] = {}
+    if include_guardians:
+        ids_subquery = ids_query.subquery()
+        guardian_rows = db.execute(
+            select(
+                guardian_student.c.student_id,
+                Guardian.id,
+                User.first_name,
+                User.last_name,
+                Guardian.relationship_type
+            ).join(
+                ids_subquery, ids_subquery.c.id == guardian_student.c.student_id
+            ).join(
+                Guardian, Guardian.id == guardian_student.c.guardian_id
+            ).join(
+                User, User.id == Guardian.user_id
+            ).order_by(guardian_student.c.student_id, Guardian.id)
+        )
+        for row in guardian_rows:
+            guardians.setdefault(row.student_id, []).append(GuardianRow(
+                id=row.id,
+                first_name=row.first_name,
+                last_name=row.last_name,
+                relationship_type=row.relationship_type
+            ))
+
+    return [
+        StudentRow(
+            id=row.id,
+            first_name=row.first_name,
+            last_name=row.last_name,
+            enrollment_id=row.enrollment_id,
+            grade_level=grade_level_value(row.grade_level),
+            guardians=guardians.get(row.id, [])
+        )
+        for row in student_rows
+    ]
+
+def student_search_item(row: StudentRow) -> dict:
+    """Respuesta de búsqueda de un alumno (esquema ``StudentSearch``)."""
+    return {
+        "id": row.id,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "enrollment_id": row.enrollment_id,
+        "grade_level": {"name": row.grade_level},
+        "guardians": [guardian._asdict() for guardian in row.guardians]
+    }
+
+def student_list_item(row: StudentRow) -> dict:
+    """Respuesta del listado de alumnos (sin tutores)."""
+    return {
+        "id": row.id,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "full_name": f"{row.first_name} {row.last_name}",
+        "enrollment_id": row.enrollment_id,
+        "grade_level": {"name": row.grade_level}
+    }
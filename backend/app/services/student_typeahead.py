@@ -0,0 +1,317 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, delete, func, event, inspect, String, type_coerce
+from sqlalchemy.engine import Connection
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+from datetime import datetime, timedelta
+import heapq
+import logging
+import threading
+import time
+
+from app.models import Student, StudentChange
+from app.models.school import Classroom
+from app.services.search_index import normalize_search_text
+from app.services.student_read_model import grade_level_value
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "student_typeahead_pending"
+_STUDENT_FIELDS = ("first_name", "last_name", "enrollment_id", "school_id", "classroom_id")
+# Cambios anteriores al último aplicado que se vuelven a leer: con escrituras concurrentes
+# una transacción puede confirmarse después de otra que obtuvo un id mayor
+_CHANGE_LOOKBACK = 50
+
+class TypeaheadEntry(NamedTuple):
+    id: int
+    school_id: Optional[int]
+    tokens: List[str]
+    full_name: str
+    sort_key: tuple
+    item: dict
+
+def build_entry(row) -> TypeaheadEntry:
+    """Construye la entrada del índice a partir de una fila con los datos del alumno."""
+    first_name = normalize_search_text(row.first_name)
+    last_name = normalize_search_text(row.last_name)
+    full_name = f"{first_name} {last_name}".strip()
+    tokens = sorted(set(f"{full_name} {normalize_search_text(row.enrollment_id)}".split()))
+    return TypeaheadEntry(
+        id=row.id,
+        school_id=row.school_id,
+        tokens=tokens,
+        full_name=full_name,
+        sort_key=(last_name, first_name, row.id),
+        item={
+            "id": row.id,
+            "first_name": row.first_name,
+            "last_name": row.last_name,
+            "full_name": f"{row.first_name} {row.last_name}",
+            "enrollment_id": row.enrollment_id,
+            "grade_level": {"name": grade_level_value(row.grade_level)}
+        }
+    )
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Alumnos con alguna palabra que empieza por el prefijo de este nodo
+        self.ids: Set[int] = set()
+
+class SchoolRoster:
+    """Árbol de prefijos sobre las palabras del nombre y la matrícula de los alumnos de una escuela."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.entries: Dict[int, TypeaheadEntry] = {}
+
+    def add(self, entry: TypeaheadEntry):
+        self.remove(entry.id)
+        self.entries[entry.id] = entry
+        for token in entry.tokens:
+            node = self.root
+            for char in token:
+                node = node.children.setdefault(char, _TrieNode())
+                node.ids.add(entry.id)
+
+    def remove(self, student_id: int):
+        entry = self.entries.pop(student_id, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            path = [self.root]
+            for char in token:
+                node = path[-1].children.get(char)
+                if node is None:
+                    break
+                node.ids.discard(student_id)
+                path.append(node)
+            # Podar las ramas que se han quedado vacías
+            for parent, char in zip(reversed(path[:-1]), reversed(token[:len(path) - 1])):
+                child = parent.children[char]
+                if child.ids or child.children:
+                    break
+                del parent.children[char]
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    def search(self, words: List[str], limit: int) -> List[dict]:
+        """Alumnos con una palabra que empieza por cada una de las palabras buscadas."""
+        candidates = sorted((self._prefix_ids(word) for word in words), key=len)
+        if not candidates or not candidates[0]:
+            return []
+        matches = candidates[0].intersection(*candidates[1:]) if len(candidates) > 1 else candidates[0]
+
+        query = " ".join(words)
+        entries = self.entries
+
+        def rank(student_id):
+            # Primero quien empieza por lo escrito, luego por apellido y nombre
+            entry = entries[student_id]
+            return (not entry.full_name.startswith(query), entry.sort_key)
+
+        return [entries[student_id].item for student_id in heapq.nsmallest(limit, matches, key=rank)]
+
+class StudentTypeahead:
+    """
+    Índice en memoria para el autocompletado de alumnos, uno por escuela.
+
+    Se carga completo al arrancar y después se actualiza con los alumnos que
+    cambian en cada transacción confirmada en este proceso. Los cambios hechos
+    desde otros workers se leen de ``student_changes`` con ``sync`` antes de
+    responder, de modo que las búsquedas no consultan la tabla de alumnos.
+    """
+
+    def __init__(self):
+        self._rosters: Dict[Optional[int], SchoolRoster] = {}
+        self._lock = threading.Lock()
+        self._warm = False
+        self._last_change_id = 0
+        # Ids de cambio ya aplicados dentro de la ventana de relectura
+        self._seen_changes: Set[int] = set()
+        self._synced_at = 0.0
+
+    @property
+    def is_warm(self) -> bool:
+        return self._warm
+
+    def warm(self, db: Session) -> int:
+        """Carga todos los alumnos y sustituye el índice actual. Devuelve cuántos se cargaron."""
+        # Se lee antes que los alumnos: lo que se confirme durante la carga se aplicará en el siguiente sync
+        last_change_id = db.execute(select(func.max(StudentChange.id))).scalar() or 0
+        seen_changes = set(db.execute(
+            select(StudentChange.id).where(StudentChange.id > last_change_id - _CHANGE_LOOKBACK)
+        ).scalars())
+        rosters: Dict[Optional[int], SchoolRoster] = {}
+        count = 0
+        for row in db.execute(_students_query()):
+            rosters.setdefault(row.school_id, SchoolRoster()).add(build_entry(row))
+            count += 1
+        with self._lock:
+            self._rosters = rosters
+            self._warm = True
+            self._last_change_id = last_change_id
+            self._seen_changes = seen_changes
+            self._synced_at = time.monotonic()
+        return count
+
+    def sync(self, db: Session) -> int:
+        """
+        Aplica los cambios de alumnos registrados desde la última sincronización,
+        incluidos los de otros workers. Carga el índice completo si no estaba cargado
+        o si lleva más tiempo sin sincronizar del que se conservan los cambios.
+
+        Returns:
+            Número de cambios aplicados
+        """
+        retention = settings.TYPEAHEAD_CHANGE_RETENTION_HOURS * 3600
+        if not self._warm or time.monotonic() - self._synced_at > retention:
+            self.warm(db)
+            return 0
+
+        floor = max(self._last_change_id - _CHANGE_LOOKBACK, 0)
+        rows = [
+            row for row in db.execute(
+                select(StudentChange.id, StudentChange.student_id).where(StudentChange.id > floor)
+            )
+            if row.id not in self._seen_changes
+        ]
+        if rows:
+            self.apply(_load_entries(db.connection(), {row.student_id for row in rows}))
+        with self._lock:
+            if rows:
+                self._last_change_id = max(self._last_change_id, max(row.id for row in rows))
+                floor = self._last_change_id - _CHANGE_LOOKBACK
+                self._seen_changes = {
+                    change_id for change_id in self._seen_changes.union(row.id for row in rows)
+                    if change_id > floor
+                }
+            self._synced_at = time.monotonic()
+        return len(rows)
+
+    def apply(self, changes: Dict[int, Optional[TypeaheadEntry]]):
+        """Aplica altas, cambios (entrada) y bajas (``None``) de alumnos ya confirmados."""
+        if not self._warm:
+            return
+        with self._lock:
+            for student_id, entry in changes.items():
+                for roster in self._rosters.values():
+                    if student_id in roster.entries:
+                        roster.remove(student_id)
+                if entry is not None:
+                    self._rosters.setdefault(entry.school_id, SchoolRoster()).add(entry)
+
+    def search(self, school_id: Optional[int], query: str, limit: Optional[int] = None) -> List[dict]:
+        """
+        Devuelve los alumnos de la escuela cuyo nombre o matrícula empieza por lo escrito.
+
+        Args:
+            school_id: Escuela del usuario
+            query: Texto escrito hasta ahora
+            limit: Número máximo de resultados
+
+        Returns:
+            Lista de alumnos, primero los que mejor coinciden
+        """
+        words = normalize_search_text(query).split()
+        if not words:
+            return []
+        with self._lock:
+            roster = self._rosters.get(school_id)
+            if roster is None:
+                return []
+            return roster.search(words, limit or settings.TYPEAHEAD_MAX_RESULTS)
+
+    def clear(self):
+        with self._lock:
+            self._rosters = {}
+            self._warm = False
+            self._last_change_id = 0
+            self._seen_changes = set()
+
+student_typeahead = StudentTypeahead()
+
+def _students_query():
+    return select(
+        Student.id,
+        Student.school_id,
+        Student.first_name,
+        Student.last_name,
+        Student.enrollment_id,
+        type_coerce(Classroom.grade_level, String).label("grade_level")
+    ).outerjoin(Classroom, Classroom.id == Student.classroom_id)
+
+def _load_entries(connection: Connection, student_ids: Iterable[int]) -> Dict[int, Optional[TypeaheadEntry]]:
+    """Entradas actuales de los alumnos indicados; ``None`` para los que ya no existen."""
+    changes: Dict[int, Optional[TypeaheadEntry]] = {student_id: None for student_id in student_ids}
+    for row in connection.execute(_students_query().where(Student.id.in_(changes.keys()))):
+        changes[row.id] = build_entry(row)
+    return changes
+
+def prune_student_changes(db: Session, retention_hours: Optional[int] = None) -> int:
+    """Borra los cambios de alumnos más antiguos que la retención. Devuelve cuántos se borraron."""
+    retention_hours = retention_hours or settings.TYPEAHEAD_CHANGE_RETENTION_HOURS
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    deleted = db.execute(delete(StudentChange).where(StudentChange.created_at < cutoff)).rowcount
+    db.commit()
+    return deleted
+
+def _collect_after_flush(session: Session, flush_context):
+    """
+    Registra en ``student_changes`` los alumnos cambiados, dentro de la misma transacción,
+    y los guarda en la sesión para aplicarlos al índice de este proceso solo si se confirma.
+    """
+    student_ids: Set[int] = set()
+    classroom_ids: Set[int] = set()
+    for instance in session.new:
+        if isinstance(instance, Student):
+            student_ids.add(instance.id)
+    for instance in session.dirty:
+        if isinstance(instance, Student):
+            state = inspect(instance)
+            if any(state.attrs[field].history.has_changes() for field in _STUDENT_FIELDS):
+                student_ids.add(instance.id)
+        elif isinstance(instance, Classroom) and inspect(instance).attrs.grade_level.history.has_changes():
+            classroom_ids.add(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, Student):
+            student_ids.add(instance.id)
+
+    if not (student_ids or classroom_ids):
+        return
+
+    connection = session.connection()
+    if classroom_ids:
+        student_ids.update(connection.execute(
+            select(Student.id).where(Student.classroom_id.in_(classroom_ids))
+        ).scalars())
+    if not student_ids:
+        return
+
+    connection.execute(insert(StudentChange), [{"student_id": student_id} for student_id in sorted(student_ids)])
+    if student_typeahead.is_warm:
+        session.info.setdefault(_PENDING_KEY, {}).update(_load_entries(connection, student_ids))
+
+def _apply_after_commit(session: Session):
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        student_typeahead.apply(changes)
+
+def _discard_after_rollback(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+for _name, _listener in (
+    ("after_flush", _collect_after_flush),
+    ("after_commit", _apply_after_commit),
+    ("after_rollback", _discard_after_rollback)
+):
+    if not event.contains(Session, _name, _listener):
+        event.listen(Session, _name, _listener)
@@ -0,0 +1,141 @@
+from typing import Callable, Optional, Set
+import asyncio
+import logging
+
+import redis
+import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+# Delivers a (topic, message) to the sockets of this process
+Deliver = Callable[[str, str], int]
+
+class Backplane:
+    """
+    Pub/sub channel between the workers that hold WebSocket connections.
+
+    ``ConnectionManager`` publishes every event here instead of delivering it
+    itself, and each worker receives all events (its own included) and delivers
+    them to the sockets it holds. ``publish`` must not block the event loop.
+    """
+
+    async def start(self, deliver: Deliver):
+        raise NotImplementedError
+
+    def publish(self, topic: str, message: str):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+class InProcessBackplane(Backplane):
+    """
+    Backplane within one process, for tests and single-worker deployments.
+
+    Several managers sharing an instance behave like workers sharing a broker.
+    """
+
+    def __init__(self):
+        self._subscribers: Set[Deliver] = set()
+
+    async def start(self, deliver: Deliver):
+        self._subscribers.add(deliver)
+
+    def publish(self, topic: str, message: str):
+        for deliver in list(self._subscribers):
+            deliver(topic, message)
+
+    async def stop(self):
+        self._subscribers.clear()
+
+class RedisBackplane(Backplane):
+    """
+    Backplane over Redis pub/sub: one channel per topic under a common prefix.
+
+    Published events go through a bounded queue to a single sender task, which
+    keeps them in order and off the request path. A listener task subscribed to
+    the prefix delivers incoming events, and resubscribes if the connection drops.
+    While Redis is unreachable events are delivered to this worker's sockets only.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379",
+        client: Optional["redis.asyncio.Redis"] = None,
+        channel_prefix: str = "lymbus:ws:",
+        queue_size: int = 10_000,
+        retry_seconds: float = 1.0
+    ):
+        self.redis_url = redis_url
+        self.client = client
+        self.channel_prefix = channel_prefix
+        self.queue_size = queue_size
+        self.retry_seconds = retry_seconds
+        self.dropped = 0
+        self._deliver: Optional[Deliver] = None
+        self._outbox: Optional["asyncio.Queue[tuple]"] = None
+        self._tasks = []
+        self._subscribed: Optional[asyncio.Event] = None
+
+    async def start(self, deliver: Deliver):
+        if self.client is None:
+            self.client = redis.asyncio.from_url(self.redis_url, decode_responses=True)
+        await self.client.ping()  # Fail at startup if Redis is not reachable
+        self._deliver = deliver
+        self._outbox = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribed = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._send())]
+        # Events published from now on reach this worker too
+        await self._subscribed.wait()
+
+    def publish(self, topic: str, message: str):
+        try:
+            self._outbox.put_nowait((topic, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(f"WebSocket backplane queue full, dropping event for {topic}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await self.client.aclose()
+
+    async def _send(self):
+        while True:
+            topic, message = await self._outbox.get()
+            try:
+                await self.client.publish(f"{self.channel_prefix}{topic}", message)
+            except redis.RedisError as e:
+                logger.error(f"WebSocket backplane unavailable, delivering locally: {e}")
+                self._deliver(topic, message)
+
+    async def _listen(self):
+        prefix_length = len(self.channel_prefix)
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{self.channel_prefix}*")
+                self._subscribed.set()
+                while True:
+                    event = await pubsub.get_message(timeout=1.0)
+                    if event is not None and event["type"] == "pmessage":
+                        self._deliver(event["channel"][prefix_length:], event["data"])
+            except redis.RedisError as e:
+                logger.error(f"WebSocket backplane subscription lost, retrying: {e}")
+                await asyncio.sleep(self.retry_seconds)
+            finally:
+                await pubsub.aclose()
+
+def create_backplane(url: str) -> Optional[Backplane]:
+    """Backplane for a configured URL (None: deliver within this process only)"""
+    if not url:
+        return None
+    if url == "memory://":
+        return InProcessBackplane()
+    return RedisBackplane(url)
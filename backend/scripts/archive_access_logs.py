@@ -0,0 +1,29 @@
+import sys
+import os
+import argparse
+from datetime import datetime
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import SessionLocal, engine
+from app.models import create_tables
+from app.services.access_archive import archive_access_logs, hot_boundary
+
+def archivar_registros(antes):
+    """Mueve a access_logs_archive los registros de cursos escolares cerrados"""
+    create_tables(engine)
+    db = SessionLocal()
+    try:
+        archivados = archive_access_logs(db, antes)
+        print(f"{archivados} registros archivados (anteriores a {(antes or hot_boundary().date()).isoformat()})")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archiva los registros de acceso de cursos cerrados")
+    parser.add_argument("--antes", help="Primer día que se queda en access_logs, YYYY-MM-DD (por defecto el inicio del curso actual)")
+    args = parser.parse_args()
+
+    antes = datetime.strptime(args.antes, "%Y-%m-%d").date() if args.antes else None
+    archivar_registros(antes)
@@ -0,0 +1,103 @@
+import sys
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+
+# Base de datos temporal propia, antes de importar la aplicación
+_db_dir = tempfile.mkdtemp(prefix="lymbus-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+
+from app.main import app, rate_limiter
+from app.database import SessionLocal, engine
+from app.models import create_tables, User
+from app.services.auth import get_password_hash
+from app.services.password_hasher import password_hasher
+
+PASSWORD = "bench-password"
+
+def crear_usuarios(cantidad):
+    """Usuarios de prueba con la misma contraseña (el hash se calcula una vez)"""
+    create_tables(engine)
+    hashed = get_password_hash(PASSWORD)
+    db = SessionLocal()
+    try:
+        db.add_all([
+            User(
+                email=f"bench{i}@lymbus.test",
+                hashed_password=hashed,
+                first_name="Bench",
+                last_name=str(i),
+                is_active=True,
+                is_admin=False
+            )
+            for i in range(cantidad)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(int(len(valores) * p), len(valores) - 1)] if valores else 0.0
+
+async def medir(logins, concurrencia, intervalo):
+    """Lanza una avalancha de inicios de sesión y mide la latencia de otro endpoint mientras dura"""
+    # El límite de 5 intentos por IP impediría la avalancha
+    rate_limiter.rate_limits["auth_login"] = {"limit": logins * 2, "window": 900}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaforo = asyncio.Semaphore(concurrencia)
+        codigos = {}
+
+        async def login(i):
+            async with semaforo:
+                response = await client.post("/api/auth/token", data={
+                    "username": f"bench{i}@lymbus.test",
+                    "password": PASSWORD
+                })
+                codigos[response.status_code] = codigos.get(response.status_code, 0) + 1
+
+        latencias = []
+        terminado = asyncio.Event()
+
+        async def sondeo():
+            while not terminado.is_set():
+                inicio = time.perf_counter()
+                await client.get("/health")
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                await asyncio.sleep(intervalo)
+
+        tarea_sondeo = asyncio.create_task(sondeo())
+        inicio = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(logins)))
+        duracion = time.perf_counter() - inicio
+        terminado.set()
+        await tarea_sondeo
+
+    print(f"{logins} inicios de sesión ({concurrencia} simultáneos) en {duracion:.2f} s: {logins / duracion:.1f}/s")
+    print(f"Respuestas: {codigos}")
+    print(
+        f"/health durante la avalancha ({len(latencias)} peticiones): "
+        f"p50={percentil(latencias, 0.5):.1f} ms p99={percentil(latencias, 0.99):.1f} ms "
+        f"max={max(latencias, default=0):.1f} ms"
+    )
+    print(f"Pool de hash: {password_hasher.stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el rendimiento del inicio de sesión y la latencia del resto de la API durante una avalancha")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--intervalo", type=float, default=0.01, help="Segundos entre peticiones de sondeo")
+    args = parser.parse_args()
+
+    crear_usuarios(args.logins)
+    asyncio.run(medir(args.logins, args.concurrencia, args.intervalo))
+    password_hasher.shutdown()
@@ -0,0 +1,97 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.middleware.rate_limiting import InMemoryRateLimiter, SharedMemoryRateLimiter
+
+class ListaDeMarcas:
+    """Implementación anterior: una lista de marcas de tiempo por clave, sin limpieza"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.requests = {}
+        self.blocked_ips = {}
+
+    def is_allowed(self, key, limit, window):
+        now = self.clock()
+        if key in self.blocked_ips:
+            if now < self.blocked_ips[key]:
+                return False, {}
+            del self.blocked_ips[key]
+        if key not in self.requests:
+            self.requests[key] = []
+        self.requests[key] = [req_time for req_time in self.requests[key] if now - req_time < window]
+        if len(self.requests[key]) >= limit:
+            if len(self.requests[key]) >= limit * 2:
+                self.blocked_ips[key] = now + 900
+            return False, {}
+        self.requests[key].append(now)
+        return True, {}
+
+class Reloj:
+    """Reloj simulado: cada lectura avanza ``paso`` segundos"""
+
+    def __init__(self, paso):
+        self.now = 1_000_000.0
+        self.paso = paso
+
+    def __call__(self):
+        self.now += self.paso
+        return self.now
+
+def ejecutar(limiter, claves, peticiones, limite, ventana):
+    # Cada clave distinta (una IP de un escaneo) hace varias peticiones seguidas
+    for i in range(claves):
+        key = f"api_general:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+        for _ in range(peticiones):
+            limiter.is_allowed(key, limite, ventana)
+
+def medir(nombre, crear, claves, peticiones, limite, ventana, paso):
+    # Tiempo sin tracemalloc, que encarece cada reserva de memoria
+    limiter = crear(Reloj(paso))
+    inicio = time.perf_counter()
+    ejecutar(limiter, claves, peticiones, limite, ventana)
+    duracion = time.perf_counter() - inicio
+
+    limiter = crear(Reloj(paso))
+    tracemalloc.start()
+    ejecutar(limiter, claves, peticiones, limite, ventana)
+    memoria, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = claves * peticiones
+    if isinstance(limiter, ListaDeMarcas):
+        estado = f"{len(limiter.requests):,}"
+    elif isinstance(limiter, SharedMemoryRateLimiter):
+        estado = f"{limiter.buckets * limiter.BUCKET_SLOTS:,} huecos (fichero)"
+    else:
+        estado = f"{len(limiter):,}"
+    print(
+        f"{nombre:<22} {total / duracion:>10,.0f} peticiones/s  "
+        f"{duracion / total * 1e6:>6.2f} µs/petición  "
+        f"memoria={memoria / 1e6:>7.1f} MB (pico {pico / 1e6:.1f} MB)  claves={estado}"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara el rate limiter en memoria con la implementación anterior")
+    parser.add_argument("--claves", type=int, default=100_000, help="Claves distintas (IP y tipo de endpoint)")
+    parser.add_argument("--peticiones", type=int, default=20, help="Peticiones por clave")
+    parser.add_argument("--limite", type=int, default=100)
+    parser.add_argument("--ventana", type=int, default=60)
+    parser.add_argument("--paso", type=float, default=0.001, help="Segundos simulados entre peticiones")
+    args = parser.parse_args()
+
+    print(f"{args.claves:,} claves x {args.peticiones} peticiones, límite {args.limite}/{args.ventana}s")
+    medir("lista de marcas", ListaDeMarcas, args.claves, args.peticiones, args.limite, args.ventana, args.paso)
+    medir("ventana deslizante", lambda reloj: InMemoryRateLimiter(clock=reloj),
+          args.claves, args.peticiones, args.limite, args.ventana, args.paso)
+    with tempfile.TemporaryDirectory() as directorio:
+        fichero = os.path.join(directorio, "ratelimit")
+        medir("memoria compartida", lambda reloj: SharedMemoryRateLimiter(fichero, clock=reloj),
+              args.claves, args.peticiones, args.limite, args.ventana, args.paso)
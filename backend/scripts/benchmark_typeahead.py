@@ -0,0 +1,53 @@
+import sys
+import os
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.search_index import normalize_search_text
+from app.services.student_typeahead import SchoolRoster, build_entry
+
+NOMBRES = ["María", "José", "Sofía", "Mateo", "Valentina", "Santiago", "Camila", "Sebastián", "Lucía", "Diego"]
+APELLIDOS = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez", "Ramírez", "Núñez"]
+
+def medir(alumnos, busquedas, limite):
+    """Mide la latencia de búsqueda del autocompletado sobre una escuela sintética"""
+    roster = SchoolRoster()
+    for i in range(alumnos):
+        roster.add(build_entry(SimpleNamespace(
+            id=i,
+            school_id=1,
+            first_name=random.choice(NOMBRES),
+            last_name=f"{random.choice(APELLIDOS)} {random.choice(APELLIDOS)}",
+            enrollment_id=f"MAT{i:06d}",
+            grade_level="PRIMARIA_1"
+        )))
+
+    textos = []
+    for _ in range(busquedas):
+        palabra = random.choice(NOMBRES + APELLIDOS)
+        textos.append(palabra[:random.randint(1, len(palabra))])
+
+    tiempos = []
+    for texto in textos:
+        inicio = time.perf_counter()
+        # Igual que StudentTypeahead.search: el índice guarda los nombres normalizados
+        roster.search(normalize_search_text(texto).split(), limite)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    tiempos.sort()
+    p50 = tiempos[len(tiempos) // 2]
+    p99 = tiempos[int(len(tiempos) * 0.99)]
+    print(f"{alumnos} alumnos, {busquedas} búsquedas: p50={p50:.3f} ms p99={p99:.3f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide la latencia del índice de autocompletado")
+    parser.add_argument("--alumnos", type=int, default=5000)
+    parser.add_argument("--busquedas", type=int, default=10000)
+    parser.add_argument("--limite", type=int, default=10)
+    args = parser.parse_args()
+    medir(args.alumnos, args.busquedas, args.limite)
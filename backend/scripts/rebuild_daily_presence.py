@@ -0,0 +1,34 @@
+import sys
+import os
+import argparse
+from datetime import datetime, timedelta
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import SessionLocal, engine
+from app.models import create_tables
+from app.services.presence_service import get_presence_date, rebuild_daily_presence
+
+def reconstruir_presencia(desde, hasta):
+    """Reconstruye el estado de presencia diario a partir de access_logs"""
+    create_tables(engine)
+    db = SessionLocal()
+    try:
+        dia = desde
+        while dia <= hasta:
+            alumnos = rebuild_daily_presence(dia, db)
+            print(f"{dia.isoformat()}: {alumnos} alumnos con registros")
+            dia += timedelta(days=1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruye la tabla daily_presence")
+    parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD (por defecto hoy)")
+    parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD (por defecto la inicial)")
+    args = parser.parse_args()
+
+    desde = datetime.strptime(args.desde, "%Y-%m-%d").date() if args.desde else get_presence_date()
+    hasta = datetime.strptime(args.hasta, "%Y-%m-%d").date() if args.hasta else desde
+    reconstruir_presencia(desde, hasta)
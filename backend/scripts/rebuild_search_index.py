@@ -0,0 +1,22 @@
+import sys
+import os
+
+# Añadir el directorio raíz al path para importar los módulos de la aplicación
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.database import SessionLocal, engine
+from app.models import create_tables
+from app.services.search_index import rebuild_search_index
+
+def reconstruir_indice():
+    """Reconstruye el índice de búsqueda de alumnos (trigramas sin acentos)"""
+    create_tables(engine)
+    db = SessionLocal()
+    try:
+        alumnos = rebuild_search_index(db)
+        print(f"Índice de búsqueda reconstruido: {alumnos} alumnos")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    reconstruir_indice()
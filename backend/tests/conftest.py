@@ -1,17 +1,22 @@
 import pytest
 import tempfile
 import os
+from datetime import date
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models.base import Base
 from app.models.user import User, Staff, Guardian
-from app.models.school import School, Student, Classroom
+from app.models.school import School, Student, Classroom, GradeLevel
 from app.models.access import AccessLog, QRCode
 from app.models.notification import Notification
 from app.services.auth import get_password_hash
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.qr_service import qr_revocations
+from app.services.principal_cache import principal_cache
 
 # Create a temporary database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -42,6 +47,14 @@ def db_session(db_engine):
     transaction.rollback()
     connection.close()
 
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Drop process-wide caches so each test sees its own database state"""
+    yield
+    dashboard_stats_cache.invalidate()
+    qr_revocations.clear()
+    principal_cache.invalidate()
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a test client with database session override"""
@@ -51,7 +64,12 @@ def client(db_session):
         finally:
             pass
     
+    async def override_get_async_db():
+        # Async routes share the test transaction: the AsyncSession proxies db_session
+        yield AsyncSession(sync_session_class=lambda **kw: db_session)
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     yield TestClient(app)
     app.dependency_overrides.clear()
 
@@ -135,7 +153,7 @@ def test_student(db_session, test_school):
     # Create classroom first
     classroom = Classroom(
         name="Test Classroom",
-        grade_level="Primaria 1",
+        grade_level=GradeLevel.PRIMARIA_1,
         school_id=test_school.id
     )
     db_session.add(classroom)
@@ -146,7 +164,7 @@ def test_student(db_session, test_school):
         first_name="Test",
         last_name="Student",
         enrollment_id="TEST001",
-        date_of_birth="2015-01-01",
+        date_of_birth=date(2015, 1, 1),
         gender="M",
         school_id=test_school.id,
         classroom_id=classroom.id
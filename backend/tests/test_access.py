@@ -0,0 +1,644 @@
+import pytest
+import json
+from sqlalchemy import select
+from datetime import datetime, timedelta
+from fastapi import status
+from app.models import (
+    GateScanReceipt, AccessLog, AccessLogArchive, AccessType, AuthorizedBy, DailyPresence, PresenceStatus, QRCode,
+    AccessEventOutbox, Notification
+)
+from app.models.user import Guardian, Staff, User
+from app.services.auth import create_access_token
+from app.services.access_service import register_student_entry
+from app.services import access_outbox
+from app.services.access_outbox import count_exhausted_events, process_access_outbox
+from app.services.access_archive import access_log_source, archive_access_logs, hot_boundary, school_year_of
+from app.services.presence_service import get_presence_counts, rebuild_daily_presence
+from app.services.qr_service import (
+    QRImageCache, render_qr_image, qr_image_cache, create_qr_code, verify_qr_token,
+    validate_qr_code, qr_revocations
+)
+from app.services.qr_service import record_qr_revocation
+from app.services.qr_bulk import QRBulkJobRegistry, issue_qr_codes, qr_bulk_jobs, shutdown_render_pool
+from app.core.config import settings
+from tests.test_students import count_queries
+from tests.conftest import TestingSessionLocal
+
+@pytest.fixture
+def staff_headers(test_admin_user):
+    """Authorization headers built from a token, without going through the login rate limit"""
+    token = create_access_token(data={"sub": test_admin_user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def linked_guardian(db_session, test_parent_user, test_student):
+    """Guardian of the test parent, linked to the test student"""
+    guardian = test_parent_user.guardian_profile
+    guardian.students.append(test_student)
+    db_session.commit()
+    return guardian
+
+@pytest.fixture
+def qr_code(db_session, linked_guardian, test_student):
+    """Active QR code for the linked guardian"""
+    qr = QRCode(
+        guardian_id=linked_guardian.id,
+        student_id=test_student.id,
+        code="qr-batch-test",
+        is_active=True,
+        expires_at=datetime.utcnow() + timedelta(days=1)
+    )
+    db_session.add(qr)
+    db_session.commit()
+    return qr
+
+class TestAccessBatch:
+    """Test the batched entry/exit ingest endpoint"""
+
+    def test_batch_registers_entries_and_exits(self, client, db_session, staff_headers,
+                                               test_admin_user, test_student, qr_code):
+        """Valid scans are stored in one request and update presence in order"""
+        response = client.post("/api/access/batch", headers=staff_headers, json={
+            "scans": [
+                {"student_id": test_student.id, "access_type": "entrada"},
+                {"student_id": test_student.id, "access_type": "salida", "qr_code": qr_code.code}
+            ]
+        })
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["processed"] == 2
+        assert data["failed"] == 0
+        entry, exit_ = data["results"]
+        assert entry["success"] and exit_["success"]
+
+        entry_log = db_session.get(AccessLog, entry["access_log_id"])
+        assert entry_log.authorized_by == AuthorizedBy.MANUAL
+        assert entry_log.authorized_by_staff_id == test_admin_user.staff_profile.id
+        exit_log = db_session.get(AccessLog, exit_["access_log_id"])
+        assert exit_log.authorized_by == AuthorizedBy.QR_CODE
+        assert exit_log.guardian_id == qr_code.guardian_id
+
+        presence = db_session.query(DailyPresence).filter(
+            DailyPresence.student_id == test_student.id
+        ).one()
+        assert presence.status == PresenceStatus.RETIRADO
+        assert presence.last_access_log_id == exit_log.id
+
+    def test_batch_reports_invalid_items(self, client, db_session, staff_headers,
+                                         test_student, qr_code):
+        """Invalid scans fail individually with the single-scan messages"""
+        unlinked = Guardian(relationship_type="tío", phone="555-0300", address="")
+        db_session.add(unlinked)
+        db_session.commit()
+        qr_code.is_active = False
+        db_session.commit()
+
+        response = client.post("/api/access/batch", headers=staff_headers, json={
+            "scans": [
+                {"student_id": 999999, "access_type": "entrada"},
+                {"student_id": test_student.id, "access_type": "salida"},
+                {"student_id": test_student.id, "access_type": "salida", "qr_code": qr_code.code},
+                {"student_id": test_student.id, "access_type": "salida", "guardian_id": unlinked.id},
+                {"student_id": test_student.id, "access_type": "salida", "guardian_id": 999999},
+                {"student_id": test_student.id, "access_type": "entrada"}
+            ]
+        })
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["processed"] == 1
+        assert data["failed"] == 5
+        messages = [result["message"] for result in data["results"]]
+        assert messages[0] == "No se encontró un alumno con ID 999999"
+        assert messages[1] == "Se requiere un método de autorización"
+        assert messages[2] == "Código QR inválido o expirado"
+        assert messages[3] == "El tutor no está autorizado para este alumno"
+        assert messages[4] == "No se encontró un tutor con ID 999999"
+        assert data["results"][5]["success"]
+
+    def test_batch_requires_staff(self, client, test_parent_user, test_student):
+        """Guardians cannot submit gate batches"""
+        token = create_access_token(data={"sub": test_parent_user.email})
+        response = client.post(
+            "/api/access/batch",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"scans": [{"student_id": test_student.id, "access_type": "entrada"}]}
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+class TestAccessOutbox:
+    """Test that guardian notifications are created from the outbox"""
+
+    def test_entry_is_queued_not_notified(self, db_session, linked_guardian, test_student):
+        """Registering an access writes an outbox event and no notification"""
+
+        success, _, access_log = register_student_entry(
+            student_id=test_student.id,
+            access_type=AccessType.ENTRADA,
+            guardian_id=None,
+            authorized_by=AuthorizedBy.MANUAL,
+            authorized_by_staff_id=None,
+            notes=None,
+            db=db_session
+        )
+
+        assert success
+        event = db_session.query(AccessEventOutbox).one()
+        assert event.access_log_id == access_log.id
+        assert event.processed_at is None
+        assert db_session.query(Notification).count() == 0
+
+    def test_outbox_creates_notifications_in_bulk(self, db_session, linked_guardian, test_student):
+        """Processing the outbox notifies every guardian once per event"""
+
+        for access_type in (AccessType.ENTRADA, AccessType.SALIDA):
+            register_student_entry(
+                student_id=test_student.id,
+                access_type=access_type,
+                guardian_id=None,
+                authorized_by=AuthorizedBy.MANUAL,
+                authorized_by_staff_id=None,
+                notes=None,
+                db=db_session
+            )
+
+        processed, messages = process_access_outbox(db_session)
+
+        assert processed == 2
+        topics = [topic for topic, _ in messages]
+        assert topics.count(f"user:{linked_guardian.user_id}") == 2
+        assert topics.count(f"school:{test_student.school_id}") == 2
+        assert topics.count(f"classroom:{test_student.classroom_id}") == 2
+        notifications = db_session.query(Notification).order_by(Notification.id).all()
+        assert [n.user_id for n in notifications] == [linked_guardian.user_id] * 2
+        assert notifications[0].title == "Registro de entrada"
+        assert notifications[0].message.startswith("Test Student ha llegado a la escuela")
+        assert notifications[1].type == "info"
+        assert db_session.query(AccessEventOutbox).filter(
+            AccessEventOutbox.processed_at.is_(None)
+        ).count() == 0
+        assert process_access_outbox(db_session) == (0, [])
+
+    def test_failing_event_is_charged_alone(self, db_session, monkeypatch, linked_guardian, test_student):
+        """A bad event does not hold back or charge the rest of its batch"""
+        for access_type in (AccessType.ENTRADA, AccessType.SALIDA):
+            register_student_entry(
+                student_id=test_student.id,
+                access_type=access_type,
+                guardian_id=None,
+                authorized_by=AuthorizedBy.MANUAL,
+                authorized_by_staff_id=None,
+                notes=None,
+                db=db_session
+            )
+        build = access_outbox.build_access_notification
+
+        def failing_exit(student_name, access_type, occurred_at):
+            if access_type == AccessType.SALIDA:
+                raise ValueError("bad exit")
+            return build(student_name, access_type, occurred_at)
+
+        monkeypatch.setattr(access_outbox, "build_access_notification", failing_exit)
+
+        processed, _ = process_access_outbox(db_session)
+
+        assert processed == 1
+        assert db_session.query(Notification).one().title == "Registro de entrada"
+        entry, exit_ = db_session.query(AccessEventOutbox).order_by(AccessEventOutbox.id).all()
+        assert entry.processed_at is not None and entry.attempts == 1
+        assert exit_.processed_at is None and exit_.attempts == 1
+        assert exit_.last_error == "bad exit"
+
+        for _ in range(settings.ACCESS_OUTBOX_MAX_ATTEMPTS - 1):
+            process_access_outbox(db_session)
+        assert count_exhausted_events(db_session) == 1
+        assert process_access_outbox(db_session) == (0, [])
+
+class TestKeysetPagination:
+    """Test cursor pagination of the access log listings"""
+
+    def test_student_logs_pages_do_not_overlap(self, client, staff_headers, test_student):
+        """Logs sharing a timestamp are split across pages without repeats or gaps"""
+        client.post("/api/access/batch", headers=staff_headers, json={
+            "scans": [{"student_id": test_student.id, "access_type": "entrada"} for _ in range(5)]
+        })
+
+        seen, cursor = [], None
+        for _ in range(3):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = client.get(f"/api/attendance/logs/student/{test_student.id}",
+                                  headers=staff_headers, params=params)
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(log["id"] for log in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert cursor is None
+        assert seen == sorted(seen, reverse=True)
+        assert len(set(seen)) == 5
+
+    def test_invalid_cursor_is_rejected(self, client, staff_headers):
+        """A malformed cursor is a client error"""
+        response = client.get("/api/access/users/", headers=staff_headers, params={"cursor": "nope"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+class TestAccessExport:
+    """Test the streaming access log export"""
+
+    def test_export_ndjson_and_csv(self, client, db_session, staff_headers, test_student, qr_code):
+        """Both formats contain the joined names, filtered by classroom"""
+        client.post("/api/access/batch", headers=staff_headers, json={
+            "scans": [
+                {"student_id": test_student.id, "access_type": "entrada"},
+                {"student_id": test_student.id, "access_type": "salida", "qr_code": qr_code.code}
+            ]
+        })
+
+        response = client.get("/api/access/export", headers=staff_headers,
+                              params={"classroom_id": test_student.classroom_id})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["access_type"] for r in records] == ["entrada", "salida"]
+        assert records[0]["student_name"] == "Test Student"
+        assert records[0]["staff_name"] == "Admin User"
+        assert records[1]["guardian_name"] == "Parent User"
+
+        response = client.get("/api/access/export", headers=staff_headers, params={"format": "csv"})
+        lines = response.text.splitlines()
+        assert lines[0].startswith("id,timestamp,access_type")
+        assert len(lines) == 3
+
+        response = client.get("/api/access/export", headers=staff_headers,
+                              params={"classroom_id": test_student.classroom_id + 1})
+        assert response.text == ""
+
+class TestAccessArchive:
+    """Test moving closed school years out of the hot access log table"""
+
+    @pytest.fixture
+    def old_and_new_logs(self, db_session, test_student):
+        """One entry from the previous school year and one from today"""
+        old = AccessLog(
+            student_id=test_student.id,
+            access_type=AccessType.ENTRADA,
+            authorized_by=AuthorizedBy.MANUAL,
+            timestamp=hot_boundary() - timedelta(days=30)
+        )
+        new = AccessLog(
+            student_id=test_student.id,
+            access_type=AccessType.ENTRADA,
+            authorized_by=AuthorizedBy.MANUAL,
+            timestamp=datetime.now()
+        )
+        db_session.add_all([old, new])
+        db_session.commit()
+        return old.id, old.timestamp, new.id
+
+    def test_archive_moves_closed_school_years(self, db_session, test_student, old_and_new_logs):
+        """Old rows keep their ID and school, and only today stays in access_logs"""
+        old_id, old_timestamp, new_id = old_and_new_logs
+
+        assert archive_access_logs(db_session, batch_size=1) == 1
+        assert archive_access_logs(db_session) == 0
+
+        assert [row.id for row in db_session.query(AccessLog.id)] == [new_id]
+        archived = db_session.get(AccessLogArchive, old_id)
+        assert archived.school_id == test_student.school_id
+        assert archived.school_year == school_year_of(old_timestamp.date())
+        assert access_log_source(hot_boundary()) is AccessLog.__table__
+
+        with pytest.raises(ValueError):
+            archive_access_logs(db_session, before=hot_boundary().date() + timedelta(days=1))
+
+    def test_archived_ids_are_not_reused(self, db_session, test_student):
+        """Emptying access_logs does not hand out archived IDs again"""
+        old = [
+            AccessLog(student_id=test_student.id, access_type=AccessType.ENTRADA,
+                      authorized_by=AuthorizedBy.MANUAL, timestamp=hot_boundary() - timedelta(days=days))
+            for days in (30, 20)
+        ]
+        db_session.add_all(old)
+        db_session.commit()
+        archived_ids = {log.id for log in old}
+
+        assert archive_access_logs(db_session) == 2
+        assert db_session.query(AccessLog).count() == 0
+
+        new = AccessLog(student_id=test_student.id, access_type=AccessType.ENTRADA,
+                        authorized_by=AuthorizedBy.MANUAL, timestamp=datetime.now())
+        db_session.add(new)
+        db_session.commit()
+        assert new.id > max(archived_ids)
+
+        source = access_log_source(hot_boundary() - timedelta(days=60))
+        ids = [row.id for row in db_session.execute(select(source.c.id))]
+        assert len(ids) == len(set(ids)) == 3
+
+    def test_history_spans_archive(self, client, db_session, staff_headers, test_student, old_and_new_logs):
+        """Student history, export and presence rebuilds still see archived rows"""
+        old_id, old_timestamp, new_id = old_and_new_logs
+        archive_access_logs(db_session)
+
+        response = client.get(f"/api/attendance/logs/student/{test_student.id}",
+                              headers=staff_headers, params={"limit": 1})
+        assert [log["id"] for log in response.json()] == [new_id]
+        response = client.get(f"/api/attendance/logs/student/{test_student.id}", headers=staff_headers,
+                              params={"limit": 1, "cursor": response.headers["X-Next-Cursor"]})
+        assert [log["id"] for log in response.json()] == [old_id]
+        assert "X-Next-Cursor" not in response.headers
+
+        response = client.get("/api/access/export", headers=staff_headers,
+                              params={"date_from": old_timestamp.date().isoformat()})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [old_id, new_id]
+
+        assert rebuild_daily_presence(old_timestamp.date(), db_session) == 1
+        assert get_presence_counts(db_session, old_timestamp.date())["entered"] == 1
+
+class TestQRImages:
+    """Test the cached QR image rendering and its binary endpoint"""
+
+    def test_cache_evicts_least_recently_used_within_budget(self):
+        """Entries are dropped oldest-first once the byte budget is exceeded"""
+        cache = QRImageCache(max_bytes=10)
+        cache.put(("a", "png", 10, 4), b"1234", '"a"')
+        cache.put(("b", "png", 10, 4), b"1234", '"b"')
+        assert cache.get(("a", "png", 10, 4)) == (b"1234", '"a"')
+
+        cache.put(("c", "png", 10, 4), b"1234", '"c"')
+        assert cache.get(("b", "png", 10, 4)) is None
+        assert cache.get(("a", "png", 10, 4)) is not None
+        assert cache.size == 8
+
+        cache.put(("d", "png", 10, 4), b"x" * 11, '"d"')
+        assert cache.get(("d", "png", 10, 4)) is None
+
+    def test_render_is_cached_per_parameters(self):
+        """The same code and parameters are rendered once"""
+        qr_image_cache.invalidate()
+        png, etag = render_qr_image("qr-cache-test")
+        assert png.startswith(b"\x89PNG")
+        assert render_qr_image("qr-cache-test")[0] is png
+
+        svg, svg_etag = render_qr_image("qr-cache-test", "svg")
+        assert svg.startswith(b"<svg") and b'width="290"' in svg
+        assert svg_etag != etag
+        assert render_qr_image("qr-cache-test", box_size=20)[0] is not png
+
+    def test_image_endpoint_returns_binary_with_etag(self, client, test_parent_user, qr_code):
+        """Guardians get their code as PNG or SVG and a 304 when unchanged"""
+        token = create_access_token(data={"sub": test_parent_user.email})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.get(f"/api/access/qr-codes/{qr_code.id}/image", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "image/png"
+        assert response.content.startswith(b"\x89PNG")
+        etag = response.headers["etag"]
+
+        response = client.get(f"/api/access/qr-codes/{qr_code.id}/image",
+                              headers={**headers, "If-None-Match": etag})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        response = client.get(f"/api/access/qr-codes/{qr_code.id}/image",
+                              headers=headers, params={"format": "svg"})
+        assert response.headers["content-type"].startswith("image/svg+xml")
+        assert response.headers["etag"] != etag
+
+    def test_image_endpoint_is_limited_to_owner(self, client, db_session, qr_code):
+        """Another guardian cannot fetch the image"""
+        from app.models import User
+        from app.services.auth import get_password_hash
+        other = User(email="other@test.com", hashed_password=get_password_hash("x"),
+                     first_name="Other", last_name="Parent", is_active=True)
+        db_session.add(other)
+        db_session.commit()
+        db_session.add(Guardian(user_id=other.id, relationship_type="madre"))
+        db_session.commit()
+
+        token = create_access_token(data={"sub": other.email})
+        response = client.get(f"/api/access/qr-codes/{qr_code.id}/image",
+                              headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+class TestSignedQRCodes:
+    """Test stateless QR validation and persisted revocations"""
+
+    def test_signed_code_is_validated_without_qr_lookup(self, db_session, linked_guardian, test_student):
+        """A signed code carries guardian, student and expiry and is checked in memory"""
+        qr = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        claims = verify_qr_token(qr.code)
+        assert (claims.id, claims.guardian_id, claims.student_id) == (qr.id, linked_guardian.id, test_student.id)
+
+        qr_revocations.refresh(db_session, force=True)
+        with count_queries(db_session) as statements:
+            assert validate_qr_code(qr.code, db_session) == claims
+        assert not any("qr_codes" in statement for statement in statements)
+
+        body, signature = qr.code.rsplit(".", 1)
+        forged = body.replace(f".{test_student.id}.", f".{test_student.id + 1}.") + "." + signature
+        assert verify_qr_token(forged) is None
+        assert validate_qr_code(forged, db_session) is None
+
+    def test_revocation_is_persisted_and_applied(self, client, db_session, test_parent_user,
+                                                 linked_guardian, test_student):
+        """Revoking through the API blocks the code in memory and survives a reload"""
+        qr = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        token = create_access_token(data={"sub": test_parent_user.email})
+
+        response = client.post(f"/api/access/qr-codes/{qr.id}/revoke",
+                               headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == status.HTTP_200_OK
+        assert qr.id in qr_revocations
+        assert validate_qr_code(qr.code, db_session) is None
+
+        qr_revocations.clear()
+        assert qr_revocations.load(db_session) == 1
+        assert qr.id in qr_revocations
+        db_session.refresh(qr)
+        assert qr.is_active is False
+
+    def test_batch_checkout_accepts_signed_code(self, client, db_session, staff_headers,
+                                                linked_guardian, test_student):
+        """Exits authorized with a signed code record the guardian from the token"""
+        qr = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        response = client.post("/api/access/batch", headers=staff_headers, json={
+            "scans": [{"student_id": test_student.id, "access_type": "salida", "qr_code": qr.code}]
+        })
+        result = response.json()["results"][0]
+        assert result["success"], result["message"]
+        assert db_session.get(AccessLog, result["access_log_id"]).guardian_id == linked_guardian.id
+
+class TestBulkQRCodes:
+    """Test issuing and downloading QR codes for a whole classroom"""
+
+    @pytest.fixture(autouse=True)
+    def single_render_worker(self, monkeypatch, db_session):
+        """Keep the render pool small, save progress in the test transaction and shut the pool down"""
+        monkeypatch.setattr(settings, "QR_BULK_RENDER_WORKERS", 1)
+        monkeypatch.setattr(qr_bulk_jobs, "session_factory",
+                            lambda: TestingSessionLocal(bind=db_session.connection()))
+        yield
+        shutdown_render_pool()
+
+    def test_issue_creates_signed_codes(self, db_session, linked_guardian, test_student):
+        """One code per guardian link, valid at the gate"""
+        issued = issue_qr_codes(db_session, classroom_id=test_student.classroom_id)
+        assert [(code.student_name, code.guardian_name) for code in issued] == [("Test Student", "Parent User")]
+        assert db_session.get(QRCode, issued[0].id).code == issued[0].code
+        assert validate_qr_code(issued[0].code, db_session).guardian_id == linked_guardian.id
+
+        with pytest.raises(ValueError):
+            issue_qr_codes(db_session)
+
+    def test_bulk_endpoint_streams_zip_and_html(self, client, staff_headers, linked_guardian, test_student):
+        """The job reports progress and both downloads contain every code"""
+        import io
+        import zipfile
+
+        response = client.post("/api/access/qr-codes/bulk", headers=staff_headers,
+                               json={"classroom_id": test_student.classroom_id})
+        assert response.status_code == status.HTTP_200_OK
+        job = response.json()
+        assert (job["status"], job["total"], job["rendered"]) == ("pending", 1, 0)
+
+        response = client.get(job["download_url"], headers=staff_headers)
+        assert response.headers["content-type"] == "application/zip"
+        names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        assert len(names) == 1 and names[0].startswith("Test_Classroom/Test_Student_TEST001_Parent_User_")
+
+        progress = client.get(job["progress_url"], headers=staff_headers).json()
+        assert (progress["status"], progress["rendered"]) == ("completed", 1)
+
+        response = client.get(job["download_url"], headers=staff_headers, params={"format": "html"})
+        assert response.headers["content-type"].startswith("text/html")
+        assert response.text.count('<div class="card">') == 1
+        assert "Parent User" in response.text
+
+    def test_job_is_served_by_any_worker(self, db_session, test_admin_user, linked_guardian, test_student):
+        """Another worker (registry) rebuilds the job and its progress from the database"""
+        issued = issue_qr_codes(db_session, classroom_id=test_student.classroom_id)
+        job = qr_bulk_jobs.create(db_session, issued, test_admin_user.id)
+
+        other_worker = QRBulkJobRegistry(session_factory=qr_bulk_jobs.session_factory)
+        rebuilt = other_worker.get(db_session, job.id, test_admin_user)
+        assert rebuilt.codes == issued
+        assert rebuilt.progress() == job.progress()
+
+        job.status, job.rendered = "completed", 1
+        qr_bulk_jobs.save_progress(job)
+        assert other_worker.get(db_session, job.id, test_admin_user, with_codes=False).progress() == {
+            "job_id": job.id, "status": "completed", "total": 1, "rendered": 1
+        }
+
+    def test_job_is_visible_only_to_its_creator(self, client, db_session, staff_headers,
+                                                linked_guardian, test_student):
+        """Another staff member cannot follow or download someone else's codes"""
+        other = User(email="other-staff@test.com", hashed_password="x", first_name="O", last_name="S",
+                     is_active=True, is_admin=False)
+        db_session.add(other)
+        db_session.commit()
+        db_session.add(Staff(user_id=other.id, position="Teacher", school_id=test_student.school_id))
+        db_session.commit()
+        other_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': other.email})}"}
+
+        job = client.post("/api/access/qr-codes/bulk", headers=staff_headers,
+                          json={"classroom_id": test_student.classroom_id}).json()
+
+        for url in (job["progress_url"], job["download_url"]):
+            assert client.get(url, headers=other_headers).status_code == status.HTTP_404_NOT_FOUND
+        assert client.get(job["progress_url"], headers=staff_headers).status_code == status.HTTP_200_OK
+
+class TestGateSync:
+    """Test the offline scanner sync protocol"""
+
+    def test_delta_follows_new_and_revoked_codes(self, client, db_session, staff_headers,
+                                                 linked_guardian, test_student):
+        """A full pull lists valid codes; later pulls only carry what changed"""
+        first = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+
+        response = client.get("/api/access/sync/qr-codes", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        full = response.json()
+        assert full["full"] is True
+        assert [code["code"] for code in full["codes"]] == [first.code]
+        assert full["students"][0]["enrollment_id"] == "TEST001"
+
+        second = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        record_qr_revocation(first, db_session)
+        delta = client.get("/api/access/sync/qr-codes", headers=staff_headers,
+                           params={"since": full["version"]}).json()
+        assert [code["id"] for code in delta["codes"]] == [second.id]
+        assert delta["revoked"] == [first.id]
+
+        again = client.get("/api/access/sync/qr-codes", headers=staff_headers,
+                           params={"since": delta["version"]}).json()
+        assert again["codes"] == [] and again["revoked"] == []
+
+        response = client.get("/api/access/sync/qr-codes", headers=staff_headers, params={"since": "x"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_uploaded_scans_are_reconciled_once(self, client, db_session, staff_headers,
+                                                linked_guardian, test_student):
+        """Offline scans keep their time, and re-uploading them is a no-op"""
+        qr = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        # Seconds apart: scans minutes apart fell on two presence days when run just after midnight
+        entered = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=30)
+        upload = {
+            "device_id": "gate-1",
+            "events": [
+                {"client_event_id": "e2", "student_id": test_student.id, "access_type": "salida",
+                 "qr_code": qr.code, "scanned_at": (entered + timedelta(seconds=20)).isoformat() + "Z"},
+                {"client_event_id": "e1", "student_id": test_student.id, "access_type": "entrada",
+                 "scanned_at": entered.isoformat() + "Z"}
+            ]
+        }
+
+        data = client.post("/api/access/sync/scans", headers=staff_headers, json=upload).json()
+        assert (data["processed"], data["failed"], data["duplicates"]) == (2, 0, 0)
+        exit_log = db_session.get(AccessLog, data["results"][0]["access_log_id"])
+        entry_log = db_session.get(AccessLog, data["results"][1]["access_log_id"])
+        assert entry_log.timestamp.replace(tzinfo=None) == entered
+        assert exit_log.guardian_id == linked_guardian.id
+        assert entry_log.id < exit_log.id
+
+        presence = db_session.query(DailyPresence).filter(DailyPresence.student_id == test_student.id).one()
+        assert presence.status == PresenceStatus.RETIRADO
+
+        again = client.post("/api/access/sync/scans", headers=staff_headers, json=upload).json()
+        assert (again["processed"], again["duplicates"]) == (0, 2)
+        assert [r["access_log_id"] for r in again["results"]] == [r["access_log_id"] for r in data["results"]]
+        assert db_session.query(AccessLog).count() == 2
+        assert db_session.query(GateScanReceipt).count() == 2
+
+    def test_late_older_scan_does_not_override_presence(self, client, db_session, staff_headers,
+                                                        linked_guardian, test_student):
+        """An entry synced after a newer exit keeps the student out"""
+        qr = create_qr_code(linked_guardian.id, test_student.id, 1, db_session)
+        exited = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=10)
+        data = client.post("/api/access/sync/scans", headers=staff_headers, json={
+            "device_id": "gate-1",
+            "events": [{"client_event_id": "exit", "student_id": test_student.id, "access_type": "salida",
+                        "qr_code": qr.code, "scanned_at": exited.isoformat() + "Z"}]
+        }).json()
+        exit_log_id = data["results"][0]["access_log_id"]
+
+        late = client.post("/api/access/sync/scans", headers=staff_headers, json={
+            "device_id": "gate-2",
+            "events": [{"client_event_id": "entry", "student_id": test_student.id, "access_type": "entrada",
+                        "scanned_at": (exited - timedelta(seconds=20)).isoformat() + "Z"}]
+        }).json()
+        assert late["processed"] == 1
+
+        presence = db_session.query(DailyPresence).filter(DailyPresence.student_id == test_student.id).one()
+        db_session.refresh(presence)
+        assert presence.status == PresenceStatus.RETIRADO
+        assert presence.last_access_log_id == exit_log_id
+        assert presence.first_entry_at.replace(tzinfo=None) == exited - timedelta(seconds=20)
+
+        present = client.get("/api/attendance/present-students", headers=staff_headers).json()
+        assert test_student.id not in [log["student_id"] for log in present]
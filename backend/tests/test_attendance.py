@@ -0,0 +1,343 @@
+import pytest
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from fastapi import status
+from app.models import AccessLog, AccessType, AuthorizedBy, DailyPresence, PresenceStatus
+from app.models.school import Student
+from app.services.auth import create_access_token
+from app.services.access_service import register_student_entry
+from app.services.presence_service import (
+    get_presence_date,
+    get_presence_counts,
+    local_day_bounds_utc,
+    rebuild_daily_presence
+)
+from app.services.dashboard_stats import DashboardStatsCache, compute_dashboard_stats
+from app.services import dashboard_stats
+
+@pytest.fixture
+def staff_headers(test_admin_user):
+    """Authorization headers built from a token, without going through the login rate limit"""
+    token = create_access_token(data={"sub": test_admin_user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def second_student(db_session, test_student):
+    """Create a second student in the same classroom"""
+    student = Student(
+        first_name="Otro",
+        last_name="Alumno",
+        enrollment_id="TEST002",
+        gender="F",
+        school_id=test_student.school_id,
+        classroom_id=test_student.classroom_id
+    )
+    db_session.add(student)
+    db_session.commit()
+    db_session.refresh(student)
+    return student
+
+@pytest.fixture
+def local_timezone():
+    """Run the server in UTC-6 (no daylight saving time) for the duration of a test"""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Etc/GMT+6"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+def _register(db_session, student, access_type):
+    success, message, access_log = register_student_entry(
+        student_id=student.id,
+        access_type=access_type,
+        guardian_id=None,
+        authorized_by=AuthorizedBy.MANUAL,
+        authorized_by_staff_id=None,
+        notes=None,
+        db=db_session
+    )
+    assert success, message
+    return access_log
+
+class TestDailyPresence:
+    """Test the incrementally maintained daily presence state"""
+
+    def test_entry_marks_student_present(self, db_session, test_student):
+        """An entry creates the presence row in the same transaction"""
+        access_log = _register(db_session, test_student, AccessType.ENTRADA)
+
+        presence = db_session.query(DailyPresence).filter(
+            DailyPresence.student_id == test_student.id
+        ).one()
+        assert presence.status == PresenceStatus.PRESENTE
+        assert presence.school_id == test_student.school_id
+        assert presence.date == get_presence_date()
+        assert presence.first_entry_at is not None
+        assert presence.last_access_log_id == access_log.id
+
+    def test_exit_and_reentry_update_status(self, db_session, test_student):
+        """The state follows the latest access of the day"""
+        _register(db_session, test_student, AccessType.ENTRADA)
+        _register(db_session, test_student, AccessType.SALIDA)
+
+        counts = get_presence_counts(db_session, get_presence_date())
+        assert counts == {"present": 0, "entered": 1, "exited": 1}
+
+        _register(db_session, test_student, AccessType.ENTRADA)
+        counts = get_presence_counts(db_session, get_presence_date())
+        assert counts == {"present": 1, "entered": 1, "exited": 1}
+
+    def test_rebuild_matches_incremental_state(self, db_session, test_student, second_student):
+        """Rebuilding from access_logs yields the same counters"""
+        _register(db_session, test_student, AccessType.ENTRADA)
+        _register(db_session, second_student, AccessType.ENTRADA)
+        _register(db_session, second_student, AccessType.SALIDA)
+        today = get_presence_date()
+        expected = get_presence_counts(db_session, today)
+
+        assert rebuild_daily_presence(today, db_session) == 2
+        assert get_presence_counts(db_session, today) == expected
+
+    def test_rebuild_uses_local_day_in_utc(self, db_session, test_student, second_student, local_timezone):
+        """Logs are stored in UTC, so the local day starts at 06:00 UTC in UTC-6"""
+        today = get_presence_date()
+        start_utc = datetime.combine(today, datetime.min.time()) + timedelta(hours=6)
+        db_session.add_all([
+            # 20:00 local today, already tomorrow in UTC
+            AccessLog(student_id=test_student.id, access_type=AccessType.ENTRADA,
+                      authorized_by=AuthorizedBy.MANUAL, timestamp=start_utc + timedelta(hours=20)),
+            # 21:00 local yesterday, already today in UTC
+            AccessLog(student_id=second_student.id, access_type=AccessType.ENTRADA,
+                      authorized_by=AuthorizedBy.MANUAL, timestamp=start_utc - timedelta(hours=3))
+        ])
+        db_session.commit()
+
+        assert local_day_bounds_utc(today) == (start_utc, start_utc + timedelta(days=1))
+        assert rebuild_daily_presence(today, db_session) == 1
+        presence = db_session.query(DailyPresence).filter(DailyPresence.date == today).one()
+        assert presence.student_id == test_student.id
+
+class TestDashboardStats:
+    """Test the dashboard aggregate and its cache"""
+
+    def test_single_aggregate(self, db_session, test_student, second_student):
+        """All counters come from one statement, per school or overall"""
+        _register(db_session, test_student, AccessType.ENTRADA)
+        today = get_presence_date()
+
+        assert compute_dashboard_stats(db_session, today) == {
+            "total_students": 2, "present": 1, "entered": 1, "exited": 0
+        }
+        assert compute_dashboard_stats(db_session, today, school_id=test_student.school_id + 1) == {
+            "total_students": 0, "present": 0, "entered": 0, "exited": 0
+        }
+
+    def test_concurrent_requests_share_one_computation(self):
+        """Identical concurrent requests wait for the same computation"""
+        cache = DashboardStatsCache(ttl_seconds=60)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"present": len(calls)}
+
+        async def run():
+            results = await asyncio.gather(*(cache.get((1, "hoy"), compute) for _ in range(10)))
+            cached = await cache.get((1, "hoy"), compute)
+            cache.invalidate({(1, "hoy")})
+            fresh = await cache.get((1, "hoy"), compute)
+            return results, cached, fresh
+
+        results, cached, fresh = asyncio.run(run())
+        assert results == [{"present": 1}] * 10
+        assert cached == {"present": 1}
+        assert fresh == {"present": 2}
+
+    def test_cancelled_computation_does_not_hang_waiters(self):
+        """Waiters of a computation whose request was cancelled compute it themselves"""
+        cache = DashboardStatsCache(ttl_seconds=60)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(0.1)
+            return {"present": 1}
+
+        async def fast():
+            return {"present": 2}
+
+        async def run():
+            leader = asyncio.ensure_future(cache.get((1, "hoy"), slow))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(cache.get((1, "hoy"), fast))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await asyncio.wait_for(waiter, timeout=5)
+
+        assert asyncio.run(run()) == {"present": 2}
+
+    def test_expired_entries_are_pruned(self, monkeypatch):
+        """Entries of past keys do not accumulate once expired"""
+        cache = DashboardStatsCache(ttl_seconds=5)
+        now = [1000.0]
+        monkeypatch.setattr(dashboard_stats, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+        async def compute():
+            return {"present": 0}
+
+        async def run():
+            for day in range(10):
+                now[0] += 10
+                await cache.get((1, day), compute)
+
+        asyncio.run(run())
+        assert list(cache._entries) == [(1, 9)]
+
+    def test_access_invalidates_cached_dashboard(self, client, db_session, staff_headers, test_student):
+        """A committed entry is visible on the next dashboard request"""
+        response = client.get("/api/attendance/stats/dashboard", headers=staff_headers)
+        assert response.json()["currently_present"] == 0
+
+        _register(db_session, test_student, AccessType.ENTRADA)
+
+        response = client.get("/api/attendance/stats/dashboard", headers=staff_headers)
+        assert response.json()["currently_present"] == 1
+        assert response.json()["absent_today"] == 0
+
+class TestAttendanceEndpoints:
+    """Test attendance endpoints backed by the daily presence state"""
+
+    def test_dashboard_stats(self, client, db_session, staff_headers, test_student, second_student):
+        """Dashboard counters reflect entries and exits"""
+        _register(db_session, test_student, AccessType.ENTRADA)
+        _register(db_session, second_student, AccessType.SALIDA)
+
+        response = client.get("/api/access/stats/dashboard", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["totalStudents"] == 2
+        assert data["studentsPresent"] == 1
+        assert data["totalEntries"] == 1
+        assert data["totalExits"] == 1
+
+    def test_search_by_status(self, client, db_session, staff_headers, test_student, second_student):
+        """present/absent filters use the presence state"""
+        _register(db_session, test_student, AccessType.ENTRADA)
+
+        response = client.get("/api/students/search?status=present", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert [s["id"] for s in response.json()] == [test_student.id]
+
+        response = client.get("/api/students/search?status=absent", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert [s["id"] for s in response.json()] == [second_student.id]
+
+    def test_present_students(self, client, db_session, staff_headers, test_student, second_student):
+        """present-students returns the entry log of each present student"""
+        entry = _register(db_session, test_student, AccessType.ENTRADA)
+        _register(db_session, second_student, AccessType.ENTRADA)
+        _register(db_session, second_student, AccessType.SALIDA)
+
+        response = client.get("/api/attendance/present-students", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert [log["id"] for log in response.json()] == [entry.id]
+
+@pytest.fixture
+def aiosqlite_client(tmp_path):
+    """Client whose async routes run on a real aiosqlite engine, where lazy loads fail"""
+    from types import SimpleNamespace
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import NullPool
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.main import app
+    from app.database import get_async_db
+    from app.dependencies import get_current_user
+    from app.services.auth import get_current_active_user
+    from app.models.base import Base
+    from app.models.school import School
+    from app.models.user import User, Staff, Guardian
+    from app.models.notification import Notification
+
+    path = tmp_path / "async.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    with Session(sync_engine) as session:
+        school = School(name="Async School")
+        staff_user = User(email="staff@async.test", hashed_password="x", first_name="Staff", last_name="Async")
+        parent_user = User(email="parent@async.test", hashed_password="x", first_name="Tutor", last_name="Async")
+        session.add_all([school, staff_user, parent_user])
+        session.flush()
+        staff = Staff(user_id=staff_user.id, position="Portero", school_id=school.id)
+        student = Student(first_name="Ana", last_name="Async", enrollment_id="ASYNC001", gender="F", school_id=school.id)
+        guardian = Guardian(user_id=parent_user.id, relationship_type="madre", students=[student])
+        session.add_all([staff, guardian, Notification(title="Aviso", message="Hola", user_id=staff_user.id)])
+        session.commit()
+        ids = SimpleNamespace(student=student.id, staff=staff.id, user=staff_user.id, school=school.id)
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with sessions() as db:
+            yield db
+
+    current_user = SimpleNamespace(
+        id=ids.user, is_admin=True, is_active=True,
+        staff_profile=SimpleNamespace(id=ids.staff, school_id=ids.school)
+    )
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_current_active_user] = lambda: current_user
+    app.dependency_overrides[get_current_user] = lambda: current_user
+    yield TestClient(app), ids
+    app.dependency_overrides.clear()
+    asyncio.run(async_engine.dispose())
+
+class TestAsyncRoutes:
+    """Test the routes ported to the AsyncSession data path"""
+
+    def test_routes_on_aiosqlite(self, aiosqlite_client):
+        """Reads and writes go through aiosqlite without lazy loads outside the session"""
+        client, ids = aiosqlite_client
+
+        response = client.post(f"/api/attendance/entry/{ids.student}")
+        assert response.status_code == status.HTTP_200_OK
+        entry_id = response.json()["id"]
+
+        response = client.get("/api/attendance/present-students")
+        assert response.status_code == status.HTTP_200_OK
+        assert [log["id"] for log in response.json()] == [entry_id]
+
+        response = client.get(f"/api/students/{ids.student}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["attendance_status"] == "present"
+        assert response.json()["guardians"][0]["first_name"] == "Tutor"
+
+        response = client.get(f"/api/access/logs/student/{ids.student}")
+        assert response.status_code == status.HTTP_200_OK
+        assert [log["id"] for log in response.json()] == [entry_id]
+
+        response = client.get("/api/students/search?query=ana")
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get("/api/notifications/")
+        assert [n["title"] for n in response.json()] == ["Aviso"]
+
+        response = client.get("/api/attendance/stats/dashboard")
+        assert response.json()["currently_present"] == 1
+        response = client.get("/api/access/stats/dashboard")
+        assert response.json()["studentsPresent"] == 1
+        assert client.get("/api/notifications/unread/count").json() == {"unread_count": 1}
+        assert client.patch("/api/notifications/mark-all-read").json()["updated_count"] == 1
+        assert client.get("/api/notifications/unread/count").json() == {"unread_count": 0}
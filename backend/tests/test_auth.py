@@ -3,6 +3,11 @@ from fastapi import status
 from app.services.auth import get_password_hash, verify_password, create_access_token
 from app.models.user import User
 from datetime import timedelta
+import asyncio
+import threading
+from app.services.auth import verify_password_async, get_password_hash_async, authenticate_user_async
+from app.services.password_hasher import PasswordHasher, PasswordHasherBusy
+from tests.test_students import count_queries
 
 class TestAuthService:
     """Test authentication service functions"""
@@ -177,6 +182,165 @@ class TestUserPermissions:
         # User exists but is inactive, so login should fail
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
+def _headers(user):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+def _user_queries(statements):
+    return [sql for sql in statements if "FROM users" in sql]
+
+class TestPrincipalCache:
+    """Test the in-process cache of authenticated users"""
+
+    def test_repeat_requests_skip_user_query(self, client, db_session, test_admin_user):
+        """Only the first request with a token loads the user"""
+        with count_queries(db_session) as first:
+            response = client.get("/api/auth/users/me", headers=_headers(test_admin_user))
+        assert response.status_code == status.HTTP_200_OK
+        assert _user_queries(first)
+
+        with count_queries(db_session) as second:
+            response = client.get("/api/auth/users/me", headers=_headers(test_admin_user))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["email"] == test_admin_user.email
+        assert response.json()["school_id"] == test_admin_user.staff_profile.school_id
+        assert _user_queries(second) == []
+
+    def test_deactivation_invalidates_entry(self, client, test_admin_user, test_parent_user):
+        """A deactivated user is rejected on the next request"""
+        assert client.get("/api/auth/users/me", headers=_headers(test_parent_user)).status_code == 200
+
+        response = client.put(
+            f"/api/access/users/{test_parent_user.id}",
+            json={"is_active": False},
+            headers=_headers(test_admin_user)
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get("/api/auth/users/me", headers=_headers(test_parent_user))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_email_change_invalidates_old_subject(self, client, test_admin_user, test_parent_user):
+        """Tokens issued for the previous email stop working"""
+        old_headers = _headers(test_parent_user)
+        assert client.get("/api/auth/users/me", headers=old_headers).status_code == 200
+
+        response = client.put(
+            f"/api/access/users/{test_parent_user.id}",
+            json={"email": "renamed@test.com"},
+            headers=_headers(test_admin_user)
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+        assert client.get("/api/auth/users/me", headers=old_headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_delete_invalidates_entry(self, client, db_session, test_admin_user):
+        """A deleted user is rejected on the next request"""
+        user = User(
+            email="deleted@test.com",
+            hashed_password=get_password_hash("password123"),
+            first_name="Deleted",
+            last_name="User",
+            is_active=True,
+            is_admin=False
+        )
+        db_session.add(user)
+        db_session.commit()
+        headers = _headers(user)
+        assert client.get("/api/auth/users/me", headers=headers).status_code == 200
+
+        response = client.delete(f"/api/access/users/{user.id}", headers=_headers(test_admin_user))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+
+        assert client.get("/api/auth/users/me", headers=headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+class TestPasswordHasher:
+    """Test the bounded worker pool for bcrypt"""
+
+    def test_async_hash_and_verify(self):
+        """Hashing and verification run in the pool and match the sync helpers"""
+        async def run():
+            hashed = await get_password_hash_async("secret123")
+            return hashed, await verify_password_async("secret123", hashed), await verify_password_async("wrong", hashed)
+
+        hashed, valid, invalid = asyncio.run(run())
+        assert valid is True
+        assert invalid is False
+        assert verify_password("secret123", hashed)
+
+    def test_async_login_keeps_user_loaded(self, db_session, test_admin_user):
+        """The session is released during verification without expiring the user"""
+        user = asyncio.run(authenticate_user_async(db_session, test_admin_user.email, "testpass123"))
+        with count_queries(db_session) as statements:
+            assert (user.id, user.email, user.is_active) == (test_admin_user.id, test_admin_user.email, True)
+        assert statements == []
+        assert db_session.get(User, test_admin_user.id) is not None
+
+    def test_rejects_beyond_pending_limit(self):
+        """Submissions over max_pending fail fast and are counted"""
+        hasher = PasswordHasher(workers=1, max_pending=2)
+        release = threading.Event()
+        try:
+            running = hasher.submit(release.wait)
+            queued = hasher.submit(release.wait)
+            with pytest.raises(PasswordHasherBusy):
+                hasher.submit(release.wait)
+
+            stats = hasher.stats()
+            assert stats["running"] + stats["queued"] == 2
+            assert stats["rejected"] == 1
+
+            release.set()
+            assert running.result(timeout=5) and queued.result(timeout=5)
+            assert hasher.stats()["completed"] == 2
+            assert hasher.call(len, "abc") == 3
+        finally:
+            release.set()
+            hasher.shutdown()
+
+    def test_cancelled_queued_calls_release_their_slot(self):
+        """Requests abandoned while queued do not keep counting against max_pending"""
+        hasher = PasswordHasher(workers=1, max_pending=3)
+        release = threading.Event()
+
+        async def abandon_queued():
+            running = asyncio.ensure_future(hasher.run(release.wait))
+            queued = [asyncio.ensure_future(hasher.run(release.wait)) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            for task in queued:
+                task.cancel()
+            await asyncio.gather(*queued, return_exceptions=True)
+            release.set()
+            return await running
+
+        try:
+            assert asyncio.run(abandon_queued())
+            stats = hasher.stats()
+            assert stats["queued"] == 0 and stats["running"] == 0
+            assert stats["cancelled"] == 2 and stats["completed"] == 1
+            # All the slots are available again
+            assert [hasher.call(len, "ab") for _ in range(3)] == [2, 2, 2]
+        finally:
+            release.set()
+            hasher.shutdown()
+
+    def test_shutdown_releases_queued_slots(self):
+        """Jobs cancelled by shutdown release their slot too"""
+        hasher = PasswordHasher(workers=1, max_pending=3)
+        release = threading.Event()
+        running = hasher.submit(release.wait)
+        queued = hasher.submit(release.wait)
+        hasher.shutdown()
+        release.set()
+        assert running.result(timeout=5)
+        assert queued.cancelled()
+        assert hasher.stats()["queued"] == 0
+
+    def test_health_reports_queue_metrics(self, client):
+        """The health check exposes the hashing pool metrics"""
+        response = client.get("/health")
+        assert response.status_code == status.HTTP_200_OK
+        assert {"queued", "running", "rejected"} <= set(response.json()["password_hashing"])
+
 class TestPasswordSecurity:
     """Test password security requirements"""
     
@@ -0,0 +1,214 @@
+import os
+import subprocess
+import sys
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.middleware.rate_limiting import (
+    InMemoryRateLimiter,
+    RedisRateLimiter,
+    SharedMemoryRateLimiter,
+    RateLimitMiddleware,
+    fcntl
+)
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+class TestInMemoryRateLimiter:
+    """Test the sliding-window-counter limiter"""
+
+    def test_limit_within_window(self, clock):
+        """Requests over the limit are rejected until the window slides"""
+        limiter = InMemoryRateLimiter(clock=clock)
+        results = [limiter.is_allowed("api:1.2.3.4", 3, 60) for _ in range(4)]
+        assert [allowed for allowed, _ in results] == [True, True, True, False]
+        assert results[2][1]["remaining"] == 0
+        assert results[3][1]["retry_after"] >= 1
+
+        # Two windows later the previous counts no longer weigh in
+        clock.now += 120
+        allowed, info = limiter.is_allowed("api:1.2.3.4", 3, 60)
+        assert allowed
+        assert info["remaining"] == 2
+
+    def test_previous_window_is_weighted(self, clock):
+        """Half-way through a window, half of the previous window still counts"""
+        clock.now = 6000.0
+        limiter = InMemoryRateLimiter(clock=clock)
+        for _ in range(4):
+            assert limiter.is_allowed("k", 4, 60)[0]
+
+        clock.now = 6090.0  # Half-way through the next window
+        assert [limiter.is_allowed("k", 4, 60)[0] for _ in range(3)] == [True, True, False]
+
+    def test_repeated_abuse_blocks_key(self, clock):
+        """Hammering past twice the limit blocks the key for 15 minutes"""
+        limiter = InMemoryRateLimiter(clock=clock)
+        for _ in range(4):
+            limiter.is_allowed("k", 2, 60)
+        allowed, info = limiter.is_allowed("k", 2, 60)
+        assert not allowed and info["blocked"]
+
+        clock.now += 600
+        assert limiter.is_allowed("k", 2, 60)[1]["blocked"]
+        clock.now += 301
+        assert limiter.is_allowed("k", 2, 60)[0]
+
+    def test_idle_keys_are_evicted(self, clock):
+        """Per-key state is dropped once its window is over, but blocks survive"""
+        limiter = InMemoryRateLimiter(clock=clock)
+        for i in range(1000):
+            limiter.is_allowed(f"scan:{i}", 10, 60)
+        for _ in range(4):
+            limiter.is_allowed("blocked", 1, 60)
+        assert len(limiter) == 1001
+
+        clock.now += 121
+        limiter.is_allowed("new", 10, 60)
+        assert len(limiter) == 1
+        assert limiter.is_allowed("blocked", 1, 60)[1]["blocked"]
+
+    def test_max_keys_bounds_memory(self, clock):
+        """A flood of distinct keys never keeps more than max_keys entries"""
+        limiter = InMemoryRateLimiter(max_keys=100, clock=clock)
+        for i in range(10_000):
+            limiter.is_allowed(f"flood:{i}", 10, 60)
+        assert len(limiter) <= 100
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+@pytest.mark.skipif(fcntl is None, reason="requires fcntl")
+class TestSharedMemoryRateLimiter:
+    """Test the memory-mapped limiter shared by worker processes"""
+
+    @pytest.fixture
+    def path(self, tmp_path):
+        return str(tmp_path / "ratelimit")
+
+    def test_matches_in_memory_limiter(self, path, clock):
+        """Both limiters make the same decisions for the same traffic"""
+        shared_limiter = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        memory_limiter = InMemoryRateLimiter(clock=clock)
+        for step in [0, 1, 1, 5, 20, 30, 40, 61, 90, 200, 1000]:
+            clock.now += step
+            for key in ("a", "b"):
+                for _ in range(3):
+                    assert shared_limiter.is_allowed(key, 4, 60) == memory_limiter.is_allowed(key, 4, 60)
+        shared_limiter.close()
+
+    def test_state_is_shared_between_instances(self, path, clock):
+        """A second mapping of the same file sees the counters of the first"""
+        first = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        second = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        assert first.is_allowed("k", 2, 60)[0]
+        assert second.is_allowed("k", 2, 60)[0]
+        assert not first.is_allowed("k", 2, 60)[0]
+        first.close()
+        second.close()
+
+    def test_limit_holds_across_processes(self, path):
+        """Concurrent worker processes never let more than the limit through"""
+        script = (
+            "import sys\n"
+            "from app.middleware.rate_limiting import SharedMemoryRateLimiter\n"
+            "limiter = SharedMemoryRateLimiter(sys.argv[1], slots=64)\n"
+            "print(sum(limiter.is_allowed('k', 50, 3600)[0] for _ in range(30)))\n"
+        )
+        backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        SharedMemoryRateLimiter(path, slots=64).close()
+        workers = [
+            subprocess.Popen([sys.executable, "-c", script, path], cwd=backend, stdout=subprocess.PIPE, text=True)
+            for _ in range(4)
+        ]
+        allowed = [int(worker.communicate(timeout=60)[0]) for worker in workers]
+        assert sum(allowed) == 50
+
+    def test_file_size_is_fixed(self, path, clock):
+        """Many distinct keys reuse the oldest slots instead of growing the file"""
+        limiter = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        size = os.path.getsize(path)
+        for i in range(1000):
+            clock.now += 0.01
+            assert limiter.is_allowed(f"key-{i}", 5, 60)[0]
+        assert os.path.getsize(path) == size
+        # The most recent keys keep their counters
+        assert limiter.is_allowed("key-999", 5, 60)[1]["remaining"] == 3
+        limiter.close()
+
+    def test_new_layout_does_not_resize_mapped_file(self, path, clock):
+        """A worker with another slot count replaces the file instead of truncating it"""
+        old = SharedMemoryRateLimiter(path, slots=128, clock=clock)
+        assert old.is_allowed("k", 2, 60)[0]
+
+        new = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        assert os.path.getsize(path) == new.header.size + new.buckets * new.bucket_size
+        # The old mapping is still fully backed; touching it would SIGBUS if it had shrunk
+        assert old.map[-1:] == b"\x00"
+        assert old.is_allowed("k", 2, 60)[1]["remaining"] == 0
+        assert new.is_allowed("k", 2, 60)[1]["remaining"] == 1
+
+        same = SharedMemoryRateLimiter(path, slots=64, clock=clock)
+        assert same.is_allowed("k", 2, 60)[1]["remaining"] == 0
+        for limiter in (old, new, same):
+            limiter.close()
+
+class TestRedisRateLimiter:
+    """Test the single-script Redis limiter against an in-process Redis"""
+
+    def test_matches_in_memory_limiter(self, redis_client, clock):
+        """Both limiters make the same decisions for the same traffic"""
+        redis_limiter = RedisRateLimiter(client=redis_client, clock=clock)
+        memory_limiter = InMemoryRateLimiter(clock=clock)
+        for step in [0, 1, 1, 5, 20, 30, 40, 61, 90, 200]:
+            clock.now += step
+            for _ in range(3):
+                assert redis_limiter.is_allowed("k", 4, 60) == memory_limiter.is_allowed("k", 4, 60)
+
+    def test_one_round_trip_per_check(self, redis_client, clock, monkeypatch):
+        """After the script is cached on the server each check is a single command"""
+        limiter = RedisRateLimiter(client=redis_client, clock=clock)
+        limiter.is_allowed("k", 10, 60)
+
+        commands = []
+        execute_command = redis_client.execute_command
+        monkeypatch.setattr(redis_client, "execute_command",
+                            lambda *args, **kwargs: commands.append(args[0]) or execute_command(*args, **kwargs))
+        allowed, info = limiter.is_allowed("k", 10, 60)
+        assert allowed and info["remaining"] == 8
+        assert commands == ["EVALSHA"]
+
+    def test_concurrent_requests_do_not_collide(self, redis_client):
+        """Simultaneous requests with the same timestamp are all counted"""
+        limiter = RedisRateLimiter(client=redis_client, clock=lambda: 1_000_000.0)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: limiter.is_allowed("k", 20, 60)[0], range(40)))
+        assert results.count(True) == 20
+
+    def test_block_and_expiry(self, redis_client, clock):
+        """Abuse blocks the key and the state expires once it no longer matters"""
+        limiter = RedisRateLimiter(client=redis_client, clock=clock)
+        for _ in range(4):
+            limiter.is_allowed("k", 2, 60)
+        allowed, info = limiter.is_allowed("k", 2, 60)
+        assert not allowed and info["blocked"]
+        assert 0 < redis_client.pttl("ratelimit:k") <= 900_000
+
+        limiter.is_allowed("idle", 2, 60)
+        assert redis_client.pttl("ratelimit:idle") <= 120_000
+
+    def test_unavailable_redis_falls_back_to_memory(self):
+        """Without a reachable Redis the middleware limits in memory"""
+        middleware = RateLimitMiddleware("redis://127.0.0.1:1")
+        assert isinstance(middleware.limiter, InMemoryRateLimiter)
@@ -0,0 +1,214 @@
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from fastapi import status
+from app.models.user import User, Guardian
+from app.models.school import Student
+from app.services.auth import create_access_token
+from app.services.student_read_model import fetch_student_rows
+from app.services.search_index import search_student_ids
+from app.services.student_typeahead import StudentTypeahead, student_typeahead
+from app.services.principal_cache import principal_cache
+from tests.conftest import TestingSessionLocal
+
+@pytest.fixture
+def staff_headers(test_admin_user):
+    """Authorization headers built from a token, without going through the login rate limit"""
+    token = create_access_token(data={"sub": test_admin_user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+def _create_students(db_session, test_student, count, guardians_per_student=2, start=0):
+    """Create students in the test classroom, each with its own guardians"""
+    for i in range(start, start + count):
+        student = Student(
+            first_name=f"Alumno{i}",
+            last_name="Lista",
+            enrollment_id=f"LIST{test_student.id}-{i:03d}",
+            gender="M",
+            school_id=test_student.school_id,
+            classroom_id=test_student.classroom_id
+        )
+        db_session.add(student)
+        for j in range(guardians_per_student):
+            user = User(
+                email=f"tutor{i}-{j}@lista.com",
+                hashed_password="x",
+                first_name=f"Tutor{j}",
+                last_name=f"Lista{i}"
+            )
+            guardian = Guardian(user=user, relationship_type="madre", phone="555", address="")
+            guardian.students.append(student)
+            db_session.add(guardian)
+    db_session.commit()
+
+@pytest.fixture
+def typeahead(db_session):
+    """Typeahead index warmed from the test database, emptied afterwards"""
+    student_typeahead.warm(db_session)
+    yield student_typeahead
+    student_typeahead.clear()
+
+@contextmanager
+def count_queries(db_session):
+    """Count the SQL statements executed on the test connection"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db_session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+class TestStudentReadModel:
+    """Test the projection queries behind the student list endpoints"""
+
+    def test_rows_include_grade_and_guardians(self, db_session, test_student):
+        """Rows carry the classroom grade and guardian names"""
+        _create_students(db_session, test_student, 2)
+
+        rows = fetch_student_rows(db_session)
+
+        assert [row.id for row in rows][0] == test_student.id
+        assert rows[0].grade_level == "Primaria 1"
+        assert rows[0].guardians == []
+        assert [(g.first_name, g.last_name) for g in rows[1].guardians] == [
+            ("Tutor0", "Lista0"), ("Tutor1", "Lista0")
+        ]
+
+    def test_query_count_does_not_grow_with_students(self, db_session, test_student):
+        """Listing 3 or 30 students costs the same number of queries"""
+        _create_students(db_session, test_student, 3)
+        # Measure both requests with a cold principal cache
+        principal_cache.invalidate()
+        with count_queries(db_session) as small:
+            assert len(fetch_student_rows(db_session)) == 4
+
+        _create_students(db_session, test_student, 27, guardians_per_student=3, start=3)
+        with count_queries(db_session) as large:
+            assert len(fetch_student_rows(db_session)) == 31
+
+        assert len(small) == 2
+        assert len(large) == len(small)
+
+    def test_search_endpoint_query_count(self, client, db_session, staff_headers, test_student):
+        """The search endpoint does not lazy-load per student"""
+        _create_students(db_session, test_student, 3)
+        with count_queries(db_session) as small:
+            response = client.get("/api/students/search?query=Lista", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 3
+
+        _create_students(db_session, test_student, 20, start=3)
+        principal_cache.invalidate()
+        with count_queries(db_session) as large:
+            response = client.get("/api/students/search?query=Lista", headers=staff_headers)
+        assert len(response.json()) == 23
+        assert response.json()[0]["guardians"][0]["first_name"] == "Tutor0"
+
+        assert len(large) == len(small)
+
+class TestStudentSearchIndex:
+    """Test the accent-insensitive trigram search index"""
+
+    def test_search_ignores_accents_and_case(self, db_session, test_student):
+        """'gonzalez' finds 'González' and the best match comes first"""
+        gonzalez = Student(first_name="María", last_name="González", enrollment_id="IDX-001",
+                           gender="F", school_id=test_student.school_id)
+        gonzaga = Student(first_name="Luis", last_name="Gonzaga", enrollment_id="IDX-002",
+                          gender="M", school_id=test_student.school_id)
+        db_session.add_all([gonzalez, gonzaga])
+        db_session.commit()
+
+        assert search_student_ids(db_session, "gonzalez") == [gonzalez.id]
+        assert search_student_ids(db_session, "MARIA GONZ")[0] == gonzalez.id
+        assert set(search_student_ids(db_session, "gonz")) == {gonzalez.id, gonzaga.id}
+        assert search_student_ids(db_session, "idx-002")[0] == gonzaga.id
+
+    def test_index_follows_writes(self, db_session, test_student):
+        """Renames and guardian links are reindexed in the same transaction"""
+        _create_students(db_session, test_student, 1)
+        student = db_session.query(Student).filter(Student.first_name == "Alumno0").one()
+        assert student.id in search_student_ids(db_session, "tutor1 lista0")
+
+        student.first_name = "Íñigo"
+        db_session.commit()
+        assert search_student_ids(db_session, "inigo") == [student.id]
+        assert search_student_ids(db_session, "alumno0") == []
+
+        guardian_user = student.guardians[0].user
+        guardian_user.last_name = "Ochoa"
+        db_session.commit()
+        assert search_student_ids(db_session, "ochoa") == [student.id]
+
+        db_session.delete(student)
+        db_session.commit()
+        assert search_student_ids(db_session, "inigo") == []
+
+class TestStudentTypeahead:
+    """Test the in-memory typeahead index"""
+
+    def test_prefix_matches_ranked_by_name(self, db_session, test_student, typeahead):
+        """Every typed word must prefix a name or enrollment word"""
+        _create_students(db_session, test_student, 12)
+        school_id = test_student.school_id
+
+        names = [item["first_name"] for item in typeahead.search(school_id, "alumno1")]
+        assert names == ["Alumno1", "Alumno10", "Alumno11"]
+        assert len(typeahead.search(school_id, "lis", limit=5)) == 5
+        assert [item["id"] for item in typeahead.search(school_id, "stud tes")] == [test_student.id]
+        assert typeahead.search(school_id, "test001")[0]["grade_level"] == {"name": "Primaria 1"}
+        assert typeahead.search(school_id + 1, "alumno1") == []
+
+    def test_index_follows_commits(self, db_session, test_student, typeahead):
+        """Committed changes are applied; rolled back ones are not"""
+        school_id = test_student.school_id
+        test_student.first_name = "Ángela"
+        db_session.commit()
+        assert typeahead.search(school_id, "angela")[0]["first_name"] == "Ángela"
+
+        db_session.delete(test_student)
+        db_session.commit()
+        assert typeahead.search(school_id, "angela") == []
+
+        db_session.add(Student(first_name="Pendiente", last_name="Lista", enrollment_id="P-1",
+                               gender="F", school_id=school_id))
+        db_session.flush()
+        db_session.rollback()
+        assert typeahead.search(school_id, "pendiente") == []
+
+    def test_writes_from_other_workers_become_visible(self, db_session, test_student, typeahead):
+        """A worker that did not see the commit applies it from the change log before serving"""
+        school_id = test_student.school_id
+        other_worker = StudentTypeahead()
+        other_worker.warm(db_session)
+        assert other_worker.search(school_id, "tes")[0]["id"] == test_student.id
+
+        writer = TestingSessionLocal(bind=db_session.connection())
+        writer.get(Student, test_student.id).first_name = "Ángela"
+        writer.add(Student(first_name="Nueva", last_name="Alumna", enrollment_id="N-1",
+                           gender="F", school_id=school_id))
+        writer.commit()
+        assert other_worker.search(school_id, "angela") == []
+
+        assert other_worker.sync(db_session) == 2
+        assert other_worker.search(school_id, "angela")[0]["id"] == test_student.id
+        assert other_worker.search(school_id, "nueva")[0]["first_name"] == "Nueva"
+        assert other_worker.sync(db_session) == 0
+
+        writer.delete(writer.get(Student, test_student.id))
+        writer.commit()
+        other_worker.sync(db_session)
+        assert other_worker.search(school_id, "angela") == []
+        writer.close()
+
+    def test_endpoint_uses_staff_school(self, client, db_session, staff_headers, test_student, typeahead):
+        """Staff get suggestions from their own school without further queries"""
+        with count_queries(db_session) as statements:
+            response = client.get("/api/students/typeahead?q=tes", headers=staff_headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert [item["id"] for item in response.json()] == [test_student.id]
+        assert not any("students" in statement for statement in statements)
@@ -0,0 +1,418 @@
+import pytest
+import asyncio
+import time
+import fakeredis
+from app.models.user import User, Staff
+from app.models.school import Classroom, GradeLevel
+from app.services.auth import create_access_token
+from app.services.connection_manager import ConnectionManager, authenticate_websocket, authorize_topics, manager
+from app.services.websocket_backplane import InProcessBackplane, RedisBackplane
+from tests.conftest import TestingSessionLocal
+from app.schemas.notification import NotificationCreate
+from app.services.notification_service import NotificationService
+from fastapi import WebSocketDisconnect
+import app.main as main
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+        self.closed = None
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed = code
+
+async def settle():
+    """Let the writer tasks drain their queues"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+@pytest.fixture
+def staff_user(db_session, test_school):
+    """Non-admin staff member of the test school"""
+    user = User(email="teacher@test.com", hashed_password="x", first_name="T", last_name="S",
+                is_active=True, is_admin=False)
+    db_session.add(user)
+    db_session.commit()
+    db_session.add(Staff(user_id=user.id, position="Teacher", school_id=test_school.id))
+    db_session.commit()
+    return user
+
+class TestConnectionManager:
+    """Test topic routing and queued delivery of WebSocket messages"""
+
+    def test_publish_reaches_only_subscribers(self):
+        """Events go to the sockets of their topic and nowhere else"""
+        async def scenario():
+            routing = ConnectionManager()
+            sockets = [FakeSocket() for _ in range(100)]
+            for socket in sockets:
+                await routing.connect(socket)
+            routing.subscribe(sockets[0], ["user:1", "school:1"])
+            routing.subscribe(sockets[1], ["school:1"])
+
+            assert routing.deliver("user:1", "a") == 1
+            assert routing.deliver("school:1", "b") == 2
+            assert routing.deliver("user:2", "c") == 0
+            await settle()
+            assert sockets[0].sent == ["a", "b"]
+            assert sockets[1].sent == ["b"]
+            assert all(not socket.sent for socket in sockets[2:])
+        asyncio.run(scenario())
+
+    def test_disconnect_drops_subscriptions(self):
+        """Closed sockets leave no empty topics behind"""
+        async def scenario():
+            routing = ConnectionManager()
+            socket, failing = FakeSocket(), FakeSocket(fail=True)
+            await routing.connect(socket)
+            await routing.connect(failing)
+            routing.subscribe(socket, ["school:1"])
+            routing.subscribe(failing, ["school:1", "user:3"])
+
+            assert routing.deliver("school:1", "a") == 2
+            await settle()
+            assert failing not in routing.active_connections
+            assert routing.topics == {"school:1": {socket}}
+
+            routing.unsubscribe(socket, ["school:1"])
+            assert routing.topics == {} and routing.subscriptions == {}
+        asyncio.run(scenario())
+
+    def test_slow_client_does_not_delay_others(self):
+        """A stalled socket fills its own queue and is disconnected"""
+        async def scenario():
+            routing = ConnectionManager(queue_size=3, slow_client_policy="disconnect")
+            fast, slow = FakeSocket(), FakeSocket()
+            slow.release.clear()
+            for socket in (fast, slow):
+                await routing.connect(socket)
+                routing.subscribe(socket, ["school:1"])
+
+            for i in range(5):
+                routing.publish("school:1", str(i))
+                await settle()
+            assert fast.sent == ["0", "1", "2", "3", "4"]
+            assert slow not in routing.active_connections
+            assert slow.closed == 1013
+            assert routing.slow_disconnects == 1
+        asyncio.run(scenario())
+
+    def test_drop_oldest_policy_keeps_latest_messages(self):
+        """With drop_oldest a slow client keeps its connection and the newest messages"""
+        async def scenario():
+            routing = ConnectionManager(queue_size=2, slow_client_policy="drop_oldest")
+            slow = FakeSocket()
+            slow.release.clear()
+            await routing.connect(slow)
+            routing.subscribe(slow, ["user:1"])
+
+            for i in range(6):
+                routing.publish("user:1", str(i))
+            await settle()
+            slow.release.set()
+            await settle()
+            assert slow.sent == ["4", "5"]
+            assert routing.dropped_messages == 4
+            assert slow in routing.active_connections
+        asyncio.run(scenario())
+
+    def test_user_topic_reaches_every_socket_of_the_user(self):
+        """A user with several devices gets their messages on all of them"""
+        async def scenario():
+            routing = ConnectionManager()
+            phone, tablet, other = FakeSocket(), FakeSocket(), FakeSocket()
+            await routing.connect(phone, user_id=1)
+            await routing.connect(tablet, user_id=1)
+            await routing.connect(other, user_id=2)
+
+            routing.send_to_user(1, "a")
+            await settle()
+            assert phone.sent == ["a"] and tablet.sent == ["a"] and other.sent == []
+
+            routing.disconnect(phone)
+            assert routing.user_connections == {1: {tablet}, 2: {other}}
+            routing.disconnect(tablet)
+            assert 1 not in routing.user_connections
+        asyncio.run(scenario())
+
+    def test_revoked_user_sockets_close_in_every_worker(self):
+        """A revocation published in one worker closes the user's sockets in all of them"""
+        async def scenario():
+            backplane = InProcessBackplane()
+            workers = [ConnectionManager(backplane=backplane) for _ in range(2)]
+            sockets = [FakeSocket() for _ in range(3)]
+            for worker in workers:
+                await worker.start()
+            await workers[0].connect(sockets[0], user_id=1)
+            await workers[1].connect(sockets[1], user_id=1)
+            await workers[1].connect(sockets[2], user_id=2)
+
+            workers[0].revoke_users({1})
+            await settle()
+            assert sockets[0].closed == sockets[1].closed == 1008
+            assert sockets[2].closed is None
+            assert 1 not in workers[0].user_connections and 1 not in workers[1].user_connections
+            assert set(workers[1].active_connections) == {sockets[2]}
+            for worker in workers:
+                await worker.stop()
+        asyncio.run(scenario())
+
+    def test_publish_from_another_thread(self):
+        """Sync code in the threadpool hands messages to the loop that owns the sockets"""
+        async def scenario():
+            routing = ConnectionManager()
+            socket = FakeSocket()
+            await routing.connect(socket)
+            routing.subscribe(socket, ["user:1"])
+            await asyncio.to_thread(routing.publish_threadsafe, "user:1", "a")
+            await settle()
+            assert socket.sent == ["a"]
+        asyncio.run(scenario())
+
+class TestHeartbeat:
+    """Test server-driven pings and reaping of silent connections"""
+
+    def test_silent_socket_is_pinged_then_reaped(self):
+        async def scenario():
+            clock = [0.0]
+            routing = ConnectionManager(heartbeat_interval=25, heartbeat_timeout=10, clock=lambda: clock[0])
+            alive, dead = FakeSocket(), FakeSocket()
+            for socket in (alive, dead):
+                await routing.connect(socket, user_id=1)
+                routing.subscribe(socket, ["school:1"])
+
+            clock[0] = 20
+            routing.touch(alive)
+            clock[0] = 30
+            routing.check_heartbeats()
+            await settle()
+            assert dead.sent == ['{"type": "ping"}'] and alive.sent == []
+
+            clock[0] = 45
+            routing.touch(alive)  # Any message counts as an answer
+            assert routing.check_heartbeats() == 1
+            await settle()
+            assert dead.closed == 1001
+            assert set(routing.active_connections) == {alive}
+            assert routing.user_connections == {1: {alive}}
+            assert routing.topics == {"school:1": {alive}}
+            assert routing.stats()["reaped"] == 1
+            assert routing.stats()["pings_sent"] == 1
+        asyncio.run(scenario())
+
+    def test_answered_ping_keeps_connection(self):
+        async def scenario():
+            clock = [0.0]
+            routing = ConnectionManager(heartbeat_interval=25, heartbeat_timeout=10, clock=lambda: clock[0])
+            socket = FakeSocket()
+            await routing.connect(socket)
+            for now in range(0, 200, 5):
+                clock[0] = now
+                routing.check_heartbeats()
+                await settle()
+                if socket.sent and socket.sent[-1] == '{"type": "ping"}':
+                    socket.sent.clear()
+                    routing.touch(socket)
+            assert socket in routing.active_connections
+            assert routing.reaped == 0 and routing.pings_sent > 0
+        asyncio.run(scenario())
+
+    def test_stats_report_queue_depth(self):
+        async def scenario():
+            routing = ConnectionManager(queue_size=10)
+            slow = FakeSocket()
+            slow.release.clear()
+            await routing.connect(slow)
+            routing.subscribe(slow, ["user:1"])
+            for i in range(4):
+                routing.publish("user:1", str(i))
+            await settle()
+            stats = routing.stats()
+            # The writer holds the first message while the socket is stalled
+            assert stats["connections"] == 1
+            assert stats["queued_messages"] == 3 and stats["max_queue_depth"] == 3
+        asyncio.run(scenario())
+
+    def test_expired_token_closes_socket(self):
+        async def scenario():
+            routing = ConnectionManager(heartbeat_interval=25, heartbeat_timeout=10)
+            expired, valid = FakeSocket(), FakeSocket()
+            await routing.connect(expired, user_id=1, expires_at=time.time() - 1)
+            await routing.connect(valid, user_id=1, expires_at=time.time() + 3600)
+            routing.check_heartbeats()
+            await settle()
+            assert expired.closed == 1008
+            assert set(routing.active_connections) == {valid}
+            assert routing.stats()["expired"] == 1
+        asyncio.run(scenario())
+
+    def test_health_reports_websocket_stats(self, client):
+        stats = client.get("/health").json()["websockets"]
+        assert {"connections", "queued_messages", "reaped"} <= set(stats)
+
+class TestBackplane:
+    """Test fan-out across workers, each with its own ConnectionManager"""
+
+    async def _workers(self, backplanes):
+        workers = []
+        for backplane in backplanes:
+            worker = ConnectionManager(backplane=backplane)
+            await worker.start()
+            socket = FakeSocket()
+            await worker.connect(socket)
+            worker.subscribe(socket, ["school:1"])
+            workers.append((worker, socket))
+        return workers
+
+    def test_in_process_backplane_reaches_every_worker(self):
+        async def scenario():
+            shared = InProcessBackplane()
+            (first, first_socket), (second, second_socket) = await self._workers([shared, shared])
+
+            first.publish("school:1", "a")
+            second.broadcast("b")
+            first.publish("school:2", "c")
+            await settle()
+            assert first_socket.sent == ["a", "b"]
+            assert second_socket.sent == ["a", "b"]
+        asyncio.run(scenario())
+
+    def test_redis_backplane_reaches_every_worker_in_order(self):
+        async def scenario():
+            server = fakeredis.FakeServer()
+            backplanes = [
+                RedisBackplane(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+                for _ in range(2)
+            ]
+            (first, first_socket), (second, second_socket) = await self._workers(backplanes)
+
+            for i in range(20):
+                first.publish("school:1", str(i))
+            for _ in range(100):
+                if len(second_socket.sent) == 20 and len(first_socket.sent) == 20:
+                    break
+                await asyncio.sleep(0.01)
+            assert second_socket.sent == [str(i) for i in range(20)]
+            assert first_socket.sent == second_socket.sent
+            for worker, _ in ((first, None), (second, None)):
+                await worker.stop()
+        asyncio.run(scenario())
+
+    def test_unreachable_backplane_delivers_locally(self):
+        async def scenario():
+            [(worker, socket)] = await self._workers([RedisBackplane("redis://127.0.0.1:1")])
+            assert worker.backplane is None
+            worker.publish("school:1", "a")
+            await settle()
+            assert socket.sent == ["a"]
+        asyncio.run(scenario())
+
+class TestTopicAuthorization:
+    """Test which topics each user may subscribe to"""
+
+    def test_guardian_only_follows_own_topic(self, db_session, test_parent_user, test_school):
+        granted, denied = authorize_topics(
+            test_parent_user, [f"user:{test_parent_user.id}", "user:999", f"school:{test_school.id}", "bogus"],
+            db_session
+        )
+        assert granted == [f"user:{test_parent_user.id}"]
+        assert set(denied) == {"user:999", f"school:{test_school.id}", "bogus"}
+
+    def test_staff_follows_own_school_and_classrooms(self, db_session, staff_user, test_school, test_student):
+        other = Classroom(name="Other", grade_level=GradeLevel.PRIMARIA_1, school_id=test_school.id + 1)
+        db_session.add(other)
+        db_session.commit()
+        granted, denied = authorize_topics(
+            staff_user,
+            [f"school:{test_school.id}", f"classroom:{test_student.classroom_id}",
+             f"school:{test_school.id + 1}", f"classroom:{other.id}"],
+            db_session
+        )
+        assert granted == [f"school:{test_school.id}", f"classroom:{test_student.classroom_id}"]
+        assert denied == [f"school:{test_school.id + 1}", f"classroom:{other.id}"]
+
+    def test_anonymous_follows_nothing(self, db_session):
+        assert authorize_topics(None, ["user:1", "school:1"], db_session) == ([], ["user:1", "school:1"])
+
+    def test_token_is_resolved_to_principal(self, db_session, staff_user, test_school):
+        token = create_access_token(data={"sub": staff_user.email})
+        principal = authenticate_websocket(token, db_session)
+        assert (principal.user_id, principal.email) == (staff_user.id, staff_user.email)
+        assert principal.topics == [f"school:{test_school.id}"]
+        assert principal.expires_at > time.time()
+        assert authenticate_websocket("not-a-token", db_session) is None
+
+class TestWebSocketEndpoint:
+    """Test the authenticated /ws endpoint"""
+
+    @pytest.fixture(autouse=True)
+    def handler_sessions(self, db_session, monkeypatch):
+        # The handler opens its own sessions: bind them to the test transaction
+        monkeypatch.setattr(main, "SessionLocal", lambda: TestingSessionLocal(bind=db_session.connection()))
+
+    def test_anonymous_connection_is_rejected(self, client):
+        for url in ("/ws", "/ws?token=not-a-token"):
+            with pytest.raises(WebSocketDisconnect) as rejected:
+                with client.websocket_connect(url):
+                    pass
+            assert rejected.value.code == 1008
+
+    def test_notifications_reach_only_the_owner(self, client, db_session, test_parent_user, test_admin_user):
+        token = create_access_token(data={"sub": test_parent_user.email})
+
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            assert manager.user_connections[test_parent_user.id] == set(manager.active_connections)
+            for user in (test_admin_user, test_parent_user):
+                NotificationService(db_session).create_notification(NotificationCreate(
+                    title="Aviso", message=f"Para {user.email}", type="info", user_id=user.id
+                ))
+            reply = websocket.receive_json()
+            assert reply["type"] == "notification"
+            assert reply["data"]["user_id"] == test_parent_user.id
+        assert test_parent_user.id not in manager.user_connections
+
+    def test_subscribe_and_unsubscribe(self, client, staff_user, test_school):
+        token = create_access_token(data={"sub": staff_user.email})
+        school = f"school:{test_school.id}"
+
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            # Staff follow their school from the start
+            assert len(manager.topics[school]) == 1
+
+            websocket.send_json({"type": "unsubscribe", "topics": [school]})
+            assert websocket.receive_json()["topics"] == []
+            assert school not in manager.topics
+
+            websocket.send_json({"type": "subscribe", "topics": [school, "school:999"]})
+            reply = websocket.receive_json()
+            assert reply["type"] == "subscribed"
+            assert reply["topics"] == [school]
+            assert reply["denied"] == ["school:999"]
+
+            websocket.send_json({"type": "unsubscribe"})
+            websocket.receive_json()
+            websocket.send_json({"type": "subscribe"})
+            assert websocket.receive_json()["topics"] == [school]
+
+    def test_deactivated_user_is_disconnected(self, client, db_session, test_parent_user):
+        token = create_access_token(data={"sub": test_parent_user.email})
+
+        with client.websocket_connect(f"/ws?token={token}") as websocket:
+            test_parent_user.is_active = False
+            db_session.commit()
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+            assert closed.value.code == 1008
+        assert test_parent_user.id not in manager.user_connections